@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+表格文件入库分块的内存 / 耗时对比
+
+- joined：拼接整篇 markdown 后一次性分块（split_text_into_chunks 返回完整列表）；
+- streaming：行块迭代器直接交给 iter_text_chunks，按写入窗口消费（与 Chroma / Milvus 入库的写入阶段一致）。
+
+用法：
+    python scripts/benchmark_chunking.py                      # 生成 200000 行的 CSV 测试
+    python scripts/benchmark_chunking.py --rows 50000
+    python scripts/benchmark_chunking.py --file data.xlsx     # 使用已有的表格文件
+"""
+
+# ruff: noqa: E402
+
+import argparse
+import asyncio
+import csv
+import hashlib
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+# 添加项目根目录到Python路径
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+from src.knowledge.utils.kb_utils import aiter_windows, iter_text_chunks, split_text_into_chunks
+from src.knowledge.utils.table_markdown import iter_table_markdown_blocks, table_file_to_markdown
+
+WRITE_WINDOW = 512
+
+
+def make_csv(path: Path, rows: int) -> None:
+    with path.open("w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "name", "category", "amount", "description"])
+        for i in range(rows):
+            writer.writerow([i, f"item-{i}", f"category-{i % 37}", i * 0.25, "描述文本 " * (i % 20)])
+
+
+def run_joined(file_path: Path, params: dict) -> tuple[int, str]:
+    digest = hashlib.sha256()
+    chunks = split_text_into_chunks(table_file_to_markdown(file_path), "bench", file_path.name, params)
+    for chunk in chunks:
+        digest.update(chunk["content"].encode())
+    return len(chunks), digest.hexdigest()
+
+
+def run_streaming(file_path: Path, params: dict) -> tuple[int, str]:
+    async def consume():
+        count = 0
+        digest = hashlib.sha256()
+        chunks = iter_text_chunks(iter_table_markdown_blocks(file_path), "bench", file_path.name, params)
+        async for window in aiter_windows(chunks, WRITE_WINDOW):
+            for chunk in window:
+                digest.update(chunk["content"].encode())
+            count += len(window)
+        return count, digest.hexdigest()
+
+    return asyncio.run(consume())
+
+
+def measure(name: str, func, file_path: Path, params: dict) -> str:
+    tracemalloc.start()
+    start = time.perf_counter()
+    count, digest = func(file_path, params)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<10} chunks={count:<8} time={elapsed:8.2f}s  peak_mem={peak / 1024 / 1024:8.1f} MiB")
+    return digest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", type=Path, help="CSV / Excel 文件，不指定时生成测试 CSV")
+    parser.add_argument("--rows", type=int, default=200000, help="生成的测试 CSV 行数")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    args = parser.parse_args()
+
+    params = {"chunk_size": args.chunk_size, "chunk_overlap": args.chunk_overlap}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = args.file
+        if file_path is None:
+            file_path = Path(tmp_dir) / "benchmark.csv"
+            make_csv(file_path, args.rows)
+        print(f"File: {file_path} ({file_path.stat().st_size / 1024 / 1024:.1f} MiB)")
+
+        joined = measure("joined", run_joined, file_path, params)
+        streaming = measure("streaming", run_streaming, file_path, params)
+        print(f"Identical chunks: {joined == streaming}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,9 +9,12 @@ from fastapi.responses import JSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 
 from server.routers import router
+from server.services.chat_persistence import chat_persistence
 from server.services.tasker import tasker
 from server.utils.auth_middleware import is_public_path
 from server.utils.common_utils import setup_logging
+from src.knowledge import knowledge_base
+from src.models.rerank import aclose_rerankers
 
 # 设置日志配置
 setup_logging()
@@ -125,10 +128,26 @@ async def start_tasker() -> None:
     await tasker.start()
 
 
+@app.on_event("startup")
+async def start_chat_persistence() -> None:
+    await chat_persistence.start()
+
+
 @app.on_event("shutdown")
 async def stop_tasker() -> None:
     await tasker.shutdown()
 
 
+@app.on_event("shutdown")
+async def stop_chat_persistence() -> None:
+    await chat_persistence.shutdown()
+
+
+@app.on_event("shutdown")
+async def close_model_clients() -> None:
+    await knowledge_base.aclose()
+    await aclose_rerankers()
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=5050, threads=10, workers=10, reload=True)
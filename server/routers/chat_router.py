@@ -1,4 +1,5 @@
 import asyncio
+import functools
 import json
 import traceback
 import uuid
@@ -13,9 +14,10 @@ from sqlalchemy.orm import Session
 
 from src.storage.db.models import User, MessageFeedback, Message, Conversation
 from src.storage.conversation import ConversationManager
-from src.storage.db.manager import db_manager
 from server.routers.auth_router import get_admin_user
+from server.services.chat_persistence import PersistJob, chat_persistence
 from server.utils.auth_middleware import get_db, get_required_user
+from server.utils.stream_format import DEFAULT_STREAM_FORMAT, StreamWriter, iter_with_idle_ticks
 from src import executor
 from src import config as conf
 from src.agents import agent_manager
@@ -119,10 +121,15 @@ async def chat_agent(
     query: str = Body(...),
     config: dict = Body({}),
     meta: dict = Body({}),
+    stream_format: str = Body(DEFAULT_STREAM_FORMAT),
     current_user: User = Depends(get_required_user),
-    db: Session = Depends(get_db),
 ):
-    """使用特定智能体进行对话（需要登录）"""
+    """
+    使用特定智能体进行对话（需要登录）
+
+    stream_format 为 json（默认，兼容旧版）、compact（消息头只发送一次，token 合并为增量）或 sse，
+    详见 server/utils/stream_format.py
+    """
     start_time = asyncio.get_event_loop().time()
 
     logger.info(f"agent_id: {agent_id}, query: {query}, config: {config}, meta: {meta}")
@@ -137,136 +144,112 @@ async def chat_agent(
         }
     )
 
-    # 将meta和thread_id整合到config中
-    def make_chunk(content=None, **kwargs):
-        return (
-            json.dumps(
-                {"request_id": meta.get("request_id"), "response": content, **kwargs}, ensure_ascii=False
-            ).encode("utf-8")
-            + b"\n"
-        )
+    try:
+        writer = StreamWriter(stream_format, request_id=meta.get("request_id"))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    make_chunk = writer.event
 
-    async def save_messages_from_langgraph_state(
-        agent_instance,
-        thread_id,
-        conv_mgr,
-        config_dict,
-    ):
+    async def load_messages_from_langgraph_state(agent_instance, config_dict) -> tuple[list[dict], list[dict]]:
         """
-        从 LangGraph state 中读取完整消息并保存到数据库
-        这样可以获得完整的 tool_calls 参数
+        从 LangGraph state 中读取完整消息，转换为待保存的消息与工具调用结果
+        这样可以获得完整的 tool_calls 参数；由后台持久化队列在写入时调用，失败时抛出异常以便重试
         """
-        try:
-            graph = await agent_instance.get_graph()
-            state = await graph.aget_state(config_dict)
-
-            if not state or not state.values:
-                logger.warning("No state found in LangGraph")
-                return
-
-            messages = state.values.get("messages", [])
-            logger.debug(f"Retrieved {len(messages)} messages from LangGraph state")
+        graph = await agent_instance.get_graph()
+        state = await graph.aget_state(config_dict)
 
-            # 获取已保存的消息数量，避免重复保存
-            existing_messages = conv_mgr.get_messages_by_thread_id(thread_id)
-            existing_ids = {
-                msg.extra_metadata["id"]
-                for msg in existing_messages
-                if msg.extra_metadata and "id" in msg.extra_metadata
-            }
+        if not state or not state.values:
+            logger.warning("No state found in LangGraph")
+            return [], []
 
-            for msg in messages:
-                msg_dict = msg.model_dump() if hasattr(msg, "model_dump") else {}
-                msg_type = msg_dict.get("type", "unknown")
+        messages = state.values.get("messages", [])
+        logger.debug(f"Retrieved {len(messages)} messages from LangGraph state")
 
-                if msg_type == "human" or msg.id in existing_ids:
-                    continue
+        # 转换为 ConversationManager.save_messages_bulk 的格式，已保存的消息由其按 LangGraph 消息 ID 去重
+        new_messages = []
+        tool_outputs = []
+        for msg in messages:
+            msg_dict = msg.model_dump() if hasattr(msg, "model_dump") else {}
+            msg_type = msg_dict.get("type", "unknown")
 
-                elif msg_type == "ai":
-                    # AI 消息
-                    content = msg_dict.get("content", "")
-                    tool_calls_data = msg_dict.get("tool_calls", [])
-
-                    # Skip empty AI messages without tool_calls
-                    if not content and not tool_calls_data:
-                        logger.warning(f"Skipping empty AI message without content or tool_calls: {msg.id}")
-                        continue
-
-                    # 格式清洗
-                    if finish_reason := msg_dict.get("response_metadata", {}).get("finish_reason"):
-                        if "tool_call" in finish_reason and len(finish_reason) > len("tool_call"):
-                            model_name = msg_dict.get("response_metadata", {}).get("model_name", "")
-                            repeat_count = len(finish_reason) // len("tool_call")
-                            msg_dict["response_metadata"]["finish_reason"] = "tool_call"
-                            msg_dict["response_metadata"]["model_name"] = model_name[: len(model_name) // repeat_count]
-
-                    # 保存 AI 消息
-                    ai_msg = conv_mgr.add_message_by_thread_id(
-                        thread_id=thread_id,
-                        role="assistant",
-                        content=content,
-                        message_type="text",
-                        extra_metadata=msg_dict,  # 保存原始 model_dump
-                    )
+            if msg_type == "human":
+                continue
 
-                    # 保存 tool_calls（如果有）- 使用 LangGraph 的 tool_call_id
-                    if tool_calls_data:
-                        logger.debug(f"Saving {len(tool_calls_data)} tool calls from AI message")
-                        for tc in tool_calls_data:
-                            conv_mgr.add_tool_call(
-                                message_id=ai_msg.id,
-                                tool_name=tc.get("name", "unknown"),
-                                tool_input=tc.get("args", {}),  # 完整的参数
-                                status="pending",  # 工具还未执行
-                                langgraph_tool_call_id=tc.get("id"),  # 保存 LangGraph tool_call_id
-                            )
-
-                    logger.debug(f"Saved AI message {ai_msg.id} with {len(tool_calls_data)} tool calls")
-
-                elif msg_type == "tool":
-                    # 工具执行结果消息 - 使用 tool_call_id 精确匹配
-                    tool_call_id = msg_dict.get("tool_call_id")
-                    content = msg_dict.get("content", "")
-                    name = msg_dict.get("name", "")
-
-                    if tool_call_id:
-                        # 确保tool_output是字符串类型，避免SQLite不支持列表类型
-                        if isinstance(content, list):
-                            tool_output = json.dumps(content) if content else ""
-                        else:
-                            tool_output = str(content)
-
-                        # 通过 LangGraph tool_call_id 精确匹配并更新
-                        updated_tc = conv_mgr.update_tool_call_output(
-                            langgraph_tool_call_id=tool_call_id,
-                            tool_output=tool_output,
-                            status="success",
-                        )
-                        if updated_tc:
-                            logger.debug(f"Updated tool_call {tool_call_id} ({name}) with output")
-                        else:
-                            logger.warning(f"Tool call {tool_call_id} not found for update")
+            elif msg_type == "ai":
+                # AI 消息
+                content = msg_dict.get("content", "")
+                tool_calls_data = msg_dict.get("tool_calls", [])
 
-                else:
-                    logger.warning(f"Unknown message type: {msg_type}, skipping")
+                # Skip empty AI messages without tool_calls
+                if not content and not tool_calls_data:
+                    logger.warning(f"Skipping empty AI message without content or tool_calls: {msg.id}")
                     continue
 
-                logger.debug(f"Processed message type={msg_type}")
+                # 格式清洗
+                if finish_reason := msg_dict.get("response_metadata", {}).get("finish_reason"):
+                    if "tool_call" in finish_reason and len(finish_reason) > len("tool_call"):
+                        model_name = msg_dict.get("response_metadata", {}).get("model_name", "")
+                        repeat_count = len(finish_reason) // len("tool_call")
+                        msg_dict["response_metadata"]["finish_reason"] = "tool_call"
+                        msg_dict["response_metadata"]["model_name"] = model_name[: len(model_name) // repeat_count]
+
+                # 保存 AI 消息及其 tool_calls（使用 LangGraph 的 tool_call_id）
+                new_messages.append(
+                    {
+                        "role": "assistant",
+                        "content": content,
+                        "message_type": "text",
+                        "extra_metadata": msg_dict,  # 保存原始 model_dump
+                        "tool_calls": [
+                            {
+                                "tool_name": tc.get("name", "unknown"),
+                                "tool_input": tc.get("args", {}),  # 完整的参数
+                                "langgraph_tool_call_id": tc.get("id"),
+                            }
+                            for tc in tool_calls_data
+                        ],
+                    }
+                )
+
+            elif msg_type == "tool":
+                # 工具执行结果消息 - 使用 tool_call_id 精确匹配
+                tool_call_id = msg_dict.get("tool_call_id")
+                content = msg_dict.get("content", "")
+
+                if tool_call_id:
+                    # 确保tool_output是字符串类型，避免SQLite不支持列表类型
+                    if isinstance(content, list):
+                        tool_output = json.dumps(content) if content else ""
+                    else:
+                        tool_output = str(content)
+                    tool_outputs.append(
+                        {"langgraph_tool_call_id": tool_call_id, "tool_output": tool_output, "status": "success"}
+                    )
 
-            logger.info("Saved messages from LangGraph state")
+            else:
+                logger.warning(f"Unknown message type: {msg_type}, skipping")
 
-        except Exception as e:
-            logger.error(f"Error saving messages from LangGraph state: {e}")
-            logger.error(traceback.format_exc())
+        return new_messages, tool_outputs
 
     async def stream_messages():
         # 代表服务端已经收到了请求
         yield make_chunk(status="init", meta=meta, msg=HumanMessage(content=query).model_dump())
 
-        # Input guard
-        if conf.enable_content_guard and await content_guard.check(query):
-            yield make_chunk(status="error", message="输入内容包含敏感词", meta=meta)
-            return
+        # Input guard；快速模式下 LLM 审查与回答并行，审查不通过时再中断输出
+        input_moderation = None
+        if conf.enable_content_guard:
+            if content_guard.fast_path:
+                if await content_guard.check_with_keywords(query):
+                    yield make_chunk(status="error", message="输入内容包含敏感词", meta=meta)
+                    return
+                input_moderation = asyncio.create_task(content_guard.check_with_llm(query))
+            elif await content_guard.check(query):
+                yield make_chunk(status="error", message="输入内容包含敏感词", meta=meta)
+                return
+
+        def input_rejected() -> bool:
+            return bool(input_moderation and input_moderation.done() and input_moderation.result())
 
         try:
             agent = agent_manager.get_agent(agent_id)
@@ -286,76 +269,132 @@ async def chat_agent(
             thread_id = str(uuid.uuid4())
             logger.warning(f"No thread_id provided, generated new thread_id: {thread_id}")
 
-        # Initialize conversation manager
-        conv_manager = ConversationManager(db)
+        # Save user message（由后台持久化队列写入，不阻塞首个 token）
+        user_message_job = PersistJob(
+            thread_id=thread_id,
+            messages=[
+                {
+                    "role": "user",
+                    "content": query,
+                    "message_type": "text",
+                    "extra_metadata": {"raw_message": HumanMessage(content=query).model_dump()},
+                }
+            ],
+            description="user message",
+        )
+        # 快速模式下输入审查通过后才保存用户消息（及之后的消息），未通过的输入不写入对话历史
+        deferred_jobs: list[PersistJob] = []
+        if input_moderation:
+            deferred_jobs.append(user_message_job)
+        else:
+            await chat_persistence.enqueue(user_message_job)
 
-        # Save user message
-        try:
-            conv_manager.add_message_by_thread_id(
-                thread_id=thread_id,
-                role="user",
-                content=query,
-                message_type="text",
-                extra_metadata={"raw_message": HumanMessage(content=query).model_dump()},
-            )
-        except Exception as e:
-            logger.error(f"Error saving user message: {e}")
+        async def input_accepted() -> bool:
+            return not await input_moderation
+
+        def persist_nowait(job: PersistJob):
+            """在不能 await 的场景提交任务，有暂存任务时排在其后以保持顺序"""
+            if deferred_jobs:
+                deferred_jobs.append(job)
+            else:
+                chat_persistence.enqueue_nowait(job)
+
+        async def flush_deferred_jobs():
+            """输入审查已通过时提交暂存的任务"""
+            while deferred_jobs:
+                await chat_persistence.enqueue(deferred_jobs.pop(0))
 
         try:
             full_msg = None
-            async for msg, metadata in agent.stream_messages(messages, input_context=input_context):
+            # 关键词扫描状态随每个 token 推进，跨 token 的关键词也能命中
+            guard_scanner = content_guard.stream_scanner() if conf.enable_content_guard else None
+            stream = agent.stream_messages(messages, input_context=input_context)
+            if writer.coalescing:
+                # token 间隙超过合并窗口时输出合并中的内容
+                stream = iter_with_idle_ticks(stream, writer.window)
+
+            async for item in stream:
+                if input_rejected():
+                    logger.warning("Sensitive content detected in input by LLM moderation")
+                    deferred_jobs.clear()
+                    writer.discard()
+                    yield make_chunk(status="error", message="输入内容包含敏感词", meta=meta)
+                    return
+                if deferred_jobs and input_moderation.done():
+                    await flush_deferred_jobs()
+
+                if item is None:
+                    if chunk := writer.flush():
+                        yield chunk
+                    continue
+
+                msg, metadata = item
                 if isinstance(msg, AIMessageChunk):
                     full_msg = msg if not full_msg else full_msg + msg
-                    if conf.enable_content_guard and await content_guard.check_with_keywords(full_msg.content[-20:]):
+                    if guard_scanner and guard_scanner.feed(msg.content):
                         logger.warning("Sensitive content detected in stream")
+                        writer.discard()
                         yield make_chunk(message="检测到敏感内容，已中断输出", status="error")
                         return
 
-                    yield make_chunk(content=msg.content, msg=msg.model_dump(), metadata=metadata, status="loading")
+                    if chunk := writer.token(msg, metadata):
+                        yield chunk
 
                 else:
                     yield make_chunk(msg=msg.model_dump(), metadata=metadata, status="loading")
 
+            if input_moderation and await input_moderation:
+                logger.warning("Sensitive content detected in input by LLM moderation")
+                deferred_jobs.clear()
+                writer.discard()
+                yield make_chunk(status="error", message="输入内容包含敏感词", meta=meta)
+                return
+            await flush_deferred_jobs()
+
+            # 关键词已在流式过程中扫描过，这里只做 LLM 检测
             if (
                 conf.enable_content_guard
                 and hasattr(full_msg, "content")
-                and await content_guard.check(full_msg.content)
+                and await content_guard.check(full_msg.content, keywords=False)
             ):
                 logger.warning("Sensitive content detected in final message")
+                writer.discard()
                 yield make_chunk(message="检测到敏感内容，已中断输出", status="error")
                 return
 
             meta["time_cost"] = asyncio.get_event_loop().time() - start_time
             yield make_chunk(status="finished", meta=meta)
 
-            # After streaming finished, save all messages from LangGraph state
+            # After streaming finished, save all messages from LangGraph state（读取 state 与写入均在后台完成）
             langgraph_config = {"configurable": input_context}
-            await save_messages_from_langgraph_state(
-                agent_instance=agent,
-                thread_id=thread_id,
-                conv_mgr=conv_manager,
-                config_dict=langgraph_config,
+            await chat_persistence.enqueue(
+                PersistJob(
+                    thread_id=thread_id,
+                    loader=functools.partial(load_messages_from_langgraph_state, agent, langgraph_config),
+                    description="LangGraph state",
+                )
             )
 
         except (asyncio.CancelledError, ConnectionError) as e:
             # 客户端主动中断连接，尝试保存已生成的部分内容
             logger.warning(f"Client disconnected, cancelling stream: {e}")
             if full_msg:
-                # 创建新的 db session，因为原 session 可能已关闭
-                new_db = db_manager.get_session()
-                try:
-                    new_conv_manager = ConversationManager(new_db)
-                    msg_dict = full_msg.model_dump() if hasattr(full_msg, "model_dump") else {}
-                    content = full_msg.content if hasattr(full_msg, "content") else str(full_msg)
-                    new_conv_manager.add_message_by_thread_id(
+                msg_dict = full_msg.model_dump() if hasattr(full_msg, "model_dump") else {}
+                content = full_msg.content if hasattr(full_msg, "content") else str(full_msg)
+                persist_nowait(
+                    PersistJob(
                         thread_id=thread_id,
-                        role="assistant",
-                        content=content,
-                        message_type="text",
-                        extra_metadata=msg_dict | {"error_type": "interrupted"},  # 保存原始 model_dump
+                        messages=[
+                            {
+                                "role": "assistant",
+                                "content": content,
+                                "message_type": "text",
+                                "extra_metadata": msg_dict | {"error_type": "interrupted"},  # 保存原始 model_dump
+                            }
+                        ],
+                        description="partial assistant message",
                     )
-                finally:
-                    new_db.close()
+                )
 
             # 通知前端中断（可能发送不到，但用于一致性）
             yield make_chunk(status="interrupted", message="对话已中断", meta=meta)
@@ -363,24 +402,31 @@ async def chat_agent(
         except Exception as e:
             logger.error(f"Error streaming messages: {e}, {traceback.format_exc()}")
             if full_msg:
-                # 创建新的 db session，因为原 session 可能已关闭
-                new_db = db_manager.get_session()
-                try:
-                    new_conv_manager = ConversationManager(new_db)
-                    msg_dict = full_msg.model_dump() if hasattr(full_msg, "model_dump") else {}
-                    content = full_msg.content if hasattr(full_msg, "content") else str(full_msg)
-                    new_conv_manager.add_message_by_thread_id(
+                msg_dict = full_msg.model_dump() if hasattr(full_msg, "model_dump") else {}
+                content = full_msg.content if hasattr(full_msg, "content") else str(full_msg)
+                persist_nowait(
+                    PersistJob(
                         thread_id=thread_id,
-                        role="assistant",
-                        content=content,
-                        message_type="text",
-                        extra_metadata=msg_dict | {"error_type": "unexpect"},  # 保存原始 model_dump
+                        messages=[
+                            {
+                                "role": "assistant",
+                                "content": content,
+                                "message_type": "text",
+                                "extra_metadata": msg_dict | {"error_type": "unexpect"},  # 保存原始 model_dump
+                            }
+                        ],
+                        description="partial assistant message",
                     )
-                finally:
-                    new_db.close()
+                )
             yield make_chunk(message=f"Error streaming messages: {e}", status="error")
 
-    return StreamingResponse(stream_messages(), media_type="application/json")
+        finally:
+            # 提前结束（中断、出错、输出审查未通过）时输入审查可能尚未完成，在后台等待结果后再保存
+            if deferred_jobs:
+                chat_persistence.enqueue_when(input_accepted(), deferred_jobs[:])
+                deferred_jobs.clear()
+
+    return StreamingResponse(stream_messages(), media_type=writer.media_type, headers=writer.headers)
 
 
 # =============================================================================
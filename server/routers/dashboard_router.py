@@ -58,6 +58,8 @@ class KnowledgeStats(BaseModel):
     total_storage_size: int  # 字节
     databases_by_type: dict
     file_type_distribution: dict
+    query_cache: dict = {}  # 检索结果缓存的命中率与耗时
+    query_latency: dict = {}  # 各知识库类型检索阶段（embed/search/keyword/rerank）的耗时
 
 
 class AgentAnalytics(BaseModel):
@@ -376,20 +378,13 @@ async def get_knowledge_stats(
 ):
     """Get knowledge base statistics (Admin only)"""
     try:
-        from src.knowledge.manager import KnowledgeBaseManager
-        import json
         import os
 
-        # 从知识库管理系统获取数据
-        kb_manager = KnowledgeBaseManager(work_dir="/app/saves/knowledge_base_data")
+        from src.knowledge import knowledge_base as kb_manager
 
-        # 读取全局元数据文件
-        metadata_file = "/app/saves/knowledge_base_data/global_metadata.json"
-        if os.path.exists(metadata_file):
-            with open(metadata_file, encoding="utf-8") as f:
-                global_metadata = json.load(f)
-
-            databases = global_metadata.get("databases", {})
+        # 从知识库管理器的全局元数据获取数据库列表
+        databases = dict(kb_manager.global_databases_meta)
+        if databases:
             total_databases = len(databases)
 
             # 统计不同类型的知识库
@@ -472,7 +467,7 @@ async def get_knowledge_stats(
                     continue
 
         else:
-            # 如果没有元数据文件，返回空数据
+            # 如果没有知识库，返回空数据
             total_databases = 0
             total_files = 0
             total_nodes = 0
@@ -487,6 +482,8 @@ async def get_knowledge_stats(
             total_storage_size=total_storage_size,
             databases_by_type=databases_by_type,
             file_type_distribution=files_by_type,  # 保持API兼容，但使用新的数据
+            query_cache=kb_manager.query_cache.stats(),
+            query_latency=kb_manager.get_query_latency_stats(),
         )
 
     except Exception as e:
@@ -107,6 +107,69 @@ async def delete_database(db_id: str, current_user: User = Depends(get_admin_use
         raise HTTPException(status_code=400, detail=f"删除数据库失败: {e}")
 
 
+@knowledge.post("/databases/{db_id}/reindex")
+async def reindex_database(
+    db_id: str,
+    index_profile: str = Body(...),
+    index_params: dict = Body({}),
+    current_user: User = Depends(get_admin_user),
+):
+    """按新的索引配置重建知识库的向量索引（仅 Milvus）"""
+    logger.debug(f"Reindex database {db_id} with {index_profile} {index_params}")
+
+    async def run_reindex(context: TaskContext):
+        await context.set_progress(5.0, f"正在按 {index_profile} 重建索引")
+        result = await knowledge_base.reindex_database(db_id, index_profile, index_params)
+        await context.set_result(result)
+        await context.set_progress(100.0, f"索引重建完成，耗时 {result['seconds']} 秒")
+        return result
+
+    try:
+        task = await tasker.enqueue(
+            name=f"知识库索引重建({db_id})",
+            task_type="knowledge_reindex",
+            payload={"db_id": db_id, "index_profile": index_profile, "index_params": index_params},
+            coroutine=run_reindex,
+        )
+        return {"message": "任务已提交，请在任务中心查看进度", "status": "queued", "task_id": task.id}
+    except Exception as e:  # noqa: BLE001
+        logger.error(f"Failed to enqueue reindex: {e}, {traceback.format_exc()}")
+        return {"message": f"Failed to enqueue task: {e}", "status": "failed"}
+
+
+@knowledge.post("/databases/{db_id}/index-benchmark")
+async def benchmark_index_profiles(
+    db_id: str,
+    profiles: list[str] = Body(None),
+    queries: list[str] = Body(None),
+    sample_size: int = Body(20000),
+    top_k: int = Body(10),
+    current_user: User = Depends(get_admin_user),
+):
+    """在知识库自身的数据与查询上比较各索引配置的召回率与延迟（仅 Milvus）"""
+
+    async def run_benchmark(context: TaskContext):
+        await context.set_progress(5.0, "正在评估索引配置")
+        result = await knowledge_base.benchmark_index_profiles(
+            db_id, profiles, queries=queries, sample_size=sample_size, top_k=top_k
+        )
+        await context.set_result(result)
+        await context.set_progress(100.0, "索引配置评估完成")
+        return result
+
+    try:
+        task = await tasker.enqueue(
+            name=f"知识库索引评估({db_id})",
+            task_type="knowledge_index_benchmark",
+            payload={"db_id": db_id, "profiles": profiles, "sample_size": sample_size, "top_k": top_k},
+            coroutine=run_benchmark,
+        )
+        return {"message": "任务已提交，请在任务中心查看进度", "status": "queued", "task_id": task.id}
+    except Exception as e:  # noqa: BLE001
+        logger.error(f"Failed to enqueue index benchmark: {e}, {traceback.format_exc()}")
+        return {"message": f"Failed to enqueue task: {e}", "status": "failed"}
+
+
 @knowledge.get("/databases/{db_id}/export")
 async def export_database(
     db_id: str,
@@ -167,22 +230,31 @@ async def add_documents(
         await context.set_message("任务初始化")
         await context.set_progress(5.0, "准备处理文档")
 
-        total = len(items)
-        processed_items = []
+        last_progress = 5.0
+
+        async def on_item_done(done: int, total: int, record: dict, page_progress: tuple[int, int] | None = None):
+            nonlocal last_progress
+            if page_progress is not None:
+                # PDF OCR 的页进度计入当前文档，多个文档并发解析时进度不回退
+                pages_done, pages_total = page_progress
+                last_progress = max(last_progress, 5.0 + (done + pages_done / pages_total) / total * 90.0)
+                await context.set_progress(
+                    last_progress, f"正在识别 {record.get('filename')}：已完成 {pages_done}/{pages_total} 页"
+                )
+                return
+
+            await context.raise_if_cancelled()
+            last_progress = max(last_progress, 5.0 + (done / total) * 90.0)  # 5% ~ 95%
+            status = "失败" if record.get("status") == "failed" else "完成"
+            await context.set_progress(
+                last_progress, f"已处理 {done}/{total} 个文档，{record.get('filename')} {status}"
+            )
 
         try:
-            # 逐个处理文档并更新进度
-            for idx, item in enumerate(items, 1):
-                await context.raise_if_cancelled()
-
-                # 更新进度
-                progress = 5.0 + (idx / total) * 90.0  # 5% ~ 95%
-                await context.set_progress(progress, f"正在处理第 {idx}/{total} 个文档")
-
-                # 处理单个文档
-                result = await knowledge_base.add_content(db_id, [item], params=params)
-                processed_items.extend(result)
-
+            # 文档在知识库内部通过分阶段流水线并发处理，每完成一个文档回调一次进度
+            processed_items = await knowledge_base.add_content(
+                db_id, items, params=params, progress_callback=on_item_done
+            )
         except asyncio.CancelledError:
             await context.set_progress(100.0, "任务已取消")
             raise
@@ -222,6 +294,52 @@ async def add_documents(
         return {"message": f"Failed to enqueue task: {e}", "status": "failed"}
 
 
+@knowledge.put("/databases/{db_id}/documents/{doc_id}")
+async def update_document(
+    db_id: str,
+    doc_id: str,
+    item: str = Body(...),
+    params: dict = Body({}),
+    current_user: User = Depends(get_admin_user),
+):
+    """用新内容更新文档，只重新向量化发生变化的分块"""
+    logger.debug(f"Update document {doc_id} in {db_id}: {item} {params=}")
+
+    content_type = params.get("content_type", "file")
+    if content_type == "file":
+        from src.knowledge.utils.kb_utils import validate_file_path
+
+        try:
+            validate_file_path(item, db_id)
+        except ValueError as e:
+            raise HTTPException(status_code=403, detail=str(e))
+
+    async def run_update(context: TaskContext):
+        await context.set_progress(5.0, "准备更新文档")
+        record = await knowledge_base.update_file(db_id, doc_id, item, params=params)
+
+        stats = record.get("update_stats", {})
+        if record.get("status") == "failed":
+            message = f"文档更新失败: {record.get('error')}"
+        else:
+            message = f"文档更新完成，新增 {stats.get('added', 0)} 个分块，删除 {stats.get('removed', 0)} 个分块"
+        await context.set_result(record)
+        await context.set_progress(100.0, message)
+        return record
+
+    try:
+        task = await tasker.enqueue(
+            name=f"知识库文档更新({db_id})",
+            task_type="knowledge_update",
+            payload={"db_id": db_id, "doc_id": doc_id, "item": item, "params": params},
+            coroutine=run_update,
+        )
+        return {"message": "任务已提交，请在任务中心查看进度", "status": "queued", "task_id": task.id}
+    except Exception as e:  # noqa: BLE001
+        logger.error(f"Failed to enqueue document update: {e}, {traceback.format_exc()}")
+        return {"message": f"Failed to enqueue task: {e}", "status": "failed"}
+
+
 @knowledge.get("/databases/{db_id}/documents/{doc_id}")
 async def get_document_info(db_id: str, doc_id: str, current_user: User = Depends(get_admin_user)):
     """获取文档详细信息（包含基本信息和内容信息）"""
@@ -273,6 +391,25 @@ async def delete_document(db_id: str, doc_id: str, current_user: User = Depends(
         raise HTTPException(status_code=400, detail=f"删除文档失败: {e}")
 
 
+@knowledge.post("/databases/{db_id}/documents/batch-delete")
+async def batch_delete_documents(
+    db_id: str, file_ids: list[str] = Body(..., embed=True), current_user: User = Depends(get_admin_user)
+):
+    """批量删除文档"""
+    logger.debug(f"Batch delete {len(file_ids)} documents in {db_id}")
+    try:
+        result = await knowledge_base.delete_files(db_id, file_ids)
+    except Exception as e:
+        logger.error(f"批量删除文档失败 {e}, {traceback.format_exc()}")
+        raise HTTPException(status_code=400, detail=f"批量删除文档失败: {e}")
+
+    return {
+        "message": "删除成功" if not result["failed"] else "部分文件删除失败",
+        "deleted": len(result["deleted"]),
+        "failed": result["failed"],
+    }
+
+
 @knowledge.get("/databases/{db_id}/documents/{doc_id}/download")
 async def download_document(db_id: str, doc_id: str, request: Request, current_user: User = Depends(get_admin_user)):
     """下载原始文件"""
@@ -378,11 +515,22 @@ async def download_document(db_id: str, doc_id: str, request: Request, current_u
 
 @knowledge.post("/databases/{db_id}/query")
 async def query_knowledge_base(
-    db_id: str, query: str = Body(...), meta: dict = Body(...), current_user: User = Depends(get_admin_user)
+    db_id: str,
+    query: str = Body(...),
+    meta: dict = Body(...),
+    query_filter: dict | None = Body(None, alias="filter"),
+    current_user: User = Depends(get_admin_user),
 ):
-    """查询知识库"""
+    """
+    查询知识库
+
+    filter 为结构化过滤条件（仅 Chroma / Milvus 知识库），如
+    {"file_ids": [...], "file_types": ["pdf"], "created_after": "2025-01-01", "tags": ["财务"]}
+    """
     logger.debug(f"Query knowledge base {db_id}: {query}")
     try:
+        if query_filter:
+            meta = {**meta, "filter": query_filter}
         result = await knowledge_base.aquery(query, db_id=db_id, **meta)
         return {"result": result, "status": "success"}
     except Exception as e:
@@ -404,6 +552,53 @@ async def query_test(
         return {"message": f"测试查询失败: {e}", "status": "failed"}
 
 
+def _milvus_search_options(metadata: dict | None) -> list[dict]:
+    """Milvus 知识库按索引类型可调的检索参数与一致性级别"""
+    from src.knowledge.implementations.milvus_index import (
+        CONSISTENCY_LEVELS,
+        profile_from_metadata,
+        resolve_consistency_level,
+    )
+
+    profile = profile_from_metadata(metadata)
+    descriptions = {
+        "nprobe": (
+            "探测聚类数",
+            "IVF 索引检索的聚类数，越大召回率越高但越慢",
+            1,
+            profile.build_params.get("nlist", 1024),
+        ),
+        "ef": ("HNSW ef", "HNSW 检索的候选集大小，越大召回率越高但越慢，不小于 TopK", 1, 1024),
+        "search_list": ("DiskANN search_list", "DiskANN 检索的候选列表大小，不小于 TopK", 1, 1024),
+    }
+    options = []
+    for key in profile.search_param_keys:
+        label, description, min_value, max_value = descriptions[key]
+        options.append(
+            {
+                "key": key,
+                "label": label,
+                "type": "number",
+                "default": profile.search_params.get(key),
+                "min": min_value,
+                "max": max_value,
+                "description": description,
+            }
+        )
+
+    options.append(
+        {
+            "key": "consistency_level",
+            "label": "一致性级别",
+            "type": "select",
+            "default": resolve_consistency_level((metadata or {}).get("consistency_level")),
+            "options": [{"value": level, "label": level} for level in CONSISTENCY_LEVELS],
+            "description": "Strong 可读到最新写入；Bounded / Eventually 不等待同步，延迟更低",
+        }
+    )
+    return options
+
+
 @knowledge.get("/databases/{db_id}/query-params")
 async def get_knowledge_base_query_params(db_id: str, current_user: User = Depends(get_admin_user)):
     """获取知识库类型特定的查询参数"""
@@ -415,6 +610,59 @@ async def get_knowledge_base_query_params(db_id: str, current_user: User = Depen
 
         kb_type = db_info.get("kb_type", "lightrag")
 
+        # 向量知识库共用的检索模式与重排序参数
+        retrieval_options = [
+            {
+                "key": "search_mode",
+                "label": "检索模式",
+                "type": "select",
+                "default": "vector",
+                "options": [
+                    {"value": "vector", "label": "向量检索", "description": "语义相似度检索"},
+                    {"value": "keyword", "label": "关键词检索", "description": "BM25 检索，适合型号、编号、报错原文"},
+                    {"value": "hybrid", "label": "混合检索", "description": "向量与关键词检索结果融合"},
+                ],
+                "description": "混合检索与关键词检索仅覆盖启用该功能后入库的文件",
+            },
+            {
+                "key": "fusion",
+                "label": "融合方式",
+                "type": "select",
+                "default": "rrf",
+                "options": [
+                    {"value": "rrf", "label": "RRF", "description": "倒数排名融合，不依赖分数尺度"},
+                    {"value": "weighted", "label": "加权分数", "description": "归一化后按权重加权求和"},
+                ],
+                "description": "混合检索的结果融合方式",
+            },
+            {
+                "key": "hybrid_alpha",
+                "label": "向量检索权重",
+                "type": "number",
+                "default": 0.5,
+                "min": 0.0,
+                "max": 1.0,
+                "step": 0.1,
+                "description": "混合检索中向量检索一路的权重，关键词检索权重为 1 - 该值",
+            },
+            {
+                "key": "use_rerank",
+                "label": "重排序",
+                "type": "boolean",
+                "default": config.enable_reranker,
+                "description": f"使用 {config.reranker} 对候选结果重排序",
+            },
+            {
+                "key": "rerank_candidates",
+                "label": "重排序候选数",
+                "type": "number",
+                "default": 30,
+                "min": 1,
+                "max": 200,
+                "description": "重排序前召回的候选数量，越大效果越好但耗时越长",
+            },
+        ]
+
         # 根据知识库类型返回不同的查询参数
         if kb_type == "lightrag":
             params = {
@@ -488,6 +736,7 @@ async def get_knowledge_base_query_params(db_id: str, current_user: User = Depen
                         "default": True,
                         "description": "在结果中显示相似度分数",
                     },
+                    *retrieval_options,
                 ],
             }
         elif kb_type == "milvus":
@@ -520,18 +769,8 @@ async def get_knowledge_base_query_params(db_id: str, current_user: User = Depen
                         "default": True,
                         "description": "在结果中显示相似度分数",
                     },
-                    {
-                        "key": "metric_type",
-                        "label": "距离度量类型",
-                        "type": "select",
-                        "default": "COSINE",
-                        "options": [
-                            {"value": "COSINE", "label": "余弦相似度", "description": "适合文本语义相似度"},
-                            {"value": "L2", "label": "欧几里得距离", "description": "适合数值型数据"},
-                            {"value": "IP", "label": "内积", "description": "适合标准化向量"},
-                        ],
-                        "description": "向量相似度计算方法",
-                    },
+                    *_milvus_search_options(db_info.get("metadata")),
+                    *retrieval_options,
                 ],
             }
         else:
@@ -1131,6 +1370,18 @@ async def get_knowledge_base_types(current_user: User = Depends(get_admin_user))
         return {"message": f"获取知识库类型失败 {e}", "kb_types": {}}
 
 
+@knowledge.get("/index-profiles")
+async def get_index_profiles(current_user: User = Depends(get_admin_user)):
+    """获取 Milvus 知识库可选的向量索引配置"""
+    from src.knowledge.implementations.milvus_index import DEFAULT_INDEX_PROFILE, INDEX_PROFILES
+
+    return {
+        "profiles": [profile.to_dict() for profile in INDEX_PROFILES.values()],
+        "default": DEFAULT_INDEX_PROFILE,
+        "message": "success",
+    }
+
+
 @knowledge.get("/stats")
 async def get_knowledge_base_statistics(current_user: User = Depends(get_admin_user)):
     """获取知识库统计信息"""
@@ -0,0 +1,329 @@
+"""对话消息的后台持久化队列
+
+流式对话的请求处理只负责把待保存的消息放入队列，由后台写入任务批量写入数据库，
+数据库写入（以及读取 LangGraph state）不再占用流式响应：
+
+- 队列有界，写入跟不上时 enqueue 会等待（背压），超时后退化为直接写入，保证不丢消息；
+- 写入任务每次取出最多 batch_size 个任务，复用同一个数据库会话在线程中按顺序写入；
+- 任务失败后，它和同一对话中排在其后的任务转入该对话的重试队列，由后台任务按指数退避重试，
+  写入任务继续处理其他对话；重试队列清空前该对话的新任务也排入其中，保证同一对话按提交顺序写入；
+- 单个任务重试超过 max_retries 次后记录错误并丢弃；
+- 服务关闭时停止接收新任务，在 drain_timeout 内写完队列与重试队列中剩余的任务。
+"""
+
+import asyncio
+import traceback
+from collections import deque
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass, field
+from typing import Any
+
+from src.storage.conversation import ConversationManager
+from src.storage.db.manager import db_manager
+from src.utils.logging_config import logger
+
+# 返回 (messages, tool_outputs) 的异步加载函数，写入时才调用（如读取 LangGraph state）
+MessageLoader = Callable[[], Awaitable[tuple[list[dict], list[dict]]]]
+
+
+@dataclass
+class PersistJob:
+    """
+    一次持久化任务，最终调用 ConversationManager.save_messages_bulk
+
+    Args:
+        thread_id: 对话线程 ID
+        messages: 待保存的消息，格式同 save_messages_bulk
+        tool_outputs: 待记录的工具调用结果，格式同 save_messages_bulk
+        loader: 可选的异步加载函数，其结果追加到 messages / tool_outputs 之后
+        description: 日志中显示的任务描述
+    """
+
+    thread_id: str
+    messages: list[dict] = field(default_factory=list)
+    tool_outputs: list[dict] = field(default_factory=list)
+    loader: MessageLoader | None = None
+    description: str = "messages"
+    attempts: int = 0
+
+
+class ChatPersistenceQueue:
+    def __init__(
+        self,
+        maxsize: int = 1000,
+        batch_size: int = 32,
+        max_retries: int = 3,
+        retry_backoff: float = 0.5,
+        put_timeout: float = 5.0,
+        drain_timeout: float = 10.0,
+    ):
+        self.maxsize = maxsize
+        self.batch_size = max(1, batch_size)
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.put_timeout = put_timeout
+        self.drain_timeout = drain_timeout
+        self._queue: asyncio.Queue[PersistJob] | None = None
+        self._writer: asyncio.Task[Any] | None = None
+        self._lock = asyncio.Lock()
+        self._started = False
+        self._closing = False
+        self._pending_puts: set[asyncio.Task[Any]] = set()
+        # 有任务等待重试的对话 {thread_id: 按提交顺序排列的任务，队首为正在重试的任务}
+        self._blocked: dict[str, deque[PersistJob]] = {}
+        self._retry_tasks: set[asyncio.Task[Any]] = set()
+        self.stats = {"saved": 0, "retried": 0, "failed": 0, "inline": 0}
+
+    async def start(self) -> None:
+        async with self._lock:
+            if self._started:
+                return
+            self._queue = asyncio.Queue(maxsize=self.maxsize)
+            self._closing = False
+            self._writer = asyncio.create_task(self._writer_loop(), name="chat-persistence-writer")
+            self._started = True
+            logger.info(f"Chat persistence queue started (maxsize={self.maxsize}, batch_size={self.batch_size})")
+
+    async def shutdown(self) -> None:
+        async with self._lock:
+            if not self._started:
+                return
+            self._closing = True
+            if self._pending_puts:
+                await asyncio.gather(*self._pending_puts, return_exceptions=True)
+
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + self.drain_timeout
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout=self.drain_timeout)
+            except TimeoutError:
+                logger.error(
+                    f"Chat persistence queue not drained in {self.drain_timeout}s, {self._queue.qsize()} jobs lost"
+                )
+
+            if self._retry_tasks:
+                _, pending = await asyncio.wait(set(self._retry_tasks), timeout=max(0.0, deadline - loop.time()))
+                if pending:
+                    lost = sum(len(jobs) for jobs in self._blocked.values())
+                    logger.error(f"Chat persistence retries not finished in {self.drain_timeout}s, {lost} jobs lost")
+                    for task in pending:
+                        task.cancel()
+                    await asyncio.gather(*pending, return_exceptions=True)
+
+            self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+            self._writer = None
+            self._started = False
+            logger.info(f"Chat persistence queue shutdown complete, stats: {self.stats}")
+
+    async def enqueue(self, job: PersistJob) -> None:
+        """
+        提交任务，队列未满时立即返回
+
+        队列已满时等待最多 put_timeout 秒；队列未启动、已关闭或等待超时时直接写入。
+        """
+        if not self._started or self._closing:
+            await self._write_inline(job)
+            return
+
+        try:
+            self._queue.put_nowait(job)
+            return
+        except asyncio.QueueFull:
+            logger.warning(f"Chat persistence queue is full ({self.maxsize}), waiting for the writer")
+
+        try:
+            await asyncio.wait_for(self._queue.put(job), timeout=self.put_timeout)
+        except TimeoutError:
+            logger.error(f"Chat persistence queue still full after {self.put_timeout}s, writing inline")
+            await self._write_inline(job)
+
+    def enqueue_nowait(self, job: PersistJob) -> None:
+        """在不能 await 的场景（如流被取消时）提交任务，队列已满时在后台等待入队"""
+        if not self._started or self._closing:
+            self._track(asyncio.create_task(self._write_inline(job)))
+            return
+
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self._track(asyncio.create_task(self.enqueue(job)))
+
+    def enqueue_when(self, gate: Awaitable[bool], jobs: list[PersistJob]) -> None:
+        """
+        在后台等待 gate，结果为 True 时按顺序提交 jobs，否则丢弃（如等待快速模式下的输入审查结果）
+        """
+
+        async def wait_and_enqueue():
+            try:
+                accepted = await gate
+            except Exception as e:  # noqa: BLE001
+                logger.error(f"Chat persistence gate failed, dropping {len(jobs)} jobs: {e}")
+                return
+            if accepted:
+                for job in jobs:
+                    await self.enqueue(job)
+
+        self._track(asyncio.create_task(wait_and_enqueue()))
+
+    def _track(self, task: asyncio.Task[Any]) -> None:
+        self._pending_puts.add(task)
+        task.add_done_callback(self._pending_puts.discard)
+
+    async def _writer_loop(self) -> None:
+        while True:
+            try:
+                batch = [await self._queue.get()]
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+
+                try:
+                    await self._process_batch(batch)
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:  # noqa: BLE001
+                logger.error(f"Chat persistence writer error: {e}, {traceback.format_exc()}")
+
+    async def _process_batch(self, batch: list[PersistJob]) -> None:
+        """加载消息后在同一个数据库会话中按顺序写入整批任务，失败的任务连同同一对话的后续任务转入重试队列"""
+        ready: list[PersistJob] = []
+        # 本批中需要重试的对话 {thread_id: [(任务, 异常)]}，异常为 None 的任务排在失败任务之后、尚未尝试
+        held: dict[str, list[tuple[PersistJob, Exception | None]]] = {}
+        for job in batch:
+            if job.thread_id in self._blocked:
+                self._blocked[job.thread_id].append(job)
+            elif job.thread_id in held:
+                held[job.thread_id].append((job, None))
+            else:
+                try:
+                    await self._load(job)
+                    ready.append(job)
+                except Exception as e:  # noqa: BLE001
+                    held[job.thread_id] = [(job, e)]
+
+        unwritten = await asyncio.to_thread(self._write_batch, ready) if ready else []
+        # 写入失败的任务均排在同一对话中加载失败的任务之前
+        for thread_id, jobs in self._group_by_thread(unwritten).items():
+            held[thread_id] = jobs + held.get(thread_id, [])
+
+        for thread_id, jobs in held.items():
+            self._block_thread(thread_id, jobs)
+
+    @staticmethod
+    def _group_by_thread(
+        jobs: list[tuple[PersistJob, Exception | None]],
+    ) -> dict[str, list[tuple[PersistJob, Exception | None]]]:
+        groups: dict[str, list[tuple[PersistJob, Exception | None]]] = {}
+        for job, error in jobs:
+            groups.setdefault(job.thread_id, []).append((job, error))
+        return groups
+
+    def _block_thread(self, thread_id: str, jobs: list[tuple[PersistJob, Exception | None]]) -> None:
+        """将对话的任务转入重试队列（队首为失败的任务），由后台任务按退避时间重试"""
+        head, error = jobs[0]
+        self._blocked[thread_id] = deque(job for job, _ in jobs)
+        delay = 0.0
+        if self._should_retry(head, error):
+            delay = self._retry_delay(head)
+        else:
+            self._blocked[thread_id].popleft()
+
+        task = asyncio.create_task(self._retry_thread(thread_id, delay), name=f"chat-persistence-retry-{thread_id}")
+        self._retry_tasks.add(task)
+        task.add_done_callback(self._retry_tasks.discard)
+
+    async def _retry_thread(self, thread_id: str, delay: float) -> None:
+        """按顺序写入对话重试队列中的任务，队首失败时退避后重试，队列清空后解除阻塞"""
+        pending = self._blocked[thread_id]
+        try:
+            while pending:
+                await asyncio.sleep(delay)
+                job = pending[0]
+                error = await self._write_one(job)
+                if error is not None and self._should_retry(job, error):
+                    delay = self._retry_delay(job)
+                    continue
+                pending.popleft()
+                delay = 0.0
+        finally:
+            del self._blocked[thread_id]
+
+    def _should_retry(self, job: PersistJob, error: Exception) -> bool:
+        """记录一次失败，未超过 max_retries 时返回 True，否则丢弃任务"""
+        job.attempts += 1
+        if job.attempts > self.max_retries:
+            self.stats["failed"] += 1
+            logger.error(
+                f"Dropping chat persistence job for thread {job.thread_id} ({job.description}) "
+                f"after {self.max_retries} retries: {error}"
+            )
+            return False
+
+        self.stats["retried"] += 1
+        logger.warning(f"Retrying chat persistence job for thread {job.thread_id} (attempt {job.attempts}): {error}")
+        return True
+
+    def _retry_delay(self, job: PersistJob) -> float:
+        return self.retry_backoff * 2 ** (job.attempts - 1)
+
+    async def _write_one(self, job: PersistJob) -> Exception | None:
+        """加载并写入单个任务，返回失败原因"""
+        try:
+            await self._load(job)
+            unwritten = await asyncio.to_thread(self._write_batch, [job])
+        except Exception as e:  # noqa: BLE001
+            return e
+        return unwritten[0][1] if unwritten else None
+
+    async def _load(self, job: PersistJob) -> None:
+        """调用 loader 并将结果合并到任务中（成功后不再重复加载）"""
+        if job.loader is None:
+            return
+        messages, tool_outputs = await job.loader()
+        job.messages = job.messages + messages
+        job.tool_outputs = job.tool_outputs + tool_outputs
+        job.loader = None
+
+    def _write_batch(self, jobs: list[PersistJob]) -> list[tuple[PersistJob, Exception | None]]:
+        """
+        在工作线程中按顺序写入任务，返回未写入的任务
+
+        写入失败的任务附带异常；同一对话中排在失败任务之后的任务不再写入，异常为 None。
+        """
+        unwritten: list[tuple[PersistJob, Exception | None]] = []
+        failed_threads: set[str] = set()
+        db = db_manager.get_session()
+        try:
+            conv_manager = ConversationManager(db)
+            for job in jobs:
+                if job.thread_id in failed_threads:
+                    unwritten.append((job, None))
+                    continue
+                try:
+                    conv_manager.save_messages_bulk(job.thread_id, job.messages, job.tool_outputs)
+                    self.stats["saved"] += 1
+                except Exception as e:  # noqa: BLE001
+                    failed_threads.add(job.thread_id)
+                    unwritten.append((job, e))
+        finally:
+            db.close()
+        return unwritten
+
+    async def _write_inline(self, job: PersistJob) -> None:
+        # 对话有任务正在重试时排在其后，保证写入顺序
+        if job.thread_id in self._blocked:
+            self._blocked[job.thread_id].append(job)
+            return
+
+        self.stats["inline"] += 1
+        while (error := await self._write_one(job)) is not None and self._should_retry(job, error):
+            await asyncio.sleep(self._retry_delay(job))
+
+
+chat_persistence = ChatPersistenceQueue()
+
+
+__all__ = ["ChatPersistenceQueue", "PersistJob", "chat_persistence"]
@@ -156,6 +156,22 @@ class DatabaseMigrator:
             if "conn" in locals():
                 conn.close()
 
+    def check_index_exists(self, table_name: str, index_name: str) -> bool:
+        """检查索引是否存在"""
+        try:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+
+            cursor.execute(f"PRAGMA index_list({table_name})")
+            indexes = [index[1] for index in cursor.fetchall()]
+            return index_name in indexes
+
+        except Exception:
+            return False
+        finally:
+            if "conn" in locals():
+                conn.close()
+
     def run_migrations(self):
         """运行所有待执行的迁移"""
         current_version = self.get_current_version()
@@ -171,7 +187,13 @@ class DatabaseMigrator:
                 "is_deleted",
                 "deleted_at",
             ]
-            if all(self.check_column_exists("users", column) for column in required_columns):
+            has_latest_columns = all(self.check_column_exists("users", column) for column in required_columns)
+            has_latest_columns = (
+                has_latest_columns
+                and self.check_column_exists("messages", "langgraph_message_id")
+                and self.check_index_exists("tool_calls", "ix_tool_calls_langgraph_tool_call_id")
+            )
+            if has_latest_columns:
                 # 字段已存在，直接设置为最新版本
                 logger.info(f"检测到现有数据库已包含最新字段，设置版本为 v{latest_version}")
                 self.set_version(latest_version)
@@ -258,6 +280,27 @@ class DatabaseMigrator:
 
         migrations.append((2, "为用户表添加软删除字段", v2_commands))
 
+        # 迁移 v3: 为 messages 表添加 LangGraph 消息 ID 字段（带索引，用于保存消息时去重），并从 extra_metadata 回填；
+        # 为 tool_calls 表的 LangGraph 工具调用 ID 添加索引（用于记录工具调用结果）
+        v3_commands: list[str] = []
+
+        if not self.check_column_exists("messages", "langgraph_message_id"):
+            v3_commands.extend(
+                [
+                    "ALTER TABLE messages ADD COLUMN langgraph_message_id VARCHAR(128)",
+                    "UPDATE messages SET langgraph_message_id = json_extract(extra_metadata, '$.id') "
+                    "WHERE json_valid(extra_metadata) AND json_extract(extra_metadata, '$.id') IS NOT NULL",
+                    "CREATE INDEX IF NOT EXISTS ix_messages_langgraph_message_id ON messages (langgraph_message_id)",
+                ]
+            )
+
+        if not self.check_index_exists("tool_calls", "ix_tool_calls_langgraph_tool_call_id"):
+            v3_commands.append(
+                "CREATE INDEX IF NOT EXISTS ix_tool_calls_langgraph_tool_call_id ON tool_calls (langgraph_tool_call_id)"
+            )
+
+        migrations.append((3, "为消息表添加 LangGraph 消息 ID 字段，为工具调用添加 LangGraph ID 索引", v3_commands))
+
         # 未来的迁移可以在这里添加
         # migrations.append((
         #     2,
@@ -0,0 +1,179 @@
+"""智能体流式接口的输出格式
+
+- json（默认）：每个事件一行 JSON，AIMessageChunk 事件包含完整的 msg.model_dump()、metadata 与 request_id，
+  与旧版前端兼容；
+- compact：每条 AI 消息只在开始时发送一次消息头（status=message，含 msg 与 metadata），之后只发送增量
+  （status=delta），相邻 token 在 COALESCE_WINDOW_MS 毫秒或 COALESCE_MAX_CHARS 个字符内合并为一个事件；
+- sse：与 compact 相同的事件，以 Server-Sent Events 格式输出（event 为 status）。
+
+compact / sse 的增量事件：{"status": "delta", "id": 消息 ID, "content": 文本增量}，另有非空的
+tool_call_chunks / additional_kwargs / response_metadata / usage_metadata 时一并发送，客户端按
+AIMessageChunk 相加的规则合并（字符串拼接，tool_call_chunks 按 index 合并）。其余事件与 json 格式相同。
+"""
+
+import asyncio
+import json
+import time
+from collections.abc import AsyncIterator
+
+from langchain_core.messages import AIMessageChunk
+
+STREAM_FORMATS = ("json", "compact", "sse")
+DEFAULT_STREAM_FORMAT = "json"
+
+COALESCE_WINDOW_MS = 50
+COALESCE_MAX_CHARS = 512
+
+# 增量事件中随内容一起发送的字段
+DELTA_FIELDS = ("tool_call_chunks", "additional_kwargs", "response_metadata", "usage_metadata")
+
+# 消息头中不发送的字段（由增量事件承载）
+HEADER_EXCLUDE = {"content", "tool_calls", "invalid_tool_calls", "tool_call_chunks", "chunk_position"}
+
+
+def resolve_stream_format(stream_format: str | None) -> str:
+    """校验输出格式，为空时返回默认格式"""
+    stream_format = (stream_format or DEFAULT_STREAM_FORMAT).lower()
+    if stream_format not in STREAM_FORMATS:
+        raise ValueError(f"Unsupported stream format: {stream_format}, only support {list(STREAM_FORMATS)}")
+    return stream_format
+
+
+class StreamWriter:
+    """
+    按输出格式编码流式事件
+
+    Args:
+        stream_format: json / compact / sse
+        request_id: 请求 ID，json 格式下每个事件都携带，compact / sse 只在非增量事件中携带
+        window_ms: token 合并的时间窗口
+        max_chars: token 合并的最大字符数
+    """
+
+    def __init__(
+        self,
+        stream_format: str = DEFAULT_STREAM_FORMAT,
+        request_id: str | None = None,
+        window_ms: int = COALESCE_WINDOW_MS,
+        max_chars: int = COALESCE_MAX_CHARS,
+    ):
+        self.stream_format = resolve_stream_format(stream_format)
+        self.request_id = request_id
+        self.window = window_ms / 1000
+        self.max_chars = max_chars
+        self._pending: AIMessageChunk | None = None
+        self._pending_since = 0.0
+        self._header_sent: set[str] = set()
+
+    @property
+    def media_type(self) -> str:
+        return "text/event-stream" if self.stream_format == "sse" else "application/json"
+
+    @property
+    def headers(self) -> dict[str, str]:
+        if self.stream_format == "sse":
+            return {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        return {}
+
+    @property
+    def coalescing(self) -> bool:
+        return self.stream_format != "json"
+
+    def _encode(self, payload: dict) -> bytes:
+        data = json.dumps(payload, ensure_ascii=False)
+        if self.stream_format == "sse":
+            return f"event: {payload.get('status') or 'message'}\ndata: {data}\n\n".encode()
+        return data.encode("utf-8") + b"\n"
+
+    def event(self, content=None, **kwargs) -> bytes:
+        """编码一个完整事件（与旧版 make_chunk 的字段一致），发送前先输出合并中的 token"""
+        return self.flush() + self._encode({"request_id": self.request_id, "response": content, **kwargs})
+
+    def token(self, msg: AIMessageChunk, metadata: dict | None = None) -> bytes:
+        """
+        编码一个 AIMessageChunk
+
+        json 格式立即输出完整事件；compact / sse 格式在新消息开始时输出消息头，token 合并到窗口结束后输出增量。
+        """
+        if not self.coalescing:
+            return self.event(content=msg.content, msg=msg.model_dump(), metadata=metadata, status="loading")
+
+        output = b""
+        if self._pending is not None and self._pending.id != msg.id:
+            output += self.flush()
+
+        if msg.id not in self._header_sent:
+            self._header_sent.add(msg.id)
+            header = msg.model_dump(exclude=HEADER_EXCLUDE)
+            output += self._encode({"status": "message", "id": msg.id, "msg": header, "metadata": metadata})
+
+        if self._pending is None:
+            self._pending = msg
+            self._pending_since = time.monotonic()
+        else:
+            self._pending = self._pending + msg
+
+        if self.due():
+            output += self.flush()
+        return output
+
+    def due(self) -> bool:
+        """合并中的 token 是否已到达时间窗口或大小上限"""
+        if self._pending is None:
+            return False
+        content = self._pending.content
+        size = len(content) if isinstance(content, str) else len(json.dumps(content, ensure_ascii=False))
+        return size >= self.max_chars or time.monotonic() - self._pending_since >= self.window
+
+    def discard(self) -> None:
+        """丢弃合并中尚未发送的 token（如内容审查未通过时）"""
+        self._pending = None
+
+    def flush(self) -> bytes:
+        """输出合并中的 token"""
+        if self._pending is None:
+            return b""
+
+        pending, self._pending = self._pending, None
+        payload = {"status": "delta", "id": pending.id, "content": pending.content}
+        for field_name in DELTA_FIELDS:
+            value = getattr(pending, field_name, None)
+            if value:
+                payload[field_name] = value
+        return self._encode(payload)
+
+
+async def iter_with_idle_ticks(source: AsyncIterator, interval: float, maxsize: int = 64) -> AsyncIterator:
+    """
+    迭代异步迭代器，超过 interval 秒没有新元素时产出 None，用于在 token 间隙输出合并中的内容
+
+    源迭代器在单独的一个任务中读取（上下文变量保持一致），等待超时不会中断读取。
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+    done = object()
+
+    async def pump():
+        try:
+            async for item in source:
+                await queue.put((item, None))
+        except Exception as e:  # noqa: BLE001
+            await queue.put((done, e))
+        else:
+            await queue.put((done, None))
+
+    pump_task = asyncio.create_task(pump())
+    try:
+        while True:
+            try:
+                item, error = await asyncio.wait_for(queue.get(), timeout=interval)
+            except TimeoutError:
+                yield None
+                continue
+
+            if item is done:
+                if error is not None:
+                    raise error
+                return
+            yield item
+    finally:
+        pump_task.cancel()
@@ -47,6 +47,17 @@ class KnowledgeRetrieverModel(BaseModel):
     )
 
 
+class FilteredKnowledgeRetrieverModel(KnowledgeRetrieverModel):
+    file_types: list[str] | None = Field(
+        default=None, description="只检索这些类型的文件（扩展名，如 pdf、docx、md），不限制时不填"
+    )
+    created_after: str | None = Field(
+        default=None, description="只检索在此时间及之后入库的文件，ISO 日期，如 2025-01-01，不限制时不填"
+    )
+    created_before: str | None = Field(default=None, description="只检索在此时间之前入库的文件，ISO 日期，不限制时不填")
+    tags: list[str] | None = Field(default=None, description="只检索带有任一标签的文件，不限制时不填")
+
+
 def get_kb_based_tools() -> list:
     """获取所有知识库基于的工具"""
     # 获取所有知识库
@@ -56,15 +67,17 @@ def get_kb_based_tools() -> list:
     def _create_retriever_wrapper(db_id: str, retriever_info: dict[str, Any]):
         """创建检索器包装函数的工厂函数，避免闭包变量捕获问题"""
 
-        async def async_retriever_wrapper(query_text: str) -> Any:
-            """异步检索器包装函数"""
+        async def async_retriever_wrapper(query_text: str, **filters) -> Any:
+            """异步检索器包装函数，filters 为可选的过滤条件（file_types / created_after / created_before / tags）"""
             retriever = retriever_info["retriever"]
+            query_filter = {key: value for key, value in filters.items() if value}
+            kwargs = {"filter": query_filter} if query_filter else {}
             try:
-                logger.debug(f"Retrieving from database {db_id} with query: {query_text}")
+                logger.debug(f"Retrieving from database {db_id} with query: {query_text}, filter: {query_filter}")
                 if asyncio.iscoroutinefunction(retriever):
-                    result = await retriever(query_text)
+                    result = await retriever(query_text, **kwargs)
                 else:
-                    result = retriever(query_text)
+                    result = retriever(query_text, **kwargs)
                 logger.debug(f"Retrieved {len(result) if isinstance(result, list) else 'N/A'} results from {db_id}")
                 return result
             except Exception as e:
@@ -92,7 +105,9 @@ def get_kb_based_tools() -> list:
                 coroutine=retriever_wrapper,
                 name=tool_id,
                 description=description,
-                args_schema=KnowledgeRetrieverModel,
+                args_schema=(
+                    FilteredKnowledgeRetrieverModel if retrieve_info.get("supports_filter") else KnowledgeRetrieverModel
+                ),
                 metadata=retrieve_info["metadata"] | {"tag": ["knowledgebase"]},
             )
 
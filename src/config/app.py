@@ -53,6 +53,9 @@ class Config(SimpleConfig):
         self.add_item(
             "content_guard_llm_model", default="siliconflow/Qwen/Qwen3-235B-A22B-Instruct-2507", des="内容审查LLM模型"
         )
+        self.add_item(
+            "content_guard_llm_fast_path", default=False, des="LLM审查输入与回答并行（快速模式，审查不通过时中断输出）"
+        )
         # 默认智能体配置
         self.add_item("default_agent_id", default="", des="默认智能体ID")
         # 模型配置
@@ -75,6 +78,14 @@ class Config(SimpleConfig):
             des="Embedding 模型",
             choices=list(self.embed_model_names.keys()),
         )
+        self.add_item("enable_embedding_cache", default=True, des="是否启用 Embedding 向量缓存")
+        self.add_item("embedding_cache_max_entries", default=500_000, des="Embedding 缓存最大条数，超出后按 LRU 淘汰")
+        self.add_item("enable_parse_cache", default=True, des="是否缓存文档解析结果（按文件内容哈希复用）")
+        self.add_item("parse_cache_max_size_mb", default=2048, des="文档解析结果缓存最大容量（MB），超出后按 LRU 淘汰")
+        self.add_item("kb_query_timeout", default=60, des="知识库单次查询超时时间（秒），0 表示不限制")
+        self.add_item("enable_kb_query_cache", default=False, des="是否启用知识库检索结果缓存")
+        self.add_item("kb_query_cache_ttl", default=300, des="知识库检索结果缓存有效期（秒）")
+        self.add_item("kb_query_cache_max_entries", default=1000, des="知识库检索结果缓存最大条数")
         self.add_item(
             "reranker",
             default="siliconflow/BAAI/bge-reranker-v2-m3",
@@ -1,8 +1,32 @@
-import json
+import asyncio
 import os
+import time
+import traceback
 from abc import ABC, abstractmethod
+from collections import deque
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable, Iterator, MutableMapping
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 from typing import Any
 
+from src import config
+from src.knowledge.indexing import process_file_to_markdown, process_url_to_markdown
+from src.knowledge.pipeline import DEFAULT_QUEUE_SIZE, IngestionPipeline, IngestJob, StageFunc
+from src.knowledge.utils.kb_utils import (
+    EMBED_OPTIONAL_PARAMS,
+    ChunkDiff,
+    diff_chunks,
+    get_embedding_config,
+    iter_text_chunks,
+    prepare_item_metadata,
+)
+from src.knowledge.utils.lexical_index import LexicalIndex, reciprocal_rank_fusion, weighted_score_fusion
+from src.knowledge.utils.metadata_filter import chunk_attributes, match_record, normalize_tags, parse_filter
+from src.knowledge.utils.metadata_store import MetadataStore, migrate_json_metadata
+from src.knowledge.utils.parse_cache import get_parse_cache, make_parse_key
+from src.knowledge.utils.table_markdown import TABLE_FILE_EXTENSIONS, iter_table_markdown_blocks
+from src.models.embed import OtherEmbedding
+from src.models.rerank import get_reranker
 from src.utils import logger
 from src.utils.datetime_utils import coerce_any_to_utc_datetime, utc_isoformat
 
@@ -32,6 +56,29 @@ class KnowledgeBase(ABC):
     _processing_files = set()
     _processing_lock = None
 
+    # 类级别的查询线程池，执行阻塞的向量库调用，避免占用事件循环
+    _query_executor: ThreadPoolExecutor | None = None
+    QUERY_EXECUTOR_WORKERS = 8
+
+    # 混合检索时每一路召回 top_k * HYBRID_CANDIDATE_FACTOR 个候选再融合
+    HYBRID_CANDIDATE_FACTOR = 3
+    # 开启重排序且未指定 rerank_candidates 时，召回 top_k * RERANK_CANDIDATE_FACTOR 个候选
+    RERANK_CANDIDATE_FACTOR = 3
+    RERANK_BATCH_SIZE = 32
+
+    # 是否支持按分块比对的增量更新（update_file）
+    SUPPORTS_INCREMENTAL_UPDATE = False
+    # 是否支持检索时按文件、类型、时间、标签过滤（aquery 的 filter 参数）
+    SUPPORTS_METADATA_FILTER = False
+    # 是否维护关键词索引（search_mode 为 keyword / hybrid）
+    SUPPORTS_LEXICAL_SEARCH = False
+    # 批量删除时单次向量库删除操作涉及的文件数
+    DELETE_BATCH_SIZE = 500
+    # 每个知识库保留的最近查询条数
+    RECENT_QUERY_LIMIT = 200
+    # 同一文件 OCR 页进度的最小上报间隔（秒）
+    PAGE_PROGRESS_INTERVAL = 1.0
+
     def __init__(self, work_dir: str):
         """
         初始化知识库
@@ -42,8 +89,19 @@ class KnowledgeBase(ABC):
         import threading
 
         self.work_dir = work_dir
-        self.databases_meta: dict[str, dict] = {}
-        self.files_meta: dict[str, dict] = {}
+        self.databases_meta: MutableMapping[str, dict] = {}
+        self.files_meta: MutableMapping[str, dict] = {}
+
+        # 复用的嵌入模型实例 {(model, base_url, dimension): OtherEmbedding}
+        self._embedding_models: dict[tuple, OtherEmbedding] = {}
+        # 各知识库的关键词索引 {db_id: LexicalIndex}
+        self._lexical_indexes: dict[str, LexicalIndex] = {}
+        # 正在后台回填的关键词索引任务，每个知识库最多一个 {db_id: asyncio.Task}
+        self._lexical_backfill_tasks: dict[str, asyncio.Task] = {}
+        # 检索各阶段耗时统计 {stage: {"count", "total", "max"}}
+        self._stage_latency: dict[str, dict[str, float]] = {}
+        # 各知识库最近的查询文本，用于在知识库自身的查询上评估索引配置 {db_id: deque}
+        self._recent_queries: dict[str, deque[str]] = {}
 
         # 初始化类级别的锁
         if KnowledgeBase._processing_lock is None:
@@ -51,9 +109,8 @@ class KnowledgeBase(ABC):
 
         os.makedirs(work_dir, exist_ok=True)
 
-        # 自动加载元数据
+        # 自动加载元数据（各表在首次访问时才从磁盘读取）
         self._load_metadata()
-        self._normalize_metadata_state()
 
     @staticmethod
     def _normalize_timestamp(value: Any) -> str | None:
@@ -68,19 +125,254 @@ class KnowledgeBase(ABC):
             return None
         return utc_isoformat(dt_value)
 
-    def _normalize_metadata_state(self) -> None:
-        """Ensure in-memory metadata uses normalized timestamp formats."""
-        for meta in self.databases_meta.values():
-            if "created_at" in meta:
-                normalized = self._normalize_timestamp(meta.get("created_at"))
-                if normalized:
-                    meta["created_at"] = normalized
+    @classmethod
+    def _normalize_record(cls, record: dict) -> None:
+        """Ensure a metadata record uses normalized timestamp formats."""
+        if "created_at" in record:
+            normalized = cls._normalize_timestamp(record.get("created_at"))
+            if normalized:
+                record["created_at"] = normalized
+
+    async def _run_in_query_executor(self, func: Callable, *args, **kwargs) -> Any:
+        """在有界的查询线程池中执行阻塞调用"""
+        if KnowledgeBase._query_executor is None:
+            KnowledgeBase._query_executor = ThreadPoolExecutor(
+                max_workers=self.QUERY_EXECUTOR_WORKERS, thread_name_prefix="kb-query"
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(KnowledgeBase._query_executor, partial(func, *args, **kwargs))
+
+    def _get_embedding_model(self, embed_info: dict) -> OtherEmbedding:
+        """获取（并复用）知识库对应的嵌入模型，复用其连接池"""
+        config_dict = get_embedding_config(embed_info)
+        key = (config_dict.get("model"), config_dict.get("base_url"), config_dict.get("dimension"))
+        if key not in self._embedding_models:
+            self._embedding_models[key] = OtherEmbedding(
+                model=config_dict.get("model"),
+                base_url=config_dict.get("base_url"),
+                api_key=config_dict.get("api_key"),
+                dimension=config_dict.get("dimension"),
+                **{k: config_dict[k] for k in EMBED_OPTIONAL_PARAMS if k in config_dict},
+            )
+        return self._embedding_models[key]
+
+    async def aclose(self) -> None:
+        """停止后台回填，关闭复用的嵌入模型连接池（服务关闭时调用）"""
+        for task in self._lexical_backfill_tasks.values():
+            task.cancel()
+        for model in self._embedding_models.values():
+            await model.aclose()
+        self._embedding_models.clear()
+
+    def _get_lexical_index(self, db_id: str) -> LexicalIndex:
+        """获取知识库的关键词索引（位于知识库工作目录下）"""
+        if db_id not in self._lexical_indexes:
+            self._lexical_indexes[db_id] = LexicalIndex(os.path.join(self.work_dir, db_id, "lexical_index.db"))
+        return self._lexical_indexes[db_id]
+
+    def _schedule_lexical_backfill(self, db_id: str) -> None:
+        """
+        关键词索引尚未与向量库同步（早期版本创建的知识库）时，在后台从向量库回填
+
+        回填不在检索请求内执行，不受查询超时限制；回填完成前检索使用已写入的部分索引。
+        回填失败或进程退出后，下次调用时从上次记录的游标处继续。
+        """
+        task = self._lexical_backfill_tasks.get(db_id)
+        if (task is not None and not task.done()) or self._get_lexical_index(db_id).synced:
+            return
+
+        task = asyncio.create_task(self.backfill_lexical_index(db_id), name=f"lexical-backfill-{db_id}")
+        self._lexical_backfill_tasks[db_id] = task
+
+        def _on_done(done_task: asyncio.Task) -> None:
+            if self._lexical_backfill_tasks.get(db_id) is done_task:
+                del self._lexical_backfill_tasks[db_id]
+            if not done_task.cancelled() and (e := done_task.exception()) is not None:
+                logger.error(f"Failed to backfill lexical index for {db_id}: {e}")
+
+        task.add_done_callback(_on_done)
+
+    async def backfill_lexical_index(self, db_id: str) -> int:
+        """
+        从向量库分批读取知识库的分块写入关键词索引（chunk_id 已存在时覆盖），完成后标记为已同步
+
+        每批写入后保存回填游标，中断后从游标处继续；已删除文件的分块不写入。
+
+        Returns:
+            本次写入的分块数
+        """
+        lexical_index = self._get_lexical_index(db_id)
+        cursor = lexical_index.backfill_cursor
+        if cursor is not None:
+            logger.info(f"Resuming lexical index backfill for {db_id} from cursor {cursor}")
+
+        start = time.perf_counter()
+        total = 0
+        async for chunks, cursor in self._iter_stored_chunks(db_id, cursor):
+            chunks = [chunk for chunk in chunks if chunk.get("file_id") in self.files_meta]
+            if chunks:
+                total += await asyncio.to_thread(lexical_index.add_chunks, chunks)
+            await asyncio.to_thread(lexical_index.save_backfill_cursor, cursor)
+        await asyncio.to_thread(lexical_index.mark_synced)
+        logger.info(f"Backfilled lexical index for {db_id} with {total} chunks in {time.perf_counter() - start:.2f}s")
+        return total
+
+    def _iter_stored_chunks(self, db_id: str, cursor: str | None = None) -> AsyncIterator[tuple[list[dict], str]]:
+        """
+        分批读取向量库中知识库的全部分块，用于回填关键词索引
+
+        Args:
+            cursor: 上一批返回的游标，为 None 时从头读取
+
+        Returns:
+            异步迭代器，每批为 (包含 chunk_id、file_id、content、source、chunk_index 的分块列表, 读取下一批的游标)
+        """
+        raise KBOperationError(f"{self.kb_type} does not support lexical index backfill")
+
+    async def _add_chunks_to_lexical_index(self, db_id: str, chunks: list[dict]) -> None:
+        """将分块同步写入关键词索引，索引尚未同步时在后台回填已有分块"""
+        await asyncio.to_thread(self._get_lexical_index(db_id).add_chunks, chunks)
+        self._schedule_lexical_backfill(db_id)
+
+    async def _delete_file_from_lexical_index(self, db_id: str, file_id: str) -> None:
+        """从关键词索引中删除文件的分块"""
+        await self._delete_files_from_lexical_index(db_id, [file_id])
+
+    async def _delete_files_from_lexical_index(self, db_id: str, file_ids: list[str]) -> None:
+        """从关键词索引中删除多个文件的分块"""
+        try:
+            deleted = await asyncio.to_thread(self._get_lexical_index(db_id).delete_files, file_ids)
+            logger.info(f"Deleted {deleted} chunks for {len(file_ids)} files from lexical index")
+        except Exception as e:
+            logger.error(f"Error deleting files {file_ids[:10]} from lexical index: {e}")
+
+    def _record_stage_latency(self, stage: str, seconds: float) -> None:
+        """记录一次检索阶段（embed / search / keyword / rerank）的耗时"""
+        stats = self._stage_latency.setdefault(stage, {"count": 0, "total": 0.0, "max": 0.0})
+        stats["count"] += 1
+        stats["total"] += seconds
+        stats["max"] = max(stats["max"], seconds)
+
+    def get_query_latency_stats(self) -> dict[str, dict]:
+        """各检索阶段的调用次数、平均与最大耗时（毫秒）"""
+        return {
+            stage: {
+                "count": int(stats["count"]),
+                "avg_ms": round(stats["total"] / stats["count"] * 1000, 2) if stats["count"] else 0.0,
+                "max_ms": round(stats["max"] * 1000, 2),
+            }
+            for stage, stats in self._stage_latency.items()
+        }
+
+    async def _search_with_mode(
+        self, query_text: str, db_id: str, vector_search: Callable[..., Awaitable[list[dict]]], **kwargs
+    ) -> list[dict]:
+        """
+        按 search_mode 召回，并按需重排序
+
+        - search_mode: vector（默认，仅向量检索）/ keyword（仅 BM25 关键词检索）/
+          hybrid（两路召回后融合，fusion 为 rrf 或 weighted，hybrid_alpha 为向量检索一路的权重）
+        - use_rerank: 是否重排序，默认取系统配置 enable_reranker；开启后先召回 rerank_candidates 个候选，
+          重排序后截断为 top_k
+        - filter: 结构化过滤条件（file_ids / file_types / created_after / created_before / tags），
+          见 src.knowledge.utils.metadata_filter，向量检索在向量库内过滤，关键词检索按匹配的文件过滤
+
+        Args:
+            vector_search: 向量检索函数，签名与 aquery 一致
+        """
+        top_k = int(kwargs.get("top_k", 10))
+        use_rerank = kwargs.get("use_rerank", config.enable_reranker)
+        kwargs = {**kwargs, "filter": parse_filter(kwargs.get("filter"))}
+        self._recent_queries.setdefault(db_id, deque(maxlen=self.RECENT_QUERY_LIMIT)).append(query_text)
+
+        if use_rerank:
+            candidates = int(kwargs.get("rerank_candidates") or top_k * self.RERANK_CANDIDATE_FACTOR)
+            kwargs = {**kwargs, "top_k": max(candidates, top_k)}
+
+        results = await self._retrieve(query_text, db_id, vector_search, **kwargs)
+
+        if use_rerank and results:
+            results = await self._rerank(query_text, results)
+        return results[:top_k]
+
+    async def _retrieve(
+        self, query_text: str, db_id: str, vector_search: Callable[..., Awaitable[list[dict]]], **kwargs
+    ) -> list[dict]:
+        """按 search_mode 召回 top_k 个结果"""
+        search_mode = kwargs.get("search_mode", "vector")
+        if search_mode == "vector":
+            return await vector_search(query_text, db_id, **kwargs)
+
+        top_k = int(kwargs.get("top_k", 10))
+        lexical_index = self._get_lexical_index(db_id)
+        self._schedule_lexical_backfill(db_id)
+        file_ids = self._filter_file_ids(db_id, kwargs["filter"]) if kwargs.get("filter") else None
+
+        async def keyword_search(limit: int) -> list[dict]:
+            start = time.perf_counter()
+            results = await self._run_in_query_executor(lexical_index.search, query_text, limit, file_ids)
+            self._record_stage_latency("keyword", time.perf_counter() - start)
+            return results
+
+        if search_mode == "keyword":
+            return await keyword_search(top_k)
+
+        if search_mode != "hybrid":
+            raise ValueError(f"Unsupported search_mode: {search_mode}")
+
+        candidates = top_k * self.HYBRID_CANDIDATE_FACTOR
+        vector_results, keyword_results = await asyncio.gather(
+            vector_search(query_text, db_id, **{**kwargs, "top_k": candidates}),
+            keyword_search(candidates),
+        )
+
+        alpha = min(max(float(kwargs.get("hybrid_alpha", 0.5)), 0.0), 1.0)
+        weights = [alpha, 1 - alpha]
+        if kwargs.get("fusion", "rrf") == "weighted":
+            fused = weighted_score_fusion([vector_results, keyword_results], weights)
+        else:
+            fused = reciprocal_rank_fusion([vector_results, keyword_results], weights)
+
+        logger.debug(
+            f"Hybrid query on {db_id}: {len(vector_results)} vector + {len(keyword_results)} keyword "
+            f"candidates, {len(fused)} after fusion"
+        )
+        return fused[:top_k]
+
+    def _filter_file_ids(self, db_id: str, query_filter: dict) -> list[str]:
+        """按文件记录求满足过滤条件的文件"""
+        return [
+            file_id
+            for file_id, record in self.files_meta.items()
+            if record.get("database_id") == db_id and match_record({**record, "file_id": file_id}, query_filter)
+        ]
+
+    async def _rerank(self, query_text: str, results: list[dict]) -> list[dict]:
+        """
+        使用系统配置的重排序模型对候选重新打分并排序
+
+        原始召回得分保存在 retrieval_score 中；重排序失败时保持召回顺序。
+        """
+        start = time.perf_counter()
+        try:
+            reranker = get_reranker(config.reranker)
+            scores = await reranker.acompute_score(
+                [query_text, [result["content"] for result in results]],
+                batch_size=self.RERANK_BATCH_SIZE,
+                normalize=True,
+            )
+        except Exception as e:
+            logger.error(f"Rerank failed, falling back to retrieval order: {e}, {traceback.format_exc()}")
+            return results
+        finally:
+            self._record_stage_latency("rerank", time.perf_counter() - start)
 
-        for file_info in self.files_meta.values():
-            if "created_at" in file_info:
-                normalized = self._normalize_timestamp(file_info.get("created_at"))
-                if normalized:
-                    file_info["created_at"] = normalized
+        for result, score in zip(results, scores):
+            result["retrieval_score"] = result.get("score")
+            result["score"] = score
+
+        logger.debug(f"Reranked {len(results)} candidates in {(time.perf_counter() - start) * 1000:.1f} ms")
+        return sorted(results, key=lambda r: r["score"], reverse=True)
 
     @property
     @abstractmethod
@@ -151,6 +443,9 @@ class KnowledgeBase(ABC):
         # 创建工作目录
         working_dir = os.path.join(self.work_dir, db_id)
         os.makedirs(working_dir, exist_ok=True)
+        # 新建的知识库没有需要回填到关键词索引的分块
+        if self.SUPPORTS_LEXICAL_SEARCH:
+            self._get_lexical_index(db_id).mark_synced()
 
         # 返回数据库信息
         db_dict = self.databases_meta[db_id].copy()
@@ -179,6 +474,14 @@ class KnowledgeBase(ABC):
             del self.databases_meta[db_id]
             self._save_metadata()
 
+        # 停止回填并关闭关键词索引，释放文件句柄
+        backfill_task = self._lexical_backfill_tasks.pop(db_id, None)
+        if backfill_task is not None:
+            backfill_task.cancel()
+        lexical_index = self._lexical_indexes.pop(db_id, None)
+        if lexical_index is not None:
+            lexical_index.close()
+
         # 删除工作目录
         working_dir = os.path.join(self.work_dir, db_id)
         if os.path.exists(working_dir):
@@ -192,7 +495,9 @@ class KnowledgeBase(ABC):
         return {"message": "删除成功"}
 
     @abstractmethod
-    async def add_content(self, db_id: str, items: list[str], params: dict | None = None) -> list[dict]:
+    async def add_content(
+        self, db_id: str, items: list[str], params: dict | None = None, progress_callback=None
+    ) -> list[dict]:
         """
         添加内容（文件/URL）
 
@@ -200,12 +505,193 @@ class KnowledgeBase(ABC):
             db_id: 数据库ID
             items: 文件路径或URL列表
             params: 处理参数
+            progress_callback: 可选的异步回调 (done, total, file_record, page_progress)，每个条目处理完成后调用，
+                page_progress 为 None；PDF 本地 OCR 期间也会按页调用，page_progress 为 (已识别页数, 需识别页数)
 
         Returns:
             处理结果列表
         """
         pass
 
+    async def _parse_item_to_markdown(
+        self, item: str, content_type: str, params: dict, job: IngestJob | None = None, stream: bool = False
+    ) -> str | Iterator[str]:
+        """
+        将文件或 URL 解析为 markdown，解析过程信息（如执行了OCR的页码）写入文件记录
+
+        文件按 (内容哈希, 解析器, 解析参数) 复用解析结果缓存，params 中 use_parse_cache 为 False 时强制重新解析。
+        stream 为 True 时表格文件（CSV / Excel）返回逐行块读取的 markdown 块迭代器，由分块器直接消费，
+        不拼接整篇 markdown，也不经过解析缓存。
+        """
+        if content_type != "file":
+            return await process_url_to_markdown(item, params=params)
+
+        if stream and os.path.splitext(item)[1].lower() in TABLE_FILE_EXTENSIONS:
+            return iter_table_markdown_blocks(item)
+
+        filename = os.path.basename(item)
+        cache = get_parse_cache() if params.get("use_parse_cache", True) else None
+        content_hash = job.record.get("content_hash") if job is not None else None
+        cache_key = make_parse_key(content_hash, os.path.splitext(item)[1], params) if cache and content_hash else None
+
+        cached = await asyncio.to_thread(cache.get, cache_key) if cache_key else None
+        if cached is not None:
+            markdown_content, cached_filename, parse_info = cached
+            # markdown 以文件名作为标题，同一内容以不同文件名上传时替换标题
+            cached_title = f"# {cached_filename}\n"
+            if cached_filename != filename and markdown_content.startswith(cached_title):
+                markdown_content = f"# {filename}\n" + markdown_content[len(cached_title) :]
+            logger.info(f"Parse cache hit for {filename}, skipped parsing")
+        else:
+            parse_info = {}
+            markdown_content = await process_file_to_markdown(
+                item,
+                params=params,
+                parse_info=parse_info,
+                progress_callback=job.on_parse_progress if job is not None else None,
+            )
+            # 解析结果为空或有页面 OCR 失败时不缓存，下次入库重新解析
+            parse_failed = parse_info.get("ocr_failed_pages") or markdown_content.strip() == f"# {filename}"
+            if cache_key and not parse_failed:
+                await asyncio.to_thread(cache.put, cache_key, markdown_content, filename, parse_info)
+
+        if job is not None and parse_info:
+            job.record.update(parse_info)
+            if job.file_id in self.files_meta:
+                self.files_meta[job.file_id].update(parse_info)
+        return markdown_content
+
+    async def _ingest_items(
+        self,
+        db_id: str,
+        items: list[str],
+        params: dict,
+        stages: list[tuple[str, StageFunc]],
+        concurrency: dict[str, int] | None = None,
+        progress_callback=None,
+    ) -> list[dict]:
+        """
+        通过分阶段流水线并发处理多个条目，并维护 files_meta 中逐文件的状态
+
+        Args:
+            db_id: 数据库ID
+            items: 文件路径或URL列表
+            params: 处理参数，可通过 stage_concurrency 指定各阶段并发数
+            stages: 有序的 (阶段名, 阶段函数) 列表
+            concurrency: 知识库实现强制指定的阶段并发数，优先级高于 params
+            progress_callback: 可选的异步回调 (done, total, file_record, page_progress)，见 add_content
+
+        Returns:
+            处理结果列表，顺序与 items 一致
+        """
+        content_type = params.get("content_type", "file")
+        loop = asyncio.get_running_loop()
+
+        def page_progress_reporter(job: IngestJob) -> Callable[[int, int], None]:
+            """OCR 在解析线程中按页回调，节流后提交到事件循环更新进度"""
+            last_report = 0.0
+
+            def report(pages_done: int, pages_total: int) -> None:
+                nonlocal last_report
+                now = time.monotonic()
+                if pages_done < pages_total and now - last_report < self.PAGE_PROGRESS_INTERVAL:
+                    return
+                last_report = now
+                asyncio.run_coroutine_threadsafe(
+                    progress_callback(finished, total, job.record, (pages_done, pages_total)), loop
+                )
+
+            return report
+
+        jobs: list[IngestJob] = []
+        for item in items:
+            # 计算内容哈希需要读取整个文件，放到线程中避免阻塞事件循环
+            metadata = await asyncio.to_thread(prepare_item_metadata, item, content_type, db_id)
+            file_id = metadata["file_id"]
+            if params.get("tags"):
+                metadata["tags"] = normalize_tags(params["tags"])
+            self.files_meta[file_id] = metadata.copy()
+            self._add_to_processing_queue(file_id)
+            jobs.append(IngestJob(item=item, file_id=file_id, record=metadata))
+        self._save_metadata()
+        if progress_callback:
+            for job in jobs:
+                job.on_parse_progress = page_progress_reporter(job)
+
+        total = len(jobs)
+        finished = 0
+
+        async def on_job_done(job: IngestJob) -> None:
+            nonlocal finished
+            finished += 1
+
+            if job.error is None:
+                job.record["status"] = "done"
+                logger.info(f"Inserted {content_type} {job.item} into {self.kb_type}. Done.")
+            else:
+                job.record["status"] = "failed"
+                job.record["error"] = str(job.error)
+
+            # 文件可能在处理期间被删除，此时不再写回记录
+            if job.file_id in self.files_meta:
+                self.files_meta[job.file_id]["status"] = job.record["status"]
+                if job.error is not None:
+                    self.files_meta[job.file_id]["error"] = job.record["error"]
+                self._save_metadata()
+            self._remove_from_processing_queue(job.file_id)
+
+            if progress_callback:
+                await progress_callback(finished, total, job.record)
+
+        pipeline = IngestionPipeline(
+            stages,
+            concurrency={**params.get("stage_concurrency", {}), **(concurrency or {})},
+            queue_size=params.get("queue_size", DEFAULT_QUEUE_SIZE),
+            on_job_done=on_job_done,
+        )
+
+        try:
+            await pipeline.run(jobs)
+        finally:
+            # 流水线被中断（如任务取消）时，尚未完成的条目标记为失败
+            interrupted = [job for job in jobs if job.record.get("status") == "processing"]
+            for job in interrupted:
+                job.record["status"] = "failed"
+                job.record["error"] = "Processing interrupted"
+                if job.file_id in self.files_meta:
+                    self.files_meta[job.file_id]["status"] = "failed"
+                    self.files_meta[job.file_id]["error"] = "Processing interrupted"
+                self._remove_from_processing_queue(job.file_id)
+            if interrupted:
+                self._save_metadata()
+
+        return [job.record for job in jobs]
+
+    def _split_file_into_chunks(
+        self, text: str | Iterable[str], file_id: str, record: dict, params: dict
+    ) -> list[dict]:
+        """
+        分块，并为每个分块附加用于过滤检索的文件属性（file_type / created_at / tags）
+
+        text 为 markdown 文本，或 _parse_item_to_markdown 流式返回的 markdown 块迭代器。
+        """
+        chunks = self._split_text_into_chunks(text, file_id, record["filename"], params)
+        attributes = chunk_attributes(record)
+        for chunk in chunks:
+            chunk.update(attributes)
+        return chunks
+
+    def _iter_file_chunks(self, blocks: Iterable[str], file_id: str, record: dict, params: dict) -> Iterator[dict]:
+        """
+        流式分块：逐个输出附加了文件属性的分块，供写入阶段按窗口消费
+
+        blocks 为 _parse_item_to_markdown 流式返回的 markdown 块迭代器（不支持 QA 分割）。
+        """
+        attributes = chunk_attributes(record)
+        for chunk in iter_text_chunks(blocks, file_id, record["filename"], params):
+            chunk.update(attributes)
+            yield chunk
+
     @abstractmethod
     async def aquery(self, query_text: str, db_id: str, **kwargs) -> list[dict]:
         """
@@ -236,8 +722,6 @@ class KnowledgeBase(ABC):
         Returns:
             一个包含字典的列表，每个字典代表一个检索到的文档块。
         """
-        import asyncio
-
         logger.warning("query is deprecated, use aquery instead")
         return asyncio.run(self.aquery(query_text, db_id, **kwargs))
 
@@ -272,6 +756,7 @@ class KnowledgeBase(ABC):
                     "type": file_info.get("file_type", ""),
                     "status": file_info.get("status", "done"),
                     "created_at": created_at,
+                    "tags": file_info.get("tags", []),
                 }
 
         # 按创建时间倒序排序文件列表
@@ -315,6 +800,7 @@ class KnowledgeBase(ABC):
                         "type": file_info.get("file_type", ""),
                         "status": file_info.get("status", "done"),
                         "created_at": created_at,
+                        "tags": file_info.get("tags", []),
                     }
 
             # 按创建时间倒序排序文件列表
@@ -415,6 +901,133 @@ class KnowledgeBase(ABC):
         """
         pass
 
+    async def delete_files(self, db_id: str, file_ids: list[str]) -> dict:
+        """
+        批量删除文件
+
+        默认逐个调用 delete_file，向量库实现可覆盖为按批删除并只提交一次元数据。
+
+        Returns:
+            {"deleted": 已删除的文件ID列表, "failed": {文件ID: 错误信息}}
+        """
+        deleted, failed = [], {}
+        for file_id in dict.fromkeys(file_ids):
+            try:
+                await self.delete_file(db_id, file_id)
+                deleted.append(file_id)
+            except Exception as e:
+                logger.error(f"Error deleting file {file_id}: {e}")
+                failed[file_id] = str(e)
+        return {"deleted": deleted, "failed": failed}
+
+    def _remove_file_records(self, file_ids: list[str]) -> None:
+        """删除文件记录，所有变更一次提交"""
+        for file_id in file_ids:
+            self.files_meta.pop(file_id, None)
+        self._save_metadata()
+
+    async def update_file(self, db_id: str, file_id: str, item: str, params: dict | None = None) -> dict:
+        """
+        用新内容更新已入库的文件，按分块内容哈希增量更新
+
+        重新解析并分块后与已入库的分块比对：只向量化并写入新增的分块，只删除已不存在的分块，
+        内容未变的分块仅在序号变化时更新元数据。文件内容哈希未变化时直接跳过。
+        写入顺序为先新增后删除，中途失败时再次更新即可恢复一致。
+
+        Args:
+            db_id: 数据库ID
+            file_id: 文件ID
+            item: 新内容的文件路径或URL
+            params: 处理参数（与 add_content 相同）
+
+        Returns:
+            更新后的文件记录，update_stats 中记录新增、删除、未变化的分块数
+        """
+        if not self.SUPPORTS_INCREMENTAL_UPDATE:
+            raise KBOperationError(f"{self.kb_type} does not support incremental update")
+        if file_id not in self.files_meta:
+            raise ValueError(f"File not found: {file_id}")
+        if self._is_file_in_processing_queue(file_id):
+            raise KBOperationError(f"File {file_id} is being processed")
+
+        params = params or {}
+        content_type = params.get("content_type", "file")
+        record = dict(self.files_meta[file_id])
+
+        metadata = await asyncio.to_thread(prepare_item_metadata, item, content_type, db_id)
+        unchanged = metadata["content_hash"] and metadata["content_hash"] == record.get("content_hash")
+        if content_type == "file" and unchanged and record.get("status") == "done":
+            logger.info(f"Content of {file_id} is unchanged, skipped update")
+            return record
+
+        revision = record.get("revision", 0) + 1
+        record.update({key: metadata[key] for key in ("filename", "path", "file_type", "content_hash")})
+        if "tags" in params:
+            record["tags"] = normalize_tags(params["tags"])
+        record.update({"status": "processing", "updated_at": utc_isoformat()})
+        record.pop("error", None)
+        job = IngestJob(item=item, file_id=file_id, record=record)
+
+        self.files_meta[file_id] = record
+        self._add_to_processing_queue(file_id)
+        self._save_metadata()
+
+        try:
+            markdown_content = await self._parse_item_to_markdown(item, content_type, params, job)
+            chunks = await asyncio.to_thread(self._split_file_into_chunks, markdown_content, file_id, record, params)
+            stored = await self._get_file_chunks(db_id, file_id)
+            diff = diff_chunks(stored, chunks, revision)
+            await self._apply_chunk_diff(db_id, file_id, diff, params)
+
+            # 关键词索引写入成本很低，直接按新分块整体替换
+            await self._delete_file_from_lexical_index(db_id, file_id)
+            await self._add_chunks_to_lexical_index(db_id, diff.chunks)
+
+            record.update(
+                {
+                    "status": "done",
+                    "revision": revision,
+                    "update_stats": {
+                        "added": len(diff.added),
+                        "removed": len(diff.removed_ids),
+                        "moved": len(diff.moved),
+                        "unchanged": diff.unchanged_count,
+                    },
+                }
+            )
+            logger.info(f"Updated {file_id} in {self.kb_type}: {record['update_stats']}")
+        except Exception as e:
+            logger.error(f"Failed to update file {file_id}: {e}, {traceback.format_exc()}")
+            record.update({"status": "failed", "error": str(e)})
+        finally:
+            if file_id in self.files_meta:
+                self.files_meta[file_id] = record
+                self._save_metadata()
+            self._remove_from_processing_queue(file_id)
+
+        return record
+
+    async def reindex_database(self, db_id: str, index_profile: str, index_params: dict | None = None) -> dict:
+        """按新的索引配置重建知识库的向量索引"""
+        raise KBOperationError(f"{self.kb_type} does not support index profiles")
+
+    async def benchmark_index_profiles(self, db_id: str, profiles: list[str] | None = None, **kwargs) -> dict:
+        """在知识库自身的数据与查询上比较各索引配置的召回率与延迟"""
+        raise KBOperationError(f"{self.kb_type} does not support index profiles")
+
+    async def _get_file_chunks(self, db_id: str, file_id: str) -> list[dict]:
+        """
+        获取文件已入库的分块，用于增量更新
+
+        Returns:
+            分块列表 [{"id", "content", "chunk_index", "source"}]
+        """
+        raise NotImplementedError(f"{self.kb_type} does not support incremental update")
+
+    async def _apply_chunk_diff(self, db_id: str, file_id: str, diff: ChunkDiff, params: dict) -> None:
+        """将分块比对结果写入向量库：写入新增分块、更新移动的分块、删除已不存在的分块"""
+        raise NotImplementedError(f"{self.kb_type} does not support incremental update")
+
     @abstractmethod
     async def get_file_basic_info(self, db_id: str, file_id: str) -> dict:
         """
@@ -522,30 +1135,21 @@ class KnowledgeBase(ABC):
         return retrievers
 
     def _load_metadata(self):
-        """加载元数据"""
-        meta_file = os.path.join(self.work_dir, f"metadata_{self.kb_type}.json")
-        if os.path.exists(meta_file):
-            try:
-                with open(meta_file, encoding="utf-8") as f:
-                    data = json.load(f)
-                    self.databases_meta = data.get("databases", {})
-                    self.files_meta = data.get("files", {})
-                logger.info(f"Loaded {self.kb_type} metadata for {len(self.databases_meta)} databases")
-            except Exception as e:
-                logger.error(f"Failed to load {self.kb_type} metadata: {e}")
+        """加载元数据，首次启动时自动从旧版 JSON 文件迁移"""
+        store_path = os.path.join(self.work_dir, f"metadata_{self.kb_type}.db")
+        self._metadata_store = MetadataStore(store_path)
+        self.databases_meta = self._metadata_store.table("databases", normalizer=self._normalize_record)
+        self.files_meta = self._metadata_store.table("files", normalizer=self._normalize_record)
+
+        legacy_file = os.path.join(self.work_dir, f"metadata_{self.kb_type}.json")
+        try:
+            migrate_json_metadata(legacy_file, self._metadata_store, {"databases": "databases", "files": "files"})
+        except Exception as e:
+            logger.error(f"Failed to migrate {self.kb_type} metadata: {e}")
 
     def _save_metadata(self):
-        """保存元数据"""
-        self._normalize_metadata_state()
-        meta_file = os.path.join(self.work_dir, f"metadata_{self.kb_type}.json")
+        """保存元数据（仅写入发生变更的记录）"""
         try:
-            data = {
-                "databases": self.databases_meta,
-                "files": self.files_meta,
-                "kb_type": self.kb_type,
-                "updated_at": utc_isoformat(),
-            }
-            with open(meta_file, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            self._metadata_store.commit()
         except Exception as e:
             logger.error(f"Failed to save {self.kb_type} metadata: {e}")
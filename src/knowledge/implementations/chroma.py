@@ -1,27 +1,41 @@
 import asyncio
 import os
+import time
 import traceback
+from collections.abc import AsyncIterator, Iterable
 from typing import Any
 
 import chromadb
 from chromadb.config import Settings
 from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction
 
-from src.knowledge.base import KnowledgeBase
-from src.knowledge.indexing import process_file_to_markdown, process_url_to_markdown
+from src.knowledge.base import KBOperationError, KnowledgeBase
 from src.knowledge.utils.kb_utils import (
+    ChunkDiff,
+    aiter_windows,
     get_embedding_config,
-    prepare_item_metadata,
     split_text_into_chunks,
     split_text_into_qa_chunks,
 )
+from src.knowledge.utils.metadata_filter import CHROMA_TAG_PREFIX, to_chroma_where
 from src.utils import logger
 from src.utils.datetime_utils import utc_isoformat
 
+# 单次嵌入请求的默认批次大小，实际上限取模型配置中的 batch_size，被服务端拒绝时自动减小
+EMBED_BATCH_SIZE = 256
+# 单次写入 ChromaDB 的记录数
+WRITE_BATCH_SIZE = 1000
+# 集合元数据中的标记：集合创建时分块即带有 file_type / created_at / tag:* 过滤字段
+FILTER_FIELDS_FLAG = "filter_fields"
+
 
 class ChromaKB(KnowledgeBase):
     """基于 ChromaDB 的向量知识库实现"""
 
+    SUPPORTS_INCREMENTAL_UPDATE = True
+    SUPPORTS_METADATA_FILTER = True
+    SUPPORTS_LEXICAL_SEARCH = True
+
     def __init__(self, work_dir: str, **kwargs):
         """
         初始化 ChromaDB 知识库
@@ -93,6 +107,7 @@ class ChromaKB(KnowledgeBase):
                 "db_id": db_id,
                 "created_at": utc_isoformat(),
                 "embedding_model": embed_info.get("name") if embed_info else "default",
+                FILTER_FIELDS_FLAG: True,
             }
             collection = self.chroma_client.create_collection(
                 name=collection_name, embedding_function=embedding_function, metadata=collection_metadata
@@ -136,7 +151,9 @@ class ChromaKB(KnowledgeBase):
             logger.error(f"Traceback: {traceback.format_exc()}")
             return None
 
-    def _split_text_into_chunks(self, text: str, file_id: str, filename: str, params: dict) -> list[dict]:
+    def _split_text_into_chunks(
+        self, text: str | Iterable[str], file_id: str, filename: str, params: dict
+    ) -> list[dict]:
         """将文本分割成块"""
         # 检查是否使用QA分割模式
         use_qa_split = params.get("use_qa_split", False)
@@ -144,23 +161,47 @@ class ChromaKB(KnowledgeBase):
         if use_qa_split:
             # 使用QA分割模式
             qa_separator = params.get("qa_separator", "\n\n\n")
-            chunks = split_text_into_qa_chunks(text, file_id, filename, qa_separator, params)
+            return split_text_into_qa_chunks(text, file_id, filename, qa_separator, params)
         else:
             # 使用传统分割模式
-            chunks = split_text_into_chunks(text, file_id, filename, params)
-
-        # 为 ChromaDB 添加特定的 metadata 格式
-        for chunk in chunks:
-            chunk["metadata"] = {
-                "source": chunk["source"],
-                "chunk_id": chunk["chunk_id"],
-                "full_doc_id": file_id,
-                "chunk_type": chunk.get("chunk_type", "normal"),  # 添加chunk类型标识
-            }
-
-        return chunks
+            return split_text_into_chunks(text, file_id, filename, params)
+
+    @staticmethod
+    def _has_attribute_fields(collection) -> bool:
+        return bool((collection.metadata or {}).get(FILTER_FIELDS_FLAG))
+
+    @staticmethod
+    def _chunk_metadata(chunk: dict) -> dict:
+        """ChromaDB 的 metadata 格式，过滤字段中的标签（列表）存为多个布尔键"""
+        metadata = {
+            "source": chunk["source"],
+            "chunk_id": chunk["chunk_id"],
+            "full_doc_id": chunk["file_id"],
+            "chunk_index": chunk["chunk_index"],
+            "chunk_type": chunk.get("chunk_type", "normal"),  # 添加chunk类型标识
+        }
+        if "file_type" in chunk:
+            metadata["file_type"] = chunk["file_type"]
+            metadata["created_at"] = chunk["created_at"]
+        metadata.update({f"{CHROMA_TAG_PREFIX}{tag}": True for tag in chunk.get("tags", [])})
+        return metadata
+
+    @classmethod
+    async def _write_chunks(cls, collection, chunks: list[dict], embeddings: list[list[float]]) -> None:
+        """写入已计算向量的分块，写入时 Chroma 不再调用嵌入函数，仅按本地写入批次拆分"""
+        for i in range(0, len(chunks), WRITE_BATCH_SIZE):
+            batch = chunks[i : i + WRITE_BATCH_SIZE]
+            await asyncio.to_thread(
+                collection.add,
+                documents=[chunk["content"] for chunk in batch],
+                metadatas=[cls._chunk_metadata(chunk) for chunk in batch],
+                embeddings=embeddings[i : i + WRITE_BATCH_SIZE],
+                ids=[chunk["id"] for chunk in batch],
+            )
 
-    async def add_content(self, db_id: str, items: list[str], params: dict | None) -> list[dict]:
+    async def add_content(
+        self, db_id: str, items: list[str], params: dict | None = None, progress_callback=None
+    ) -> list[dict]:
         """添加内容（文件/URL）"""
         if db_id not in self.databases_meta:
             raise ValueError(f"Database {db_id} not found")
@@ -169,78 +210,157 @@ class ChromaKB(KnowledgeBase):
         if not collection:
             raise ValueError(f"Failed to get ChromaDB collection for {db_id}")
 
-        content_type = params.get("content_type", "file") if params else "file"
-        processed_items_info = []
+        params = params or {}
+        content_type = params.get("content_type", "file")
 
-        for item in items:
-            # 准备文件元数据
-            metadata = prepare_item_metadata(item, content_type, db_id)
-            file_id = metadata["file_id"]
-            filename = metadata["filename"]
+        async def parse(job, _):
+            # QA 分割需要完整文本，其余情况下表格文件按行块流式交给分块器
+            stream = not params.get("use_qa_split", False)
+            return await self._parse_item_to_markdown(job.item, content_type, params, job, stream=stream)
 
-            # 添加文件记录
-            file_record = metadata.copy()
-            self.files_meta[file_id] = file_record
-            self._save_metadata()
+        async def chunk(job, markdown_content):
+            if not isinstance(markdown_content, str):
+                # 流式解析的 markdown 块在写入阶段按窗口分块与向量化，内存中不保留整个文件的分块
+                return self._iter_file_chunks(markdown_content, job.file_id, job.record, params)
 
-            self._add_to_processing_queue(file_id)
-            try:
-                # 根据内容类型处理内容
-                if content_type == "file":
-                    markdown_content = await process_file_to_markdown(item, params=params)
-                else:  # URL
-                    markdown_content = await process_url_to_markdown(item, params=params)
-
-                # 分割文本成块
-                chunks = self._split_text_into_chunks(markdown_content, file_id, filename, params)
-                logger.info(f"Split {filename} into {len(chunks)} chunks")
-
-                # 准备向量数据库插入的数据
-                if chunks:
-                    documents = [chunk["content"] for chunk in chunks]
-                    metadatas = [chunk["metadata"] for chunk in chunks]
-                    ids = [chunk["id"] for chunk in chunks]
-
-                    # 插入到 ChromaDB - 分批处理以避免超出 OpenAI 批次大小限制
-                    batch_size = 10  # 适配不同 API 的批次大小限制（如通义千问等）
-                    total_batches = (len(chunks) + batch_size - 1) // batch_size
-
-                    for i in range(0, len(chunks), batch_size):
-                        batch_documents = documents[i : i + batch_size]
-                        batch_metadatas = metadatas[i : i + batch_size]
-                        batch_ids = ids[i : i + batch_size]
-
-                        await asyncio.to_thread(
-                            collection.add,
-                            documents=batch_documents,
-                            metadatas=batch_metadatas,
-                            ids=batch_ids,
+            chunks = await asyncio.to_thread(
+                self._split_file_into_chunks, markdown_content, job.file_id, job.record, params
+            )
+            logger.info(f"Split {job.record['filename']} into {len(chunks)} chunks")
+            return chunks
+
+        embed_info = self.databases_meta[db_id].get("embed_info", {})
+        embedding_model = self._get_embedding_model(embed_info)
+
+        async def embed(job, chunks):
+            if not isinstance(chunks, list):
+                # 流式分块在写入阶段按窗口向量化
+                return chunks, None
+            if not chunks:
+                return chunks, []
+
+            # 使用项目的异步嵌入模型预先计算向量：批次大小按模型配置自适应，多个批次并发请求
+            embeddings = await embedding_model.abatch_encode(
+                [chunk["content"] for chunk in chunks], batch_size=EMBED_BATCH_SIZE
+            )
+            logger.info(f"Embedded {len(chunks)} chunks for {job.record['filename']}")
+            return chunks, embeddings
+
+        async def write(job, payload):
+            chunks, embeddings = payload
+            if embeddings is None:
+                written = 0
+                try:
+                    async for window_chunks in aiter_windows(chunks, WRITE_BATCH_SIZE):
+                        window_embeddings = await embedding_model.abatch_encode(
+                            [chunk["content"] for chunk in window_chunks], batch_size=EMBED_BATCH_SIZE
                         )
+                        await self._write_chunks(collection, window_chunks, window_embeddings)
+                        await self._add_chunks_to_lexical_index(db_id, window_chunks)
+                        written += len(window_chunks)
+                except Exception:
+                    # 前面的窗口已经写入，清理后再将文件标记为失败，避免残留的部分分块被检索到
+                    await asyncio.to_thread(collection.delete, where={"full_doc_id": job.file_id})
+                    await self._delete_files_from_lexical_index(db_id, [job.file_id])
+                    raise
+                logger.info(f"Streamed {written} chunks into ChromaDB for {job.record['filename']}")
+                return None
 
-                        batch_num = i // batch_size + 1
-                        logger.info(f"Processed batch {batch_num}/{total_batches} for {filename}")
+            if not chunks:
+                return None
 
-                logger.info(f"Inserted {content_type} {item} into ChromaDB. Done.")
+            await self._write_chunks(collection, chunks, embeddings)
 
-                # 更新状态为完成
-                self.files_meta[file_id]["status"] = "done"
-                self._save_metadata()
-                file_record["status"] = "done"
+            await self._add_chunks_to_lexical_index(db_id, chunks)
 
-            except Exception as e:
-                logger.error(f"处理{content_type} {item} 失败: {e}, {traceback.format_exc()}")
-                self.files_meta[file_id]["status"] = "failed"
-                self._save_metadata()
-                file_record["status"] = "failed"
-            finally:
-                self._remove_from_processing_queue(file_id)
+            logger.info(f"Inserted {len(chunks)} chunks into ChromaDB for {job.record['filename']}")
+            return None
+
+        stages = [("parse", parse), ("chunk", chunk), ("embed", embed), ("write", write)]
+        return await self._ingest_items(db_id, items, params, stages, progress_callback=progress_callback)
+
+    async def _iter_stored_chunks(self, db_id: str, cursor: str | None = None) -> AsyncIterator[tuple[list[dict], str]]:
+        """分批读取集合中的分块，用于回填关键词索引，游标为已读取的分块数"""
+        collection = await self._get_chroma_collection(db_id)
+        if not collection:
+            raise ValueError(f"Failed to get ChromaDB collection for {db_id}")
+
+        offset = int(cursor) if cursor is not None else 0
+        while True:
+            results = await asyncio.to_thread(
+                collection.get, include=["documents", "metadatas"], limit=WRITE_BATCH_SIZE, offset=offset
+            )
+            ids = results.get("ids") or []
+            if not ids:
+                return
+
+            offset += len(ids)
+            chunks = [
+                {
+                    "chunk_id": metadata.get("chunk_id", chunk_id),
+                    "file_id": metadata.get("full_doc_id"),
+                    "content": content,
+                    "source": metadata.get("source"),
+                    "chunk_index": metadata.get("chunk_index"),
+                }
+                for chunk_id, content, metadata in zip(ids, results["documents"], results["metadatas"])
+            ]
+            yield chunks, str(offset)
+
+    async def _get_file_chunks(self, db_id: str, file_id: str) -> list[dict]:
+        """获取文件已入库的分块"""
+        collection = await self._get_chroma_collection(db_id)
+        if not collection:
+            raise ValueError(f"Failed to get ChromaDB collection for {db_id}")
 
-            processed_items_info.append(file_record)
+        results = await asyncio.to_thread(
+            collection.get, where={"full_doc_id": file_id}, include=["documents", "metadatas"]
+        )
+        return [
+            {
+                "id": chunk_id,
+                "content": document,
+                "chunk_index": (metadata or {}).get("chunk_index"),
+                "source": (metadata or {}).get("source"),
+            }
+            for chunk_id, document, metadata in zip(results["ids"], results["documents"], results["metadatas"])
+        ]
 
-        return processed_items_info
+    async def _apply_chunk_diff(self, db_id: str, file_id: str, diff: ChunkDiff, params: dict) -> None:
+        """写入新增分块、更新移动分块的元数据、删除已不存在的分块"""
+        collection = await self._get_chroma_collection(db_id)
+        if not collection:
+            raise ValueError(f"Failed to get ChromaDB collection for {db_id}")
+
+        if diff.added:
+            embed_info = self.databases_meta[db_id].get("embed_info", {})
+            embedding_model = self._get_embedding_model(embed_info)
+            embeddings = await embedding_model.abatch_encode(
+                [chunk["content"] for chunk in diff.added], batch_size=EMBED_BATCH_SIZE
+            )
+            await self._write_chunks(collection, diff.added, embeddings)
+
+        for i in range(0, len(diff.moved), WRITE_BATCH_SIZE):
+            batch = diff.moved[i : i + WRITE_BATCH_SIZE]
+            await asyncio.to_thread(
+                collection.update,
+                ids=[chunk["id"] for chunk in batch],
+                metadatas=[self._chunk_metadata(chunk) for chunk in batch],
+            )
+
+        for i in range(0, len(diff.removed_ids), WRITE_BATCH_SIZE):
+            await asyncio.to_thread(collection.delete, ids=diff.removed_ids[i : i + WRITE_BATCH_SIZE])
 
     async def aquery(self, query_text: str, db_id: str, **kwargs) -> list[dict]:
-        """异步查询知识库"""
+        """异步查询知识库，支持 vector / keyword / hybrid 三种检索模式"""
+        return await self._search_with_mode(query_text, db_id, self._vector_query, **kwargs)
+
+    async def _vector_query(self, query_text: str, db_id: str, **kwargs) -> list[dict]:
+        """
+        向量检索，filter 转换为 where 子句在 ChromaDB 内过滤
+
+        早期版本创建的集合中分块没有过滤字段，按文件记录求出匹配的文件后按 full_doc_id 过滤
+        """
         collection = await self._get_chroma_collection(db_id)
         if not collection:
             raise ValueError(f"Database {db_id} not found")
@@ -249,9 +369,28 @@ class ChromaKB(KnowledgeBase):
             top_k = kwargs.get("top_k", 10)
             similarity_threshold = kwargs.get("similarity_threshold", 0.0)
 
-            results = collection.query(
-                query_texts=[query_text], n_results=top_k, include=["documents", "metadatas", "distances"]
+            query_filter = kwargs.get("filter")
+            if query_filter and not self._has_attribute_fields(collection) and set(query_filter) != {"file_ids"}:
+                query_filter = {"file_ids": self._filter_file_ids(db_id, query_filter)}
+                if not query_filter["file_ids"]:
+                    return []
+
+            # 使用项目的异步嵌入模型计算查询向量，向量检索在查询线程池中执行
+            embed_info = self.databases_meta[db_id].get("embed_info", {})
+            embedding_model = self._get_embedding_model(embed_info)
+            start = time.perf_counter()
+            query_embedding = await embedding_model.aencode_queries([query_text])
+            self._record_stage_latency("embed", time.perf_counter() - start)
+
+            start = time.perf_counter()
+            results = await self._run_in_query_executor(
+                collection.query,
+                query_embeddings=query_embedding,
+                n_results=top_k,
+                where=to_chroma_where(query_filter),
+                include=["documents", "metadatas", "distances"],
             )
+            self._record_stage_latency("search", time.perf_counter() - start)
 
             if not results or not results.get("documents") or not results["documents"][0]:
                 return []
@@ -283,24 +422,32 @@ class ChromaKB(KnowledgeBase):
 
     async def delete_file(self, db_id: str, file_id: str) -> None:
         """删除文件"""
-        collection = await self._get_chroma_collection(db_id)
-        if collection:
-            try:
-                # 查找所有相关的chunks
-                results = collection.get(where={"full_doc_id": file_id}, include=["metadatas"])
+        result = await self.delete_files(db_id, [file_id])
+        if result["failed"]:
+            raise KBOperationError(result["failed"][file_id])
 
-                # 删除所有相关chunks
-                if results and results.get("ids"):
-                    collection.delete(ids=results["ids"])
-                    logger.info(f"Deleted {len(results['ids'])} chunks for file {file_id}")
+    async def delete_files(self, db_id: str, file_ids: list[str]) -> dict:
+        """批量删除文件：按文件ID集合分批删除分块，元数据只提交一次"""
+        file_ids = list(dict.fromkeys(file_ids))
+        deleted, failed = [], {}
 
+        collection = await self._get_chroma_collection(db_id)
+        for i in range(0, len(file_ids), self.DELETE_BATCH_SIZE):
+            batch = file_ids[i : i + self.DELETE_BATCH_SIZE]
+            try:
+                if collection:
+                    await asyncio.to_thread(collection.delete, where={"full_doc_id": {"$in": batch}})
+                deleted.extend(batch)
             except Exception as e:
-                logger.error(f"Error deleting file {file_id} from ChromaDB: {e}")
+                logger.error(f"Error deleting {len(batch)} files from ChromaDB: {e}")
+                failed.update(dict.fromkeys(batch, str(e)))
+
+        if deleted:
+            await self._delete_files_from_lexical_index(db_id, deleted)
+            self._remove_file_records(deleted)
+            logger.info(f"Deleted {len(deleted)} files from ChromaDB {db_id}")
 
-        # 删除文件记录
-        if file_id in self.files_meta:
-            del self.files_meta[file_id]
-            self._save_metadata()
+        return {"deleted": deleted, "failed": failed}
 
     async def get_file_basic_info(self, db_id: str, file_id: str) -> dict:
         """获取文件基本信息（仅元数据）"""
@@ -9,8 +9,7 @@ from neo4j import GraphDatabase
 from pymilvus import connections, utility
 
 from src.knowledge.base import KnowledgeBase
-from src.knowledge.indexing import process_file_to_markdown, process_url_to_markdown
-from src.knowledge.utils.kb_utils import get_embedding_config, prepare_item_metadata
+from src.knowledge.utils.kb_utils import get_embedding_config
 from src.utils import hashstr, logger
 from src.utils.datetime_utils import shanghai_now
 
@@ -216,7 +215,9 @@ class LightRagKB(KnowledgeBase):
             ),
         )
 
-    async def add_content(self, db_id: str, items: list[str], params: dict | None = None) -> list[dict]:
+    async def add_content(
+        self, db_id: str, items: list[str], params: dict | None = None, progress_callback=None
+    ) -> list[dict]:
         """添加内容（文件/URL）"""
         if db_id not in self.databases_meta:
             raise ValueError(f"Database {db_id} not found")
@@ -225,54 +226,26 @@ class LightRagKB(KnowledgeBase):
         if not rag:
             raise ValueError(f"Failed to get LightRAG instance for {db_id}")
 
-        content_type = params.get("content_type", "file") if params else "file"
-        processed_items_info = []
+        params = params or {}
+        content_type = params.get("content_type", "file")
 
-        for item in items:
-            # 准备文件元数据
-            metadata = prepare_item_metadata(item, content_type, db_id)
-            file_id = metadata["file_id"]
-            item_path = metadata["path"]
+        async def parse(job, _):
+            markdown_content = await self._parse_item_to_markdown(job.item, content_type, params, job)
+            markdown_content_lines = markdown_content[:100].replace("\n", " ")
+            logger.info(f"Markdown content: {markdown_content_lines}...")
+            return markdown_content
 
-            # 添加文件记录
-            file_record = metadata.copy()
-            self.files_meta[file_id] = file_record
-            self._save_metadata()
-
-            self._add_to_processing_queue(file_id)
-            try:
-                # 根据内容类型处理内容
-                if content_type == "file":
-                    markdown_content = await process_file_to_markdown(item, params=params)
-                    markdown_content_lines = markdown_content[:100].replace("\n", " ")
-                    logger.info(f"Markdown content: {markdown_content_lines}...")
-                else:  # URL
-                    markdown_content = await process_url_to_markdown(item, params=params)
-
-                # 使用 LightRAG 插入内容
-                await rag.ainsert(input=markdown_content, ids=file_id, file_paths=item_path)
-
-                logger.info(f"Inserted {content_type} {item} into LightRAG. Done.")
-
-                # 更新状态为完成
-                self.files_meta[file_id]["status"] = "done"
-                self._save_metadata()
-                file_record["status"] = "done"
+        async def write(job, markdown_content):
+            # LightRAG 内部完成分块、向量化与图谱抽取
+            await rag.ainsert(input=markdown_content, ids=job.file_id, file_paths=job.record["path"])
+            return None
 
-            except Exception as e:
-                error_msg = str(e)
-                logger.error(f"处理{content_type} {item} 失败: {error_msg}, {traceback.format_exc()}")
-                self.files_meta[file_id]["status"] = "failed"
-                self.files_meta[file_id]["error"] = error_msg
-                self._save_metadata()
-                file_record["status"] = "failed"
-                file_record["error"] = error_msg
-            finally:
-                self._remove_from_processing_queue(file_id)
-
-            processed_items_info.append(file_record)
-
-        return processed_items_info
+        # LightRAG 的文档处理管线是全局串行的，并发调用 ainsert 会导致文档被合并到正在运行的批次中，
+        # 在真正处理完成前就返回，因此写入阶段固定为单并发
+        stages = [("parse", parse), ("write", write)]
+        return await self._ingest_items(
+            db_id, items, params, stages, concurrency={"write": 1}, progress_callback=progress_callback
+        )
 
     async def aquery(self, query_text: str, db_id: str, **kwargs) -> str:
         """异步查询知识库"""
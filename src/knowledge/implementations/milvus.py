@@ -1,28 +1,65 @@
 import asyncio
+import itertools
+import json
 import os
+import shutil
+import tempfile
+import time
 import traceback
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterable, Iterator
 from functools import partial
 from typing import Any
 
-from pymilvus import Collection, CollectionSchema, DataType, FieldSchema, connections, db, utility
+from pymilvus import BulkInsertState, Collection, CollectionSchema, DataType, FieldSchema, connections, db, utility
 
-from src.knowledge.base import KnowledgeBase
-from src.knowledge.indexing import process_file_to_markdown, process_url_to_markdown
+from src.knowledge.base import KBOperationError, KnowledgeBase
+from src.knowledge.implementations.milvus_index import (
+    INDEX_PROFILES,
+    IndexProfile,
+    profile_from_metadata,
+    resolve_consistency_level,
+    resolve_index_profile,
+    resolve_partition_key,
+)
 from src.knowledge.utils.kb_utils import (
-    get_embedding_config,
-    prepare_item_metadata,
+    ChunkDiff,
+    aiter_windows,
     split_text_into_chunks,
     split_text_into_qa_chunks,
 )
-from src.models.embed import OtherEmbedding
+from src.knowledge.utils.metadata_filter import (
+    chunk_attributes,
+    decode_milvus_tags,
+    encode_milvus_tags,
+    to_milvus_expr,
+)
 from src.utils import hashstr, logger
 
 MILVUS_AVAILABLE = True
 
+# 每个窗口向量化并写入的分块数
+DEFAULT_INSERT_WINDOW = 512
+# 单个文件分块数达到该值时改用 bulk insert 导入（需要 Milvus 的对象存储可访问），0 表示禁用
+DEFAULT_BULK_IMPORT_THRESHOLD = 0
+# 用于过滤检索的标量字段，早期版本创建的集合没有这些字段
+ATTRIBUTE_FIELDS = ("file_type", "created_at", "tags")
+# Milvus 使用的对象存储桶（standalone 默认为 a-bucket），bulk insert 的文件需上传至此
+MILVUS_BULK_BUCKET = os.getenv("MILVUS_BULK_BUCKET", "a-bucket")
+
+
+def _iter_windows(chunks: Iterable[dict], size: int) -> Iterator[list[dict]]:
+    iterator = iter(chunks)
+    while window := list(itertools.islice(iterator, size)):
+        yield window
+
 
 class MilvusKB(KnowledgeBase):
     """基于 Milvus 的生产级向量知识库实现"""
 
+    SUPPORTS_INCREMENTAL_UPDATE = True
+    SUPPORTS_METADATA_FILTER = True
+    SUPPORTS_LEXICAL_SEARCH = True
+
     def __init__(self, work_dir: str, **kwargs):
         """
         初始化 Milvus 知识库
@@ -53,6 +90,9 @@ class MilvusKB(KnowledgeBase):
         self.chunk_size = kwargs.get("chunk_size", 1000)
         self.chunk_overlap = kwargs.get("chunk_overlap", 200)
 
+        # 各知识库的索引配置 {db_id: IndexProfile}
+        self._index_profiles: dict[str, IndexProfile] = {}
+
         # 元数据锁
         self._metadata_lock = asyncio.Lock()
 
@@ -117,34 +157,59 @@ class MilvusKB(KnowledgeBase):
         except Exception:
             # 创建新集合
             embedding_dim = embed_info.get("dimension", 1024) if embed_info else 1024
-            model_name = embed_info.get("name", "default") if embed_info else "default"
-
-            # 定义集合Schema
-            fields = [
-                FieldSchema(name="id", dtype=DataType.VARCHAR, max_length=100, is_primary=True),
-                FieldSchema(name="content", dtype=DataType.VARCHAR, max_length=65535),
-                FieldSchema(name="source", dtype=DataType.VARCHAR, max_length=500),
-                FieldSchema(name="chunk_id", dtype=DataType.VARCHAR, max_length=100),
-                FieldSchema(name="file_id", dtype=DataType.VARCHAR, max_length=100),
-                FieldSchema(name="chunk_index", dtype=DataType.INT64),
-                FieldSchema(name="embedding", dtype=DataType.FLOAT_VECTOR, dim=embedding_dim),
-            ]
-
-            schema = CollectionSchema(
-                fields=fields, description=f"Knowledge base collection for {db_id} using {model_name}"
-            )
-
-            # 创建集合
+            profile = self._get_index_profile(db_id)
+            schema = self._build_schema(db_id, embedding_dim, profile)
             collection = Collection(name=collection_name, schema=schema, using=self.connection_alias)
 
             # 创建索引
-            index_params = {"metric_type": "COSINE", "index_type": "IVF_FLAT", "params": {"nlist": 1024}}
-            collection.create_index("embedding", index_params)
+            collection.create_index("embedding", profile.index_params(embedding_dim))
 
-            logger.info(f"Created new Milvus collection: {collection_name}")
+            logger.info(f"Created new Milvus collection: {collection_name} with index profile {profile.name}")
 
         return collection
 
+    def _build_schema(self, db_id: str, embedding_dim: int, profile: IndexProfile) -> CollectionSchema:
+        """集合 Schema，向量字段的存储类型由索引配置决定，file_id 可作为分区键"""
+        embed_info = self.databases_meta[db_id].get("embed_info", {})
+        model_name = embed_info.get("name", "default") if embed_info else "default"
+        partition_key = resolve_partition_key((self.databases_meta[db_id].get("metadata") or {}).get("partition_key"))
+
+        fields = [
+            FieldSchema(name="id", dtype=DataType.VARCHAR, max_length=100, is_primary=True),
+            FieldSchema(name="content", dtype=DataType.VARCHAR, max_length=65535),
+            FieldSchema(name="source", dtype=DataType.VARCHAR, max_length=500),
+            FieldSchema(name="chunk_id", dtype=DataType.VARCHAR, max_length=100),
+            FieldSchema(
+                name="file_id", dtype=DataType.VARCHAR, max_length=100, is_partition_key=partition_key == "file_id"
+            ),
+            FieldSchema(name="chunk_index", dtype=DataType.INT64),
+            FieldSchema(name="file_type", dtype=DataType.VARCHAR, max_length=32),
+            FieldSchema(name="created_at", dtype=DataType.INT64),
+            FieldSchema(name="tags", dtype=DataType.VARCHAR, max_length=8192),
+            profile.field_schema(embedding_dim),
+        ]
+        return CollectionSchema(fields=fields, description=f"Knowledge base collection for {db_id} using {model_name}")
+
+    def _get_index_profile(self, db_id: str) -> IndexProfile:
+        """知识库的索引配置（创建时的 index_profile / index_params）"""
+        if db_id not in self._index_profiles:
+            metadata = self.databases_meta[db_id].get("metadata") if db_id in self.databases_meta else None
+            self._index_profiles[db_id] = profile_from_metadata(metadata)
+        return self._index_profiles[db_id]
+
+    def _get_consistency_level(self, db_id: str, level: str | None = None) -> str:
+        """本次查询的一致性级别，未指定时使用知识库创建时配置的 consistency_level"""
+        metadata = self.databases_meta[db_id].get("metadata") or {}
+        return resolve_consistency_level(level, resolve_consistency_level(metadata.get("consistency_level")))
+
+    @staticmethod
+    def _has_attribute_fields(collection) -> bool:
+        return "file_type" in {field.name for field in collection.schema.fields}
+
+    @staticmethod
+    def _embedding_dim(collection) -> int:
+        return next(field.params["dim"] for field in collection.schema.fields if field.name == "embedding")
+
     async def _initialize_kb_instance(self, instance: Any) -> None:
         """初始化 Milvus 集合（加载到内存）"""
         try:
@@ -155,24 +220,12 @@ class MilvusKB(KnowledgeBase):
 
     def _get_async_embedding_function(self, embed_info: dict):
         """获取 embedding 函数"""
-        config_dict = get_embedding_config(embed_info)
-        embedding_model = OtherEmbedding(
-            model=config_dict.get("model"),
-            base_url=config_dict.get("base_url"),
-            api_key=config_dict.get("api_key"),
-        )
-
+        embedding_model = self._get_embedding_model(embed_info)
         return partial(embedding_model.abatch_encode, batch_size=40)
 
     def _get_embedding_function(self, embed_info: dict):
         """获取 embedding 函数"""
-        config_dict = get_embedding_config(embed_info)
-        embedding_model = OtherEmbedding(
-            model=config_dict.get("model"),
-            base_url=config_dict.get("base_url"),
-            api_key=config_dict.get("api_key"),
-        )
-
+        embedding_model = self._get_embedding_model(embed_info)
         return partial(embedding_model.batch_encode, batch_size=40)
 
     async def _get_milvus_collection(self, db_id: str):
@@ -196,7 +249,9 @@ class MilvusKB(KnowledgeBase):
             logger.error(f"Traceback: {traceback.format_exc()}")
             return None
 
-    def _split_text_into_chunks(self, text: str, file_id: str, filename: str, params: dict) -> list[dict]:
+    def _split_text_into_chunks(
+        self, text: str | Iterable[str], file_id: str, filename: str, params: dict
+    ) -> list[dict]:
         """将文本分割成块"""
         # 检查是否使用QA分割模式
         use_qa_split = params.get("use_qa_split", False)
@@ -209,7 +264,9 @@ class MilvusKB(KnowledgeBase):
             # 使用传统分割模式
             return split_text_into_chunks(text, file_id, filename, params)
 
-    async def add_content(self, db_id: str, items: list[str], params: dict | None = {}) -> list[dict]:
+    async def add_content(
+        self, db_id: str, items: list[str], params: dict | None = None, progress_callback=None
+    ) -> list[dict]:
         """添加内容（文件/URL）"""
         if db_id not in self.databases_meta:
             raise ValueError(f"Database {db_id} not found")
@@ -221,79 +278,247 @@ class MilvusKB(KnowledgeBase):
         embed_info = self.databases_meta[db_id].get("embed_info", {})
         embedding_function = self._get_async_embedding_function(embed_info)
 
-        content_type = params.get("content_type", "file") if params else "file"
-        processed_items_info = []
+        params = params or {}
+        content_type = params.get("content_type", "file")
+        insert_window = max(1, int(params.get("insert_window", DEFAULT_INSERT_WINDOW)))
+        flush_policy = params.get("flush_policy", "auto")
+        bulk_import_threshold = int(params.get("bulk_import_threshold", DEFAULT_BULK_IMPORT_THRESHOLD))
 
-        for item in items:
-            metadata = prepare_item_metadata(item, content_type, db_id)
-            file_id = metadata["file_id"]
-            filename = metadata["filename"]
+        async def parse(job, _):
+            # QA 分割需要完整文本，其余情况下表格文件按行块流式交给分块器
+            stream = not params.get("use_qa_split", False)
+            return await self._parse_item_to_markdown(job.item, content_type, params, job, stream=stream)
 
-            file_record = metadata.copy()
-            del file_record["file_id"]
-            async with self._metadata_lock:
-                self.files_meta[file_id] = file_record
-                self._save_metadata()
+        async def chunk(job, markdown_content):
+            if not isinstance(markdown_content, str):
+                # 流式解析的 markdown 块在写入阶段按窗口分块，内存中不保留整个文件的分块
+                return self._iter_file_chunks(markdown_content, job.file_id, job.record, params)
 
-            file_record["file_id"] = file_id
+            chunks = await asyncio.to_thread(
+                self._split_file_into_chunks, markdown_content, job.file_id, job.record, params
+            )
+            logger.info(f"Split {job.record['filename']} into {len(chunks)} chunks")
+            return chunks
+
+        async def write(job, chunks):
+            if not chunks:
+                return None
+
+            # bulk insert 的列文件按 float32 向量写入，压缩存储的集合与流式分块仍使用流式写入
+            bulk_imported = False
+            if (
+                bulk_import_threshold
+                and isinstance(chunks, list)
+                and len(chunks) >= bulk_import_threshold
+                and self._get_index_profile(db_id).vector_type == "float"
+            ):
+                try:
+                    await self._bulk_import_chunks(collection, job.file_id, chunks, embedding_function, insert_window)
+                    bulk_imported = True
+                except Exception as e:
+                    # 对象存储不可用或导入失败时清理可能残留的数据，改用流式写入
+                    logger.warning(f"Bulk import of {job.file_id} failed, falling back to streaming insert: {e}")
+                    await asyncio.to_thread(collection.delete, expr=f'file_id == "{job.file_id}"')
+
+            if bulk_imported:
+                await self._add_chunks_to_lexical_index(db_id, chunks)
+            else:
+                try:
+                    inserted = await self._stream_insert_chunks(
+                        collection,
+                        chunks,
+                        embedding_function,
+                        insert_window,
+                        on_window=partial(self._add_chunks_to_lexical_index, db_id),
+                    )
+                except Exception:
+                    # 前面的窗口已经写入，清理后再将文件标记为失败，避免残留的部分分块被检索到
+                    await asyncio.to_thread(collection.delete, expr=f'file_id == "{job.file_id}"')
+                    await self._delete_files_from_lexical_index(db_id, [job.file_id])
+                    raise
+                if not isinstance(chunks, list):
+                    logger.info(f"Streamed {inserted} chunks of {job.record['filename']} into {collection.name}")
+
+            if flush_policy == "file":
+                await asyncio.to_thread(collection.flush)
+            return None
 
-            # 添加到处理队列
-            self._add_to_processing_queue(file_id)
+        stages = [("parse", parse), ("chunk", chunk), ("write", write)]
+        result = await self._ingest_items(db_id, items, params, stages, progress_callback=progress_callback)
+
+        if flush_policy == "batch":
+            await asyncio.to_thread(collection.flush)
+        return result
+
+    @staticmethod
+    def _build_entities(chunks: list[dict], embeddings: list[list[float]], with_attributes: bool = True) -> list[list]:
+        """按集合字段顺序构建列式数据，with_attributes 为 False 时按早期版本的 Schema 省略过滤字段"""
+        entities = [
+            [chunk["id"] for chunk in chunks],
+            [chunk["content"] for chunk in chunks],
+            [chunk["source"] for chunk in chunks],
+            [chunk["chunk_id"] for chunk in chunks],
+            [chunk["file_id"] for chunk in chunks],
+            [chunk["chunk_index"] for chunk in chunks],
+        ]
+        if with_attributes:
+            entities += [
+                [chunk.get("file_type", "") for chunk in chunks],
+                [chunk.get("created_at", 0) for chunk in chunks],
+                [encode_milvus_tags(chunk.get("tags", [])) for chunk in chunks],
+            ]
+        return [*entities, embeddings]
+
+    async def _stream_insert_chunks(
+        self,
+        collection,
+        chunks: Iterable[dict],
+        embedding_function,
+        window: int,
+        on_window: Callable[[list[dict]], Awaitable[None]] | None = None,
+    ) -> int:
+        """
+        分窗口向量化并写入，内存中最多保留两个窗口的数据
 
-            try:
-                if content_type == "file":
-                    markdown_content = await process_file_to_markdown(item, params=params)
-                else:
-                    markdown_content = await process_url_to_markdown(item, params=params)
+        下一窗口的向量化与上一窗口的写入重叠进行。chunks 可以是惰性迭代器（流式分块），
+        每个窗口在线程中取出；on_window 在每个窗口写入完成后调用（如写入关键词索引）。
+        出错时等待已提交的写入结束后再抛出，调用方清理已写入的窗口时不会与写入并发。
 
-                chunks = self._split_text_into_chunks(markdown_content, file_id, filename, params)
-                logger.info(f"Split {filename} into {len(chunks)} chunks")
+        Returns:
+            写入的分块数
+        """
+        profile = self._get_index_profile(collection.name)
+        with_attributes = self._has_attribute_fields(collection)
+        # 正在写入的窗口 (写入任务, 窗口分块)
+        pending: tuple[asyncio.Future, list[dict]] | None = None
+        inserted = 0
 
-                if chunks:
-                    texts = [chunk["content"] for chunk in chunks]
-                    embeddings = await embedding_function(texts)
+        async def finish(task: asyncio.Future, window_chunks: list[dict]) -> None:
+            await task
+            if on_window is not None:
+                await on_window(window_chunks)
 
-                    entities = [
-                        [chunk["id"] for chunk in chunks],
-                        [chunk["content"] for chunk in chunks],
-                        [chunk["source"] for chunk in chunks],
-                        [chunk["chunk_id"] for chunk in chunks],
-                        [chunk["file_id"] for chunk in chunks],
-                        [chunk["chunk_index"] for chunk in chunks],
-                        embeddings,
-                    ]
+        try:
+            async for window_chunks in aiter_windows(chunks, window):
+                embeddings = await embedding_function([chunk["content"] for chunk in window_chunks])
+                entities = self._build_entities(window_chunks, profile.encode(embeddings), with_attributes)
+                if pending is not None:
+                    await finish(*pending)
+                pending = (asyncio.ensure_future(asyncio.to_thread(collection.insert, entities)), window_chunks)
+                inserted += len(window_chunks)
+
+            if pending is not None:
+                await finish(*pending)
+                pending = None
+        finally:
+            if pending is not None:
+                await asyncio.gather(pending[0], return_exceptions=True)
+
+        return inserted
+
+    async def _bulk_import_chunks(self, collection, file_id: str, chunks: list[dict], embedding_function, window: int):
+        """
+        超大文件使用 Milvus bulk insert 导入
 
-                    def _insert_records():
-                        collection.insert(entities)
+        向量分窗口计算后写入磁盘上的 numpy 列文件（memmap，不在内存中累积），
+        上传到 Milvus 使用的对象存储后由 Milvus 直接导入为已封存的 segment。
+        """
+        import numpy as np
 
-                    await asyncio.to_thread(_insert_records)
+        dim = self._embedding_dim(collection)
+        work_dir = tempfile.mkdtemp(prefix=f"milvus_bulk_{file_id}_")
+        logger.info(f"Bulk importing {len(chunks)} chunks of {file_id} into {collection.name}")
 
-                logger.info(f"Inserted {content_type} {item} into Milvus. Done.")
+        try:
+            vectors = np.lib.format.open_memmap(
+                os.path.join(work_dir, "embedding.npy"), mode="w+", dtype=np.float32, shape=(len(chunks), dim)
+            )
+            offset = 0
+            for window_chunks in _iter_windows(chunks, window):
+                embeddings = await embedding_function([chunk["content"] for chunk in window_chunks])
+                vectors[offset : offset + len(window_chunks)] = np.asarray(embeddings, dtype=np.float32)
+                offset += len(window_chunks)
+            vectors.flush()
+            del vectors
+
+            columns = {
+                "id": np.array([chunk["id"] for chunk in chunks]),
+                "content": np.array([chunk["content"] for chunk in chunks]),
+                "source": np.array([chunk["source"] for chunk in chunks]),
+                "chunk_id": np.array([chunk["chunk_id"] for chunk in chunks]),
+                "file_id": np.array([chunk["file_id"] for chunk in chunks]),
+                "chunk_index": np.array([chunk["chunk_index"] for chunk in chunks], dtype=np.int64),
+            }
+            if self._has_attribute_fields(collection):
+                columns["file_type"] = np.array([chunk.get("file_type", "") for chunk in chunks])
+                columns["created_at"] = np.array([chunk.get("created_at", 0) for chunk in chunks], dtype=np.int64)
+                columns["tags"] = np.array([encode_milvus_tags(chunk.get("tags", [])) for chunk in chunks])
+            for name, values in columns.items():
+                np.save(os.path.join(work_dir, f"{name}.npy"), values)
+
+            object_prefix = f"bulk_import/{collection.name}/{file_id}"
+            object_names = await asyncio.to_thread(self._upload_bulk_files, work_dir, object_prefix)
+            try:
+                task_id = await asyncio.to_thread(
+                    utility.do_bulk_insert,
+                    collection_name=collection.name,
+                    files=object_names,
+                    using=self.connection_alias,
+                )
+                await self._wait_bulk_insert(task_id)
+            finally:
+                await asyncio.to_thread(self._remove_bulk_files, object_names)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
 
-                async with self._metadata_lock:
-                    self.files_meta[file_id]["status"] = "done"
-                    self._save_metadata()
-                file_record["status"] = "done"
-                # 从处理队列中移除
-                self._remove_from_processing_queue(file_id)
+    def _upload_bulk_files(self, work_dir: str, object_prefix: str) -> list[str]:
+        from src.storage.minio import get_minio_client
 
-            except Exception as e:
-                logger.error(f"处理{content_type} {item} 失败: {e}, {traceback.format_exc()}")
-                async with self._metadata_lock:
-                    self.files_meta[file_id]["status"] = "failed"
-                    self._save_metadata()
-                file_record["status"] = "failed"
-                # 从处理队列中移除
-                self._remove_from_processing_queue(file_id)
-            finally:
-                pass
+        client = get_minio_client().client
+        if not client.bucket_exists(MILVUS_BULK_BUCKET):
+            raise ValueError(f"Milvus bulk import bucket {MILVUS_BULK_BUCKET} not found")
 
-            processed_items_info.append(file_record)
+        object_names = []
+        for filename in sorted(os.listdir(work_dir)):
+            object_name = f"{object_prefix}/{filename}"
+            client.fput_object(MILVUS_BULK_BUCKET, object_name, os.path.join(work_dir, filename))
+            object_names.append(object_name)
+        return object_names
 
-        return processed_items_info
+    def _remove_bulk_files(self, object_names: list[str]) -> None:
+        from src.storage.minio import get_minio_client
+
+        client = get_minio_client().client
+        for object_name in object_names:
+            try:
+                client.remove_object(MILVUS_BULK_BUCKET, object_name)
+            except Exception as e:
+                logger.warning(f"Failed to remove bulk import file {object_name}: {e}")
+
+    async def _wait_bulk_insert(self, task_id: int, poll_interval: float = 2.0) -> None:
+        """轮询 bulk insert 任务直到完成"""
+        while True:
+            state = await asyncio.to_thread(utility.get_bulk_insert_state, task_id=task_id, using=self.connection_alias)
+            if state.state == BulkInsertState.ImportCompleted:
+                logger.info(f"Milvus bulk insert task {task_id} completed, {state.row_count} rows imported")
+                return
+            if state.state in (BulkInsertState.ImportFailed, BulkInsertState.ImportFailedAndCleaned):
+                raise ValueError(f"Milvus bulk insert task {task_id} failed: {state.failed_reason}")
+            await asyncio.sleep(poll_interval)
 
     async def aquery(self, query_text: str, db_id: str, **kwargs) -> list[dict]:
-        """异步查询知识库"""
+        """异步查询知识库，支持 vector / keyword / hybrid 三种检索模式"""
+        return await self._search_with_mode(query_text, db_id, self._vector_query, **kwargs)
+
+    async def _vector_query(self, query_text: str, db_id: str, **kwargs) -> list[dict]:
+        """
+        向量检索
+
+        - nprobe / ef / search_list: 覆盖索引配置中的检索参数，仅当前索引类型支持的参数生效
+        - consistency_level: Strong / Bounded / Session / Eventually
+        - filter: 过滤条件转换为布尔表达式在 Milvus 内过滤，按 file_ids 过滤且以 file_id 为分区键时只扫描相关分区；
+          早期版本创建的集合没有过滤字段，按文件记录求出匹配的文件后按 file_id 过滤
+        """
         collection = await self._get_milvus_collection(db_id)
         if not collection:
             raise ValueError(f"Database {db_id} not found")
@@ -301,27 +526,39 @@ class MilvusKB(KnowledgeBase):
         try:
             top_k = kwargs.get("top_k", 30)
             similarity_threshold = kwargs.get("similarity_threshold", 0.2)
-            metric_type = kwargs.get("metric_type", "COSINE")
+            profile = self._get_index_profile(db_id)
 
-            embed_info = self.databases_meta[db_id].get("embed_info", {})
-            embedding_function = self._get_embedding_function(embed_info)
-            query_embedding = embedding_function([query_text])
+            query_filter = kwargs.get("filter")
+            if query_filter and not self._has_attribute_fields(collection) and set(query_filter) != {"file_ids"}:
+                query_filter = {"file_ids": self._filter_file_ids(db_id, query_filter)}
+                if not query_filter["file_ids"]:
+                    return []
 
-            search_params = {"metric_type": metric_type, "params": {"nprobe": 10}}
-            results = collection.search(
-                data=query_embedding,
+            embed_info = self.databases_meta[db_id].get("embed_info", {})
+            embedding_model = self._get_embedding_model(embed_info)
+            start = time.perf_counter()
+            query_embedding = await embedding_model.aencode_queries([query_text])
+            self._record_stage_latency("embed", time.perf_counter() - start)
+
+            start = time.perf_counter()
+            results = await self._run_in_query_executor(
+                collection.search,
+                data=profile.encode(query_embedding),
                 anns_field="embedding",
-                param=search_params,
+                param=profile.search_param(kwargs, top_k),
                 limit=top_k,
+                expr=to_milvus_expr(query_filter),
                 output_fields=["content", "source", "chunk_id", "file_id", "chunk_index"],
+                consistency_level=self._get_consistency_level(db_id, kwargs.get("consistency_level")),
             )
+            self._record_stage_latency("search", time.perf_counter() - start)
 
             if not results or len(results) == 0 or len(results[0]) == 0:
                 return []
 
             retrieved_chunks = []
             for hit in results[0]:
-                similarity = hit.distance if metric_type == "COSINE" else 1 / (1 + hit.distance)
+                similarity = profile.similarity(hit.distance, len(query_embedding[0]))
 
                 if similarity < similarity_threshold:
                     continue
@@ -345,35 +582,104 @@ class MilvusKB(KnowledgeBase):
             logger.error(f"Milvus query error: {e}, {traceback.format_exc()}")
             return []
 
-    async def delete_file(self, db_id: str, file_id: str) -> None:
-        """删除文件"""
+    async def _iter_stored_chunks(self, db_id: str, cursor: str | None = None) -> AsyncIterator[tuple[list[dict], str]]:
+        """按主键顺序分批迭代集合中的分块，用于回填关键词索引，游标为上一批最后一个分块的主键"""
         collection = await self._get_milvus_collection(db_id)
+        if not collection:
+            raise ValueError(f"Failed to get Milvus collection for {db_id}")
 
-        if collection:
-            # 先查询文件是否存在，避免不必要的删除操作
+        iterator = collection.query_iterator(
+            batch_size=DEFAULT_INSERT_WINDOW * 2,
+            expr=f'id > "{cursor}"' if cursor is not None else 'id != ""',
+            output_fields=["id", "chunk_id", "file_id", "content", "source", "chunk_index"],
+        )
+        try:
+            while rows := await asyncio.to_thread(iterator.next):
+                yield rows, max(row["id"] for row in rows)
+        finally:
+            iterator.close()
+
+    async def _get_file_chunks(self, db_id: str, file_id: str) -> list[dict]:
+        """获取文件已入库的分块（分批迭代，不受单次查询条数上限限制）"""
+        collection = await self._get_milvus_collection(db_id)
+        if not collection:
+            raise ValueError(f"Failed to get Milvus collection for {db_id}")
+
+        def _query_all() -> list[dict]:
+            iterator = collection.query_iterator(
+                batch_size=1000,
+                expr=f'file_id == "{file_id}"',
+                output_fields=["id", "content", "source", "chunk_index"],
+            )
+            rows = []
             try:
-                expr = f'file_id == "{file_id}"'
-                results = collection.query(expr=expr, output_fields=["id"], limit=1)
+                while batch := iterator.next():
+                    rows.extend(batch)
+            finally:
+                iterator.close()
+            return rows
 
-                if not results:
-                    logger.info(f"File {file_id} not found in Milvus, skipping delete operation")
-                else:
-                    # 只有在文件确实存在时才执行删除
-                    def _delete_from_milvus():
-                        try:
-                            collection.delete(expr)
-                            logger.info(f"Deleted chunks for file {file_id} from Milvus")
-                        except Exception as e:
-                            logger.error(f"Error deleting file {file_id} from Milvus: {e}")
-
-                    await asyncio.to_thread(_delete_from_milvus)
+        return await asyncio.to_thread(_query_all)
+
+    async def _apply_chunk_diff(self, db_id: str, file_id: str, diff: ChunkDiff, params: dict) -> None:
+        """写入新增分块、以原向量 upsert 移动的分块、删除已不存在的分块"""
+        collection = await self._get_milvus_collection(db_id)
+        if not collection:
+            raise ValueError(f"Failed to get Milvus collection for {db_id}")
+
+        if diff.added:
+            embed_info = self.databases_meta[db_id].get("embed_info", {})
+            embedding_function = self._get_async_embedding_function(embed_info)
+            insert_window = max(1, int(params.get("insert_window", DEFAULT_INSERT_WINDOW)))
+            await self._stream_insert_chunks(collection, diff.added, embedding_function, insert_window)
+
+        # 内容未变的分块复用已存储的向量，只更新序号与来源
+        for window_chunks in _iter_windows(diff.moved, DEFAULT_INSERT_WINDOW):
+            ids = [chunk["id"] for chunk in window_chunks]
+            rows = await asyncio.to_thread(
+                collection.query, expr=f"id in {json.dumps(ids)}", output_fields=["id", "embedding"]
+            )
+            profile = self._get_index_profile(db_id)
+            vectors = {row["id"]: profile.from_stored(row["embedding"]) for row in rows}
+            entities = self._build_entities(
+                window_chunks, [vectors[chunk_id] for chunk_id in ids], self._has_attribute_fields(collection)
+            )
+            await asyncio.to_thread(collection.upsert, entities)
+
+        for i in range(0, len(diff.removed_ids), DEFAULT_INSERT_WINDOW):
+            removed = diff.removed_ids[i : i + DEFAULT_INSERT_WINDOW]
+            await asyncio.to_thread(collection.delete, f"id in {json.dumps(removed)}")
+
+    async def delete_file(self, db_id: str, file_id: str) -> None:
+        """删除文件"""
+        result = await self.delete_files(db_id, [file_id])
+        if result["failed"]:
+            raise KBOperationError(result["failed"][file_id])
+
+    async def delete_files(self, db_id: str, file_ids: list[str]) -> dict:
+        """批量删除文件：按文件ID集合的表达式分批删除分块，元数据只提交一次"""
+        file_ids = list(dict.fromkeys(file_ids))
+        deleted, failed = [], {}
+
+        collection = await self._get_milvus_collection(db_id)
+        for i in range(0, len(file_ids), self.DELETE_BATCH_SIZE):
+            batch = file_ids[i : i + self.DELETE_BATCH_SIZE]
+            try:
+                if collection:
+                    await asyncio.to_thread(collection.delete, f"file_id in {json.dumps(batch)}")
+                deleted.extend(batch)
             except Exception as e:
-                logger.error(f"Error checking file existence in Milvus: {e}")
-        # 使用锁确保元数据操作的原子性
-        async with self._metadata_lock:
-            if file_id in self.files_meta:
-                del self.files_meta[file_id]
-                self._save_metadata()
+                logger.error(f"Error deleting {len(batch)} files from Milvus: {e}")
+                failed.update(dict.fromkeys(batch, str(e)))
+
+        if deleted:
+            await self._delete_files_from_lexical_index(db_id, deleted)
+            # 使用锁确保元数据操作的原子性
+            async with self._metadata_lock:
+                self._remove_file_records(deleted)
+            logger.info(f"Deleted {len(deleted)} files from Milvus {db_id}")
+
+        return {"deleted": deleted, "failed": failed}
 
     async def get_file_basic_info(self, db_id: str, file_id: str) -> dict:
         """获取文件基本信息（仅元数据）"""
@@ -433,8 +739,278 @@ class MilvusKB(KnowledgeBase):
 
         return {**basic_info, **content_info}
 
+    def create_database(
+        self,
+        database_name: str,
+        description: str,
+        embed_info: dict | None = None,
+        llm_info: dict | None = None,
+        **kwargs,
+    ) -> dict:
+        """
+        创建数据库，additional_params 中的 index_profile / index_params 指定向量索引配置，
+        consistency_level 指定默认检索一致性级别，partition_key 指定分区键字段（创建后不可修改）
+        """
+        # 提前校验配置，避免留下无法创建集合的知识库
+        resolve_index_profile(kwargs.get("index_profile"), kwargs.get("index_params"))
+        resolve_consistency_level(kwargs.get("consistency_level"))
+        resolve_partition_key(kwargs.get("partition_key"))
+        return super().create_database(database_name, description, embed_info, llm_info, **kwargs)
+
+    async def reindex_database(self, db_id: str, index_profile: str, index_params: dict | None = None) -> dict:
+        """
+        按新的索引配置重建知识库的向量索引
+
+        向量存储类型不变时只删除并重建索引；存储类型变化时（如 float32 → float16 / binary）
+        将数据逐批迁移到新 Schema 的临时集合，完成后替换原集合。原集合为二值向量时无法还原，
+        迁移时按分块内容重新向量化。重建期间应避免向该知识库写入内容。
+
+        Returns:
+            新的索引配置与迁移的分块数
+        """
+        if db_id not in self.databases_meta:
+            raise ValueError(f"Database {db_id} not found")
+
+        new_profile = resolve_index_profile(index_profile, index_params)
+        old_profile = self._get_index_profile(db_id)
+        collection = await self._get_milvus_collection(db_id)
+        if not collection:
+            raise ValueError(f"Failed to get Milvus collection for {db_id}")
+
+        dim = self._embedding_dim(collection)
+        start = time.perf_counter()
+        migrated = 0
+
+        if new_profile.vector_type == old_profile.vector_type:
+
+            def _rebuild_index():
+                collection.release()
+                collection.drop_index()
+                collection.create_index("embedding", new_profile.index_params(dim))
+                collection.load()
+
+            await asyncio.to_thread(_rebuild_index)
+        else:
+            migrated = await self._migrate_collection(db_id, collection, old_profile, new_profile, dim)
+
+        record = self.databases_meta[db_id]
+        record["metadata"] = {
+            **(record.get("metadata") or {}),
+            "index_profile": new_profile.name,
+            "index_params": index_params or {},
+        }
+        self._save_metadata()
+        self._index_profiles[db_id] = new_profile
+
+        seconds = round(time.perf_counter() - start, 2)
+        logger.info(f"Reindexed {db_id} from {old_profile.name} to {new_profile.name} in {seconds}s")
+        return {"db_id": db_id, "index_profile": new_profile.to_dict(), "migrated": migrated, "seconds": seconds}
+
+    async def _migrate_collection(
+        self, db_id: str, collection, old_profile: IndexProfile, new_profile: IndexProfile, dim: int
+    ) -> int:
+        """将集合数据迁移到新向量存储类型的集合，并替换原集合"""
+        temp_name = f"{db_id}_reindex"
+        if utility.has_collection(temp_name, using=self.connection_alias):
+            await asyncio.to_thread(utility.drop_collection, temp_name, using=self.connection_alias)
+
+        schema = self._build_schema(db_id, dim, new_profile)
+        temp = Collection(name=temp_name, schema=schema, using=self.connection_alias)
+        embedding_function = None
+        if old_profile.vector_type == "binary":
+            embedding_function = self._get_async_embedding_function(self.databases_meta[db_id].get("embed_info", {}))
+
+        fields = ["id", "content", "source", "chunk_id", "file_id", "chunk_index"]
+        # 早期版本的集合没有过滤字段，迁移时按文件记录补齐
+        has_attributes = self._has_attribute_fields(collection)
+        if has_attributes:
+            fields += ATTRIBUTE_FIELDS
+        file_attributes: dict[str, dict] = {}
+
+        iterator = collection.query_iterator(
+            batch_size=DEFAULT_INSERT_WINDOW, expr='id != ""', output_fields=[*fields, "embedding"]
+        )
+        migrated = 0
+        try:
+            while rows := await asyncio.to_thread(iterator.next):
+                if embedding_function:
+                    vectors = await embedding_function([row["content"] for row in rows])
+                else:
+                    vectors = [old_profile.to_float(row["embedding"]) for row in rows]
+                chunks = [{key: row[key] for key in fields} for row in rows]
+                for chunk in chunks:
+                    if has_attributes:
+                        chunk["tags"] = decode_milvus_tags(chunk["tags"])
+                    else:
+                        file_id = chunk["file_id"]
+                        if file_id not in file_attributes:
+                            file_attributes[file_id] = chunk_attributes(self.files_meta.get(file_id) or {})
+                        chunk.update(file_attributes[file_id])
+                await asyncio.to_thread(temp.insert, self._build_entities(chunks, new_profile.encode(vectors)))
+                migrated += len(rows)
+        except Exception:
+            await asyncio.to_thread(utility.drop_collection, temp_name, using=self.connection_alias)
+            raise
+        finally:
+            iterator.close()
+
+        def _swap_collections():
+            temp.flush()
+            temp.create_index("embedding", new_profile.index_params(dim))
+            collection.release()
+            utility.drop_collection(db_id, using=self.connection_alias)
+            utility.rename_collection(temp_name, db_id, using=self.connection_alias)
+            migrated_collection = Collection(name=db_id, using=self.connection_alias)
+            migrated_collection.load()
+            return migrated_collection
+
+        self.collections[db_id] = await asyncio.to_thread(_swap_collections)
+        logger.info(f"Migrated {migrated} chunks of {db_id} to {new_profile.vector_type} vectors")
+        return migrated
+
+    async def benchmark_index_profiles(
+        self,
+        db_id: str,
+        profiles: list[str] | None = None,
+        queries: list[str] | None = None,
+        sample_size: int = 20000,
+        query_count: int = 50,
+        top_k: int = 10,
+    ) -> dict:
+        """
+        在知识库自身的数据与查询上比较各索引配置的召回率与延迟
+
+        从知识库抽取最多 sample_size 个分块的向量，为每个索引配置建立临时集合；查询默认取该知识库
+        最近的查询文本，不足 query_count 条时用随机分块的开头补足。以 float32 暴力检索的结果为基准
+        计算 recall@top_k，并统计单条查询的检索延迟与每个向量的内存估算。
+
+        Args:
+            profiles: 参与比较的索引配置名称，默认全部
+            queries: 指定的查询文本
+        """
+        import numpy as np
+
+        collection = await self._get_milvus_collection(db_id)
+        if not collection:
+            raise ValueError(f"Failed to get Milvus collection for {db_id}")
+
+        profiles = [resolve_index_profile(name) for name in (profiles or list(INDEX_PROFILES))]
+        current = self._get_index_profile(db_id)
+        embed_info = self.databases_meta[db_id].get("embed_info", {})
+        embedding_model = self._get_embedding_model(embed_info)
+        dim = self._embedding_dim(collection)
+
+        # 抽取样本向量
+        iterator = collection.query_iterator(
+            batch_size=min(sample_size, 1000), expr='id != ""', output_fields=["id", "content", "embedding"]
+        )
+        rows = []
+        try:
+            while len(rows) < sample_size and (batch := await asyncio.to_thread(iterator.next)):
+                rows.extend(batch)
+        finally:
+            iterator.close()
+        rows = rows[:sample_size]
+        if not rows:
+            raise ValueError(f"Database {db_id} is empty")
+
+        if current.vector_type == "binary":
+            vectors = np.asarray(await self._get_async_embedding_function(embed_info)([r["content"] for r in rows]))
+        else:
+            vectors = np.stack([current.to_float(row["embedding"]) for row in rows])
+        vectors = vectors.astype(np.float32)
+        ids = [row["id"] for row in rows]
+
+        queries = list(queries or self._recent_queries.get(db_id, []))[-query_count:]
+        if len(queries) < query_count:
+            rng = np.random.default_rng(0)
+            picks = rng.choice(len(rows), size=min(query_count - len(queries), len(rows)), replace=False)
+            queries += [rows[i]["content"][:200] for i in picks]
+        query_vectors = np.asarray(await embedding_model.aencode_queries(queries), dtype=np.float32)
+
+        # 以 float32 余弦相似度的暴力检索结果为基准
+        normalized = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        scores = query_vectors @ normalized.T
+        k = min(top_k, len(ids))
+        truth = [set(ids[i] for i in np.argsort(-row)[:k]) for row in scores]
+
+        total_chunks = collection.num_entities
+        results = []
+        for profile in profiles:
+            result = await asyncio.to_thread(
+                self._benchmark_profile, db_id, profile, ids, vectors, query_vectors, truth, k
+            )
+            result["estimated_memory_mb"] = round(profile.bytes_per_vector(dim) * total_chunks / 1024**2, 2)
+            results.append(result)
+            logger.info(f"Index benchmark {db_id} {profile.name}: {result}")
+
+        return {
+            "db_id": db_id,
+            "current_profile": current.name,
+            "dim": dim,
+            "sample_size": len(ids),
+            "total_chunks": total_chunks,
+            "query_count": len(queries),
+            "top_k": k,
+            "results": results,
+        }
+
+    def _benchmark_profile(self, db_id, profile: IndexProfile, ids, vectors, query_vectors, truth, top_k) -> dict:
+        """为单个索引配置建立临时集合并测量召回率与延迟"""
+        import numpy as np
+
+        dim = vectors.shape[1]
+        name = f"{db_id}_bench_{profile.name}"
+        if utility.has_collection(name, using=self.connection_alias):
+            utility.drop_collection(name, using=self.connection_alias)
+
+        schema = CollectionSchema(
+            fields=[
+                FieldSchema(name="id", dtype=DataType.VARCHAR, max_length=100, is_primary=True),
+                profile.field_schema(dim),
+            ]
+        )
+        collection = Collection(name=name, schema=schema, using=self.connection_alias)
+        try:
+            start = time.perf_counter()
+            for i in range(0, len(ids), DEFAULT_INSERT_WINDOW):
+                collection.insert(
+                    [ids[i : i + DEFAULT_INSERT_WINDOW], profile.encode(vectors[i : i + DEFAULT_INSERT_WINDOW])]
+                )
+            collection.flush()
+            collection.create_index("embedding", profile.index_params(dim))
+            collection.load()
+            build_seconds = time.perf_counter() - start
+
+            latencies, hits = [], 0
+            for query_vector, expected in zip(query_vectors, truth):
+                start = time.perf_counter()
+                found = collection.search(
+                    data=profile.encode([query_vector]),
+                    anns_field="embedding",
+                    param=profile.search_param(top_k=top_k),
+                    limit=top_k,
+                )
+                latencies.append(time.perf_counter() - start)
+                hits += len(expected & {hit.id for hit in found[0]})
+
+            return {
+                "profile": profile.name,
+                "index_type": profile.index_type,
+                "vector_type": profile.vector_type,
+                "recall": round(hits / max(1, top_k * len(truth)), 4),
+                "latency_p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 2),
+                "latency_p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 2),
+                "build_seconds": round(build_seconds, 2),
+                "bytes_per_vector": profile.bytes_per_vector(dim),
+            }
+        finally:
+            utility.drop_collection(name, using=self.connection_alias)
+
     def delete_database(self, db_id: str) -> dict:
         """删除数据库，同时清除Milvus中的集合"""
+        self.collections.pop(db_id, None)
+        self._index_profiles.pop(db_id, None)
         # Drop Milvus collection
         try:
             if utility.has_collection(db_id, using=self.connection_alias):
@@ -0,0 +1,259 @@
+"""Milvus 向量索引配置（index profile）
+
+每个 Milvus 知识库在创建时可以选择一个索引配置，决定向量字段的存储类型、索引类型以及检索参数：
+
+- ivf_flat：float32 向量 + IVF_FLAT（默认，与早期版本一致）
+- ivf_sq8：float32 向量 + IVF_SQ8，索引内标量量化为 8 bit，约为原始向量的 1/4
+- ivf_pq：float32 向量 + IVF_PQ，子空间数按向量维度自动选择（每个子空间 PQ_DIMS_PER_SUBVECTOR 维）
+- hnsw：float32 向量 + HNSW，可调 M / efConstruction / ef
+- hnsw_fp16：float16 向量 + HNSW，向量存储减半
+- binary：按符号位二值化的向量 + BIN_IVF_FLAT（汉明距离），向量存储为原始的 1/32，召回率损失较大
+- diskann：float32 向量 + DISKANN，索引主体存放在磁盘上（需 Milvus 开启 DiskANN 支持）
+
+创建知识库时通过 additional_params 传入 index_profile，以及可选的 index_params 覆盖默认参数，
+如 {"index_profile": "hnsw", "index_params": {"M": 32, "ef": 128, "vector_type": "float16"}}。
+
+检索参数（nprobe / ef / search_list）与一致性级别可以在每次查询时覆盖，用召回率换取尾延迟；
+partition_key 为 file_id 时按文件哈希分区，按文件过滤的查询只扫描相关分区。
+"""
+
+from dataclasses import dataclass, field, replace
+
+import numpy as np
+from pymilvus import DataType, FieldSchema
+
+DEFAULT_INDEX_PROFILE = "ivf_flat"
+
+# IVF_PQ 每个子空间的维度，1024 维向量对应 128 个子空间（每个向量 128 字节）
+PQ_DIMS_PER_SUBVECTOR = 8
+
+VECTOR_DATA_TYPES = {
+    "float": DataType.FLOAT_VECTOR,
+    "float16": DataType.FLOAT16_VECTOR,
+    "binary": DataType.BINARY_VECTOR,
+}
+
+# 各参数属于建索引参数还是检索参数
+BUILD_PARAM_KEYS = ("nlist", "m", "nbits", "M", "efConstruction")
+SEARCH_PARAM_KEYS = ("nprobe", "ef", "search_list")
+
+# 各索引类型可用的检索参数
+INDEX_SEARCH_PARAM_KEYS = {
+    "IVF_FLAT": ("nprobe",),
+    "IVF_SQ8": ("nprobe",),
+    "IVF_PQ": ("nprobe",),
+    "BIN_IVF_FLAT": ("nprobe",),
+    "HNSW": ("ef",),
+    "DISKANN": ("search_list",),
+}
+
+# 检索一致性级别，Strong 等待所有写入可见，Bounded / Eventually 延迟更低
+CONSISTENCY_LEVELS = ("Strong", "Bounded", "Session", "Eventually")
+DEFAULT_CONSISTENCY_LEVEL = "Bounded"
+
+# 可作为分区键（partition key）的字段
+PARTITION_KEY_FIELDS = ("file_id",)
+
+
+@dataclass(frozen=True)
+class IndexProfile:
+    """
+    Milvus 向量索引配置
+
+    Args:
+        name: 配置名称
+        index_type: Milvus 索引类型
+        metric_type: 距离度量
+        vector_type: 向量存储类型 float / float16 / binary
+        build_params: 建索引参数
+        search_params: 检索参数
+    """
+
+    name: str
+    index_type: str
+    metric_type: str = "COSINE"
+    vector_type: str = "float"
+    build_params: dict = field(default_factory=dict)
+    search_params: dict = field(default_factory=dict)
+
+    def field_schema(self, dim: int) -> FieldSchema:
+        """向量字段定义"""
+        if self.vector_type == "binary" and dim % 8:
+            raise ValueError(f"Binary vectors require a dimension divisible by 8, got {dim}")
+        return FieldSchema(name="embedding", dtype=VECTOR_DATA_TYPES[self.vector_type], dim=dim)
+
+    def index_params(self, dim: int) -> dict:
+        """建索引参数，IVF_PQ 的子空间数按维度确定"""
+        params = dict(self.build_params)
+        if self.index_type == "IVF_PQ" and "m" not in params:
+            params["m"] = pq_subvectors(dim)
+        return {"metric_type": self.metric_type, "index_type": self.index_type, "params": params}
+
+    @property
+    def search_param_keys(self) -> tuple[str, ...]:
+        return INDEX_SEARCH_PARAM_KEYS.get(self.index_type, ())
+
+    def search_param(self, overrides: dict | None = None, top_k: int | None = None) -> dict:
+        """
+        检索参数
+
+        Args:
+            overrides: 本次查询覆盖的检索参数，忽略当前索引类型不支持的参数
+            top_k: 返回数量，ef / search_list 不能小于该值
+        """
+        params = dict(self.search_params)
+        for key in self.search_param_keys:
+            if overrides and overrides.get(key) is not None:
+                params[key] = int(overrides[key])
+
+        if "nprobe" in params:
+            params["nprobe"] = min(max(1, params["nprobe"]), self.build_params.get("nlist", params["nprobe"]))
+        if top_k:
+            for key in ("ef", "search_list"):
+                if key in params:
+                    params[key] = max(params[key], top_k)
+        return {"metric_type": self.metric_type, "params": params}
+
+    def encode(self, embeddings) -> list:
+        """将 float32 向量转换为集合中的存储格式"""
+        if self.vector_type == "float":
+            return embeddings
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if self.vector_type == "float16":
+            return list(vectors.astype(np.float16))
+        return [np.packbits(row > 0).tobytes() for row in vectors]
+
+    def from_stored(self, value):
+        """将查询得到的向量字段值转换为可再次写入的格式"""
+        if isinstance(value, list) and len(value) == 1 and isinstance(value[0], bytes):
+            value = value[0]
+        if self.vector_type == "float16" and isinstance(value, bytes):
+            return np.frombuffer(value, dtype=np.float16)
+        return value
+
+    def to_float(self, value) -> np.ndarray | None:
+        """将存储的向量还原为 float32，二值向量无法还原时返回 None"""
+        if self.vector_type == "binary":
+            return None
+        return np.asarray(self.from_stored(value), dtype=np.float32)
+
+    def similarity(self, distance: float, dim: int) -> float:
+        """将检索距离转换为相似度"""
+        if self.metric_type == "COSINE":
+            return distance
+        if self.metric_type == "HAMMING":
+            return 1 - distance / dim
+        return 1 / (1 + distance)
+
+    def bytes_per_vector(self, dim: int) -> int:
+        """估算单个向量在索引中占用的内存（字节）"""
+        if self.vector_type == "binary":
+            return dim // 8
+        if self.index_type == "IVF_SQ8":
+            return dim
+        if self.index_type == "IVF_PQ":
+            return self.index_params(dim)["params"]["m"] * self.build_params.get("nbits", 8) // 8
+        size = dim * (2 if self.vector_type == "float16" else 4)
+        if self.index_type == "HNSW":
+            size += self.build_params.get("M", 16) * 2 * 4
+        return size
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "index_type": self.index_type,
+            "metric_type": self.metric_type,
+            "vector_type": self.vector_type,
+            "build_params": dict(self.build_params),
+            "search_params": dict(self.search_params),
+            "search_param_keys": list(self.search_param_keys),
+        }
+
+
+INDEX_PROFILES: dict[str, IndexProfile] = {
+    "ivf_flat": IndexProfile("ivf_flat", "IVF_FLAT", build_params={"nlist": 1024}, search_params={"nprobe": 10}),
+    "ivf_sq8": IndexProfile("ivf_sq8", "IVF_SQ8", build_params={"nlist": 1024}, search_params={"nprobe": 16}),
+    "ivf_pq": IndexProfile("ivf_pq", "IVF_PQ", build_params={"nlist": 1024, "nbits": 8}, search_params={"nprobe": 32}),
+    "hnsw": IndexProfile("hnsw", "HNSW", build_params={"M": 16, "efConstruction": 200}, search_params={"ef": 64}),
+    "hnsw_fp16": IndexProfile(
+        "hnsw_fp16",
+        "HNSW",
+        vector_type="float16",
+        build_params={"M": 16, "efConstruction": 200},
+        search_params={"ef": 64},
+    ),
+    "diskann": IndexProfile("diskann", "DISKANN", search_params={"search_list": 100}),
+    "binary": IndexProfile(
+        "binary",
+        "BIN_IVF_FLAT",
+        metric_type="HAMMING",
+        vector_type="binary",
+        build_params={"nlist": 1024},
+        search_params={"nprobe": 16},
+    ),
+}
+
+
+def pq_subvectors(dim: int) -> int:
+    """按维度选择 IVF_PQ 的子空间数 m（需整除维度）"""
+    m = max(1, dim // PQ_DIMS_PER_SUBVECTOR)
+    while dim % m:
+        m -= 1
+    return m
+
+
+def resolve_index_profile(name: str | None = None, overrides: dict | None = None) -> IndexProfile:
+    """
+    根据名称与覆盖参数得到索引配置
+
+    Args:
+        name: 配置名称，为空时使用 DEFAULT_INDEX_PROFILE
+        overrides: 覆盖参数，可包含 vector_type 以及 nlist / m / nbits / M / efConstruction / nprobe / ef
+    """
+    name = name or DEFAULT_INDEX_PROFILE
+    if name not in INDEX_PROFILES:
+        raise ValueError(f"Unsupported index profile: {name}, only support {list(INDEX_PROFILES)}")
+
+    profile = INDEX_PROFILES[name]
+    overrides = overrides or {}
+    unknown = set(overrides) - set(BUILD_PARAM_KEYS) - set(SEARCH_PARAM_KEYS) - {"vector_type"}
+    if unknown:
+        raise ValueError(f"Unsupported index params: {sorted(unknown)}")
+
+    vector_type = overrides.get("vector_type", profile.vector_type)
+    if vector_type not in VECTOR_DATA_TYPES:
+        raise ValueError(f"Unsupported vector type: {vector_type}")
+    if (vector_type == "binary") != (profile.vector_type == "binary"):
+        raise ValueError(f"Index profile {name} does not support {vector_type} vectors")
+
+    return replace(
+        profile,
+        vector_type=vector_type,
+        build_params=profile.build_params | {k: overrides[k] for k in BUILD_PARAM_KEYS if k in overrides},
+        search_params=profile.search_params | {k: overrides[k] for k in profile.search_param_keys if k in overrides},
+    )
+
+
+def profile_from_metadata(metadata: dict | None) -> IndexProfile:
+    """从知识库元数据（创建时的 additional_params）中读取索引配置"""
+    metadata = metadata or {}
+    return resolve_index_profile(metadata.get("index_profile"), metadata.get("index_params"))
+
+
+def resolve_consistency_level(level: str | None, default: str = DEFAULT_CONSISTENCY_LEVEL) -> str:
+    """校验一致性级别（不区分大小写），为空时返回 default"""
+    if not level:
+        return default
+    for name in CONSISTENCY_LEVELS:
+        if name.lower() == str(level).lower():
+            return name
+    raise ValueError(f"Unsupported consistency level: {level}, only support {list(CONSISTENCY_LEVELS)}")
+
+
+def resolve_partition_key(field_name: str | None) -> str | None:
+    """校验分区键字段，为空表示不使用分区键"""
+    if not field_name:
+        return None
+    if field_name not in PARTITION_KEY_FIELDS:
+        raise ValueError(f"Unsupported partition key: {field_name}, only support {list(PARTITION_KEY_FIELDS)}")
+    return field_name
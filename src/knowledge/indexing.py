@@ -179,13 +179,16 @@ def plainreader(file_path):
     return text
 
 
-def parse_pdf(file, params=None):
+def parse_pdf(file, params=None, parse_info=None, progress_callback=None):
     """
     解析PDF文件，支持多种OCR方式
 
     Args:
         file: PDF文件路径
         params: 参数字典，包含enable_ocr设置
+        parse_info: 可选的字典，auto_ocr 模式下写入 total_pages 与 ocr_pages（执行了OCR的页码），
+            OCR 模式下有页面识别失败时写入 ocr_failed_pages
+        progress_callback: 可选的回调 (已识别页数, 需识别页数)，本地 OCR 每识别完一页调用一次
 
     Returns:
         str: 解析得到的文本
@@ -205,7 +208,12 @@ def parse_pdf(file, params=None):
         if opt_ocr == "onnx_rapid_ocr":
             from src.plugins import ocr
 
-            return ocr.process_pdf(file, params=params)
+            return ocr.process_pdf(file, params=params, parse_info=parse_info, progress_callback=progress_callback)
+
+        elif opt_ocr == "auto_ocr":
+            from src.plugins import ocr
+
+            return ocr.process_pdf_auto(file, params=params, parse_info=parse_info, progress_callback=progress_callback)
 
         elif opt_ocr == "mineru_ocr":
             from src.plugins import ocr
@@ -268,21 +276,27 @@ def parse_image(file, params=None):
         raise OCRServiceException(f"Image解析失败: {str(e)}", opt_ocr, "parsing_failed")
 
 
-async def parse_pdf_async(file, params=None):
-    return await asyncio.to_thread(parse_pdf, file, params=params)
+async def parse_pdf_async(file, params=None, parse_info=None, progress_callback=None):
+    return await asyncio.to_thread(
+        parse_pdf, file, params=params, parse_info=parse_info, progress_callback=progress_callback
+    )
 
 
 async def parse_image_async(file, params=None):
     return await asyncio.to_thread(parse_image, file, params=params)
 
 
-async def process_file_to_markdown(file_path: str, params: dict | None = None) -> str:
+async def process_file_to_markdown(
+    file_path: str, params: dict | None = None, parse_info: dict | None = None, progress_callback=None
+) -> str:
     """
     将不同类型的文件转换为markdown格式
 
     Args:
         file_path: 文件路径
         params: 处理参数
+        parse_info: 可选的字典，用于返回解析过程信息（如 auto_ocr 模式下执行了OCR的页码）
+        progress_callback: 可选的回调 (已识别页数, 需识别页数)，PDF 本地 OCR 时在解析线程中按页调用
 
     Returns:
         markdown格式内容
@@ -292,7 +306,9 @@ async def process_file_to_markdown(file_path: str, params: dict | None = None) -
 
     if file_ext == ".pdf":
         # 使用 OCR 处理 PDF
-        text = await parse_pdf_async(str(file_path_obj), params=params)
+        text = await parse_pdf_async(
+            str(file_path_obj), params=params, parse_info=parse_info, progress_callback=progress_callback
+        )
         return f"# {file_path_obj.name}\n\n{text}"
 
     elif file_ext in [".txt", ".md"]:
@@ -320,42 +336,11 @@ async def process_file_to_markdown(file_path: str, params: dict | None = None) -
         text = md(content, heading_style="ATX")
         return f"# {file_path_obj.name}\n\n{text}"
 
-    elif file_ext == ".csv":
-        # 处理 CSV 文件
-        import pandas as pd
-
-        df = pd.read_csv(file_path_obj)
-        # 将每一行数据与表头组合成独立的表格
-        markdown_content = f"# {file_path_obj.name}\n\n"
-
-        for index, row in df.iterrows():
-            # 创建包含表头和当前行的小表格
-            row_df = pd.DataFrame([row], columns=df.columns)
-            markdown_table = row_df.to_markdown(index=False)
-            markdown_content += f"{markdown_table}\n\n"
-
-        return markdown_content.strip()
-
-    elif file_ext in [".xls", ".xlsx"]:
-        # 处理 Excel 文件
-        import pandas as pd
-
-        # 读取所有工作表
-        excel_file = pd.ExcelFile(file_path_obj)
-        markdown_content = f"# {file_path_obj.name}\n\n"
-
-        for sheet_name in excel_file.sheet_names:
-            df = pd.read_excel(file_path_obj, sheet_name=sheet_name)
-            markdown_content += f"## {sheet_name}\n\n"
-
-            # 将每一行数据与表头组合成独立的表格
-            for index, row in df.iterrows():
-                # 创建包含表头和当前行的小表格
-                row_df = pd.DataFrame([row], columns=df.columns)
-                markdown_table = row_df.to_markdown(index=False)
-                markdown_content += f"{markdown_table}\n\n"
+    elif file_ext in [".csv", ".xls", ".xlsx"]:
+        # 处理 CSV / Excel 文件：每一行数据与表头组合成独立的表格，按列批量格式化并流式读取
+        from src.knowledge.utils.table_markdown import table_file_to_markdown
 
-        return markdown_content.strip()
+        return await asyncio.to_thread(table_file_to_markdown, file_path_obj)
 
     elif file_ext == ".json":
         # 处理 JSON 文件
@@ -1,9 +1,13 @@
 import asyncio
-import json
 import os
+import time
+from collections.abc import MutableMapping
 
+from src import config
 from src.knowledge.base import KBNotFoundError, KnowledgeBase
 from src.knowledge.factory import KnowledgeBaseFactory
+from src.knowledge.utils.metadata_store import MetadataStore, migrate_json_metadata
+from src.knowledge.utils.query_cache import QueryResultCache
 from src.utils import logger
 from src.utils.datetime_utils import coerce_any_to_utc_datetime, utc_isoformat
 
@@ -29,11 +33,16 @@ class KnowledgeBaseManager:
         self.kb_instances: dict[str, KnowledgeBase] = {}
 
         # 全局数据库元信息 {db_id: metadata_with_kb_type}
-        self.global_databases_meta: dict[str, dict] = {}
+        self.global_databases_meta: MutableMapping[str, dict] = {}
 
         # 元数据锁
         self._metadata_lock = asyncio.Lock()
 
+        # 检索结果缓存，知识库内容变化时按 db_id 失效
+        self.query_cache = QueryResultCache(
+            max_entries=config.kb_query_cache_max_entries, ttl=config.kb_query_cache_ttl
+        )
+
         # 加载全局元数据
         self._load_global_metadata()
         self._normalize_global_metadata()
@@ -44,23 +53,23 @@ class KnowledgeBaseManager:
         logger.info("KnowledgeBaseManager initialized")
 
     def _load_global_metadata(self):
-        """加载全局元数据"""
-        meta_file = os.path.join(self.work_dir, "global_metadata.json")
-        if os.path.exists(meta_file):
-            try:
-                with open(meta_file, encoding="utf-8") as f:
-                    data = json.load(f)
-                    self.global_databases_meta = data.get("databases", {})
-                logger.info(f"Loaded global metadata for {len(self.global_databases_meta)} databases")
-            except Exception as e:
-                logger.error(f"Failed to load global metadata: {e}")
+        """加载全局元数据，首次启动时自动从旧版 JSON 文件迁移"""
+        self._metadata_store = MetadataStore(os.path.join(self.work_dir, "global_metadata.db"))
+        self.global_databases_meta = self._metadata_store.table("databases")
+
+        try:
+            migrate_json_metadata(
+                os.path.join(self.work_dir, "global_metadata.json"), self._metadata_store, {"databases": "databases"}
+            )
+        except Exception as e:
+            logger.error(f"Failed to migrate global metadata: {e}")
+
+        self._metadata_store.set_meta("version", "2.0")
+        logger.info(f"Loaded global metadata for {len(self.global_databases_meta)} databases")
 
     def _save_global_metadata(self):
-        """保存全局元数据"""
-        meta_file = os.path.join(self.work_dir, "global_metadata.json")
-        data = {"databases": self.global_databases_meta, "updated_at": utc_isoformat(), "version": "2.0"}
-        with open(meta_file, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        """保存全局元数据（仅写入发生变更的记录）"""
+        self._metadata_store.commit()
 
     def _normalize_global_metadata(self) -> None:
         """Normalize stored timestamps within the global metadata cache."""
@@ -109,6 +118,14 @@ class KnowledgeBaseManager:
         logger.info(f"Created {kb_type} knowledge base instance")
         return kb_instance
 
+    async def aclose(self) -> None:
+        """关闭各知识库实例持有的连接池（服务关闭时调用）"""
+        for kb_type, kb_instance in self.kb_instances.items():
+            try:
+                await kb_instance.aclose()
+            except Exception as e:
+                logger.warning(f"Failed to close {kb_type} knowledge base: {e}")
+
     def _get_kb_for_database(self, db_id: str) -> KnowledgeBase:
         """
         根据数据库ID获取对应的知识库实例
@@ -195,6 +212,7 @@ class KnowledgeBaseManager:
 
     async def delete_database(self, db_id: str) -> dict:
         """删除数据库"""
+        self.query_cache.invalidate(db_id)
         try:
             kb_instance = self._get_kb_for_database(db_id)
             result = kb_instance.delete_database(db_id)
@@ -209,15 +227,68 @@ class KnowledgeBaseManager:
             logger.warning(f"Database {db_id} not found during deletion: {e}")
             return {"message": "删除成功"}
 
-    async def add_content(self, db_id: str, items: list[str], params: dict | None = None) -> list[dict]:
-        """添加内容（文件/URL）"""
+    async def add_content(
+        self, db_id: str, items: list[str], params: dict | None = None, progress_callback=None
+    ) -> list[dict]:
+        """添加内容（文件/URL），每个文件写入完成后即使检索缓存失效"""
         kb_instance = self._get_kb_for_database(db_id)
-        return await kb_instance.add_content(db_id, items, params or {})
+
+        async def on_item_done(done, total, file_record, page_progress=None):
+            if page_progress is None:
+                self.query_cache.invalidate(db_id)
+            if progress_callback:
+                await progress_callback(done, total, file_record, page_progress)
+
+        try:
+            return await kb_instance.add_content(db_id, items, params or {}, progress_callback=on_item_done)
+        finally:
+            self.query_cache.invalidate(db_id)
+
+    def _get_query_timeout(self, db_id: str, kwargs: dict) -> float | None:
+        """查询超时时间：查询参数 > 知识库 additional_params > 全局配置"""
+        timeout = kwargs.pop("query_timeout", None)
+        if timeout is None:
+            additional_params = self.global_databases_meta.get(db_id, {}).get("additional_params") or {}
+            timeout = additional_params.get("query_timeout", config.kb_query_timeout)
+        return float(timeout) if timeout and float(timeout) > 0 else None
 
     async def aquery(self, query_text: str, db_id: str, **kwargs) -> str:
-        """异步查询知识库"""
+        """异步查询知识库，超过该知识库的查询超时时间时抛出 TimeoutError"""
         kb_instance = self._get_kb_for_database(db_id)
-        return await kb_instance.aquery(query_text, db_id, **kwargs)
+        timeout = self._get_query_timeout(db_id, kwargs)
+
+        use_cache = kwargs.pop("use_cache", True) and config.enable_kb_query_cache
+
+        # 重排序开关默认取系统配置，在构建缓存键之前确定，切换配置后不会命中另一种设置下缓存的结果
+        cache_params = kwargs
+        if not self.is_lightrag_database(db_id):
+            kwargs["use_rerank"] = bool(kwargs.get("use_rerank", config.enable_reranker))
+            cache_params = {**kwargs, "reranker": config.reranker} if kwargs["use_rerank"] else kwargs
+
+        start_time = time.perf_counter()
+        if use_cache:
+            self.query_cache.ttl = config.kb_query_cache_ttl
+            self.query_cache.max_entries = config.kb_query_cache_max_entries
+            cache_key = self.query_cache.make_key(db_id, query_text, cache_params)
+            cache_generation = self.query_cache.generation(db_id)
+            hit, result = self.query_cache.get(cache_key)
+            if hit:
+                self.query_cache.record(True, time.perf_counter() - start_time)
+                return result
+
+        try:
+            result = await asyncio.wait_for(kb_instance.aquery(query_text, db_id, **kwargs), timeout=timeout)
+        except TimeoutError:
+            logger.warning(f"Query on database {db_id} timed out after {timeout}s")
+            raise TimeoutError(f"知识库 {db_id} 查询超时（{timeout}s）")
+
+        if use_cache:
+            self.query_cache.record(False, time.perf_counter() - start_time)
+            # 空结果可能来自检索异常，不缓存
+            if result:
+                self.query_cache.put(cache_key, result, generation=cache_generation)
+
+        return result
 
     async def export_data(self, db_id: str, format: str = "zip", **kwargs) -> str:
         """导出知识库数据"""
@@ -249,7 +320,50 @@ class KnowledgeBaseManager:
     async def delete_file(self, db_id: str, file_id: str) -> None:
         """删除文件"""
         kb_instance = self._get_kb_for_database(db_id)
-        await kb_instance.delete_file(db_id, file_id)
+        try:
+            await kb_instance.delete_file(db_id, file_id)
+        finally:
+            self.query_cache.invalidate(db_id)
+
+    async def reindex_database(self, db_id: str, index_profile: str, index_params: dict | None = None) -> dict:
+        """按新的索引配置重建知识库的向量索引"""
+        kb_instance = self._get_kb_for_database(db_id)
+        try:
+            result = await kb_instance.reindex_database(db_id, index_profile, index_params)
+        finally:
+            self.query_cache.invalidate(db_id)
+
+        async with self._metadata_lock:
+            if db_id in self.global_databases_meta:
+                record = self.global_databases_meta[db_id]
+                record["additional_params"] = {
+                    **(record.get("additional_params") or {}),
+                    "index_profile": index_profile,
+                    "index_params": index_params or {},
+                }
+                self._save_global_metadata()
+        return result
+
+    async def benchmark_index_profiles(self, db_id: str, profiles: list[str] | None = None, **kwargs) -> dict:
+        """比较各索引配置在知识库自身数据上的召回率与延迟"""
+        kb_instance = self._get_kb_for_database(db_id)
+        return await kb_instance.benchmark_index_profiles(db_id, profiles, **kwargs)
+
+    async def delete_files(self, db_id: str, file_ids: list[str]) -> dict:
+        """批量删除文件"""
+        kb_instance = self._get_kb_for_database(db_id)
+        try:
+            return await kb_instance.delete_files(db_id, file_ids)
+        finally:
+            self.query_cache.invalidate(db_id)
+
+    async def update_file(self, db_id: str, file_id: str, item: str, params: dict | None = None) -> dict:
+        """用新内容增量更新文件"""
+        kb_instance = self._get_kb_for_database(db_id)
+        try:
+            return await kb_instance.update_file(db_id, file_id, item, params or {})
+        finally:
+            self.query_cache.invalidate(db_id)
 
     async def get_file_basic_info(self, db_id: str, file_id: str) -> dict:
         """获取文件基本信息（仅元数据）"""
@@ -316,13 +430,22 @@ class KnowledgeBaseManager:
         """获取所有检索器"""
         all_retrievers = {}
 
-        # 收集所有知识库的检索器
+        # 收集所有知识库的检索器，统一经由管理器查询以应用超时控制
         for kb_instance in self.kb_instances.values():
             retrievers = kb_instance.get_retrievers()
+            for db_id, retriever_info in retrievers.items():
+                retriever_info["retriever"] = self._make_retriever(db_id)
+                retriever_info["supports_filter"] = kb_instance.SUPPORTS_METADATA_FILTER
             all_retrievers.update(retrievers)
 
         return all_retrievers
 
+    def _make_retriever(self, db_id: str):
+        async def retriever(query_text, **kwargs):
+            return await self.aquery(query_text, db_id, **kwargs)
+
+        return retriever
+
     # =============================================================================
     # 管理器特有的方法
     # =============================================================================
@@ -359,6 +482,10 @@ class KnowledgeBaseManager:
 
         return stats
 
+    def get_query_latency_stats(self) -> dict[str, dict]:
+        """各知识库类型的检索阶段耗时统计（embed / search / keyword / rerank）"""
+        return {kb_type: kb_instance.get_query_latency_stats() for kb_type, kb_instance in self.kb_instances.items()}
+
     # =============================================================================
     # 兼容性方法 - 为了支持现有的 graph_router.py
     # =============================================================================
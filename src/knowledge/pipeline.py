@@ -0,0 +1,146 @@
+"""分阶段、有界并发的文档入库流水线
+
+parse -> chunk -> embed -> write 各阶段由若干 worker 并发消费上游队列，
+阶段之间通过有界队列连接：下游处理不过来时上游会被背压阻塞，
+避免一批文件的中间结果（markdown、chunks、向量）同时驻留在内存中。
+"""
+
+import asyncio
+import traceback
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from typing import Any
+
+from src.utils import logger
+
+# 各阶段默认并发数，可通过 params["stage_concurrency"] 覆盖
+DEFAULT_STAGE_CONCURRENCY: dict[str, int] = {"parse": 4, "chunk": 2, "embed": 4, "write": 2}
+
+# 阶段之间队列的默认容量
+DEFAULT_QUEUE_SIZE = 8
+
+
+@dataclass
+class IngestJob:
+    """流水线中流转的单个待入库条目（文件或 URL）"""
+
+    item: str
+    file_id: str
+    record: dict
+    payload: Any = None
+    error: Exception | None = None
+    failed_stage: str | None = None
+    # 解析进度回调 (已完成页数, 总页数)，在解析线程中调用
+    on_parse_progress: Callable[[int, int], None] | None = None
+
+
+StageFunc = Callable[[IngestJob, Any], Awaitable[Any]]
+JobCallback = Callable[[IngestJob], Awaitable[None]]
+
+_SENTINEL = object()
+
+
+class IngestionPipeline:
+    """
+    入库流水线
+
+    Args:
+        stages: 有序的 (阶段名, 阶段函数) 列表。阶段函数接收 job 与上一阶段的输出，返回本阶段输出
+        concurrency: 各阶段并发数，未指定的阶段使用 DEFAULT_STAGE_CONCURRENCY
+        queue_size: 阶段间队列容量
+        on_job_done: 单个条目完成（成功或失败）时的回调，在调用 run 的协程中串行执行
+    """
+
+    def __init__(
+        self,
+        stages: list[tuple[str, StageFunc]],
+        concurrency: dict[str, int] | None = None,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        on_job_done: JobCallback | None = None,
+    ):
+        if not stages:
+            raise ValueError("IngestionPipeline requires at least one stage")
+
+        self.stages = stages
+        self.concurrency = DEFAULT_STAGE_CONCURRENCY | (concurrency or {})
+        self.queue_size = max(1, int(queue_size))
+        self.on_job_done = on_job_done
+
+    def _workers_for(self, stage_name: str) -> int:
+        return max(1, int(self.concurrency.get(stage_name, 1)))
+
+    async def run(self, jobs: list[IngestJob]) -> list[IngestJob]:
+        """
+        运行流水线直到所有条目完成
+
+        回调或调用方抛出的异常（例如任务取消）会中止所有阶段的 worker 并继续向上抛出。
+        """
+        if not jobs:
+            return jobs
+
+        queues = [asyncio.Queue(maxsize=self.queue_size) for _ in self.stages]
+        done_queue: asyncio.Queue[IngestJob] = asyncio.Queue()
+
+        tasks = [asyncio.create_task(self._feed(jobs, queues[0]), name="ingest-feed")]
+        for index in range(len(self.stages)):
+            tasks.append(
+                asyncio.create_task(
+                    self._run_stage_group(index, queues, done_queue), name=f"ingest-{self.stages[index][0]}"
+                )
+            )
+
+        try:
+            for _ in range(len(jobs)):
+                job = await done_queue.get()
+                if self.on_job_done:
+                    await self.on_job_done(job)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        return jobs
+
+    async def _feed(self, jobs: list[IngestJob], queue: asyncio.Queue) -> None:
+        for job in jobs:
+            await queue.put(job)
+        for _ in range(self._workers_for(self.stages[0][0])):
+            await queue.put(_SENTINEL)
+
+    async def _run_stage_group(self, index: int, queues: list[asyncio.Queue], done_queue: asyncio.Queue) -> None:
+        stage_name = self.stages[index][0]
+        await asyncio.gather(
+            *[self._stage_worker(index, queues, done_queue) for _ in range(self._workers_for(stage_name))]
+        )
+
+        # 当前阶段所有 worker 退出后，通知下游阶段的 worker 结束
+        if index + 1 < len(queues):
+            for _ in range(self._workers_for(self.stages[index + 1][0])):
+                await queues[index + 1].put(_SENTINEL)
+
+    async def _stage_worker(self, index: int, queues: list[asyncio.Queue], done_queue: asyncio.Queue) -> None:
+        stage_name, stage_func = self.stages[index]
+        inbox = queues[index]
+        outbox = queues[index + 1] if index + 1 < len(queues) else None
+
+        while True:
+            job = await inbox.get()
+            if job is _SENTINEL:
+                return
+
+            try:
+                job.payload = await stage_func(job, job.payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:  # noqa: BLE001
+                logger.error(f"Ingest stage `{stage_name}` failed for {job.item}: {e}, {traceback.format_exc()}")
+                job.error = e
+                job.failed_stage = stage_name
+                job.payload = None
+
+            # 失败的条目跳过后续阶段，直接完成
+            if outbox is not None and job.error is None:
+                await outbox.put(job)
+            else:
+                job.payload = None
+                await done_queue.put(job)
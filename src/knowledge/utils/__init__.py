@@ -8,6 +8,7 @@
 from .kb_utils import (
     calculate_content_hash,
     get_embedding_config,
+    iter_text_chunks,
     prepare_item_metadata,
     split_text_into_chunks,
     split_text_into_qa_chunks,
@@ -17,6 +18,7 @@ from .kb_utils import (
 __all__ = [
     "calculate_content_hash",
     "get_embedding_config",
+    "iter_text_chunks",
     "prepare_item_metadata",
     "split_text_into_chunks",
     "split_text_into_qa_chunks",
@@ -1,11 +1,18 @@
+import asyncio
 import hashlib
+import itertools
 import os
 import time
+from collections import defaultdict
+from collections.abc import AsyncIterator, Iterable, Iterator
+from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 
 from langchain_text_splitters import MarkdownTextSplitter
 
 from src import config
+from src.knowledge.utils.table_markdown import TABLE_FILE_EXTENSIONS, pack_markdown_blocks
 from src.utils import hashstr, logger
 from src.utils.datetime_utils import utc_isoformat
 
@@ -66,38 +73,135 @@ def validate_file_path(file_path: str, db_id: str = None) -> str:
         raise ValueError(f"Invalid file path: {file_path}")
 
 
-def split_text_into_chunks(text: str, file_id: str, filename: str, params: dict = {}) -> list[dict]:
+# 流式分块时每次交给分割器的窗口大小（chunk_size 的倍数）
+STREAM_WINDOW_FACTOR = 8
+
+
+@lru_cache(maxsize=16)
+def _get_markdown_splitter(chunk_size: int, chunk_overlap: int) -> MarkdownTextSplitter:
+    """按分块参数复用 MarkdownTextSplitter"""
+    return MarkdownTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+
+def iter_text_blocks(text: str, separator: str = "\n\n") -> Iterator[str]:
+    """按分隔符惰性切分文本，不生成完整的切分列表"""
+    start = 0
+    while True:
+        end = text.find(separator, start)
+        if end == -1:
+            yield text[start:]
+            return
+        yield text[start:end]
+        start = end + len(separator)
+
+
+def iter_markdown_chunks(blocks: Iterable[str], chunk_size: int = 1000, chunk_overlap: int = 200) -> Iterator[str]:
     """
-    将文本分割成块，使用 LangChain 的 MarkdownTextSplitter 进行智能分割
+    流式分割 markdown，逐个输出分块文本
+
+    输入为以空行分隔的 markdown 块（段落、表格行块等），累积到 STREAM_WINDOW_FACTOR 个分块大小后
+    交给 MarkdownTextSplitter 分割，窗口最后一个分块可能不完整，留到下一个窗口继续分割。
+    内存中只保留一个窗口的文本；不超过一个窗口的文本与一次性分割的结果一致。
     """
-    chunks = []
+    splitter = _get_markdown_splitter(chunk_size, chunk_overlap)
+    window_size = chunk_size * STREAM_WINDOW_FACTOR
+    buffer: list[str] = []
+    buffered = 0
+
+    for block in blocks:
+        buffer.append(block)
+        buffered += len(block) + 2
+        if buffered < window_size:
+            continue
+
+        window = "\n\n".join(buffer)
+        pieces = splitter.split_text(window)
+        tail_start = window.rfind(pieces[-1]) if len(pieces) > 1 else -1
+        if tail_start <= 0:
+            yield from pieces
+            buffer, buffered = [], 0
+            continue
+
+        yield from pieces[:-1]
+        tail = window[tail_start:]
+        buffer, buffered = [tail], len(tail)
+
+    if buffer:
+        yield from splitter.split_text("\n\n".join(buffer))
+
+
+def iter_table_chunks(blocks: Iterable[str], chunk_size: int = 1000, chunk_overlap: int = 200) -> Iterator[str]:
+    """表格文件按行块边界组装分块，避免表格行被切断；超长的行块再交给分割器"""
+    splitter = _get_markdown_splitter(chunk_size, chunk_overlap)
+    for packed in pack_markdown_blocks(blocks, chunk_size):
+        if len(packed) > chunk_size:
+            yield from splitter.split_text(packed)
+        else:
+            yield packed
+
+
+def iter_text_chunks(
+    text: str | Iterable[str], file_id: str, filename: str, params: dict | None = None
+) -> Iterator[dict]:
+    """
+    流式分块，逐个输出分块记录
+
+    Args:
+        text: markdown 文本，或解析器逐块输出的 markdown 块（块之间视为以空行分隔）
+        file_id: 文件 ID
+        filename: 文件名
+        params: 分块参数 chunk_size、chunk_overlap
+    """
+    params = params or {}
     chunk_size = params.get("chunk_size", 1000)
     chunk_overlap = params.get("chunk_overlap", 200)
 
-    # 使用 MarkdownTextSplitter 进行智能分割
-    # MarkdownTextSplitter 会尝试沿着 Markdown 格式的标题进行分割
-    text_splitter = MarkdownTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-    )
+    blocks = iter_text_blocks(text) if isinstance(text, str) else text
+    if Path(filename).suffix.lower() in TABLE_FILE_EXTENSIONS:
+        contents = iter_table_chunks(blocks, chunk_size, chunk_overlap)
+    else:
+        contents = iter_markdown_chunks(blocks, chunk_size, chunk_overlap)
+
+    for chunk_index, chunk_content in enumerate(contents):
+        chunk_content = chunk_content.strip()
+        if not chunk_content:  # 跳过空块
+            continue
+
+        # id 与 chunk_id、filename 与 source 共用同一个字符串对象
+        chunk_id = f"{file_id}_chunk_{chunk_index}"
+        yield {
+            "id": chunk_id,
+            "content": chunk_content,
+            "file_id": file_id,
+            "filename": filename,
+            "chunk_index": chunk_index,
+            "source": filename,
+            "chunk_id": chunk_id,
+        }
+
+
+async def aiter_windows(items: Iterable, size: int) -> AsyncIterator[list]:
+    """
+    按窗口异步迭代
 
-    text_chunks = text_splitter.split_text(text)
+    列表直接切片；惰性迭代器（如 iter_text_chunks 的流式分块）在线程中取出每个窗口，
+    分块计算不阻塞事件循环，内存中只保留当前窗口。
+    """
+    if isinstance(items, list):
+        for i in range(0, len(items), size):
+            yield items[i : i + size]
+        return
 
-    # 转换为标准格式
-    for chunk_index, chunk_content in enumerate(text_chunks):
-        if chunk_content.strip():  # 跳过空块
-            chunks.append(
-                {
-                    "id": f"{file_id}_chunk_{chunk_index}",
-                    "content": chunk_content.strip(),
-                    "file_id": file_id,
-                    "filename": filename,
-                    "chunk_index": chunk_index,
-                    "source": filename,
-                    "chunk_id": f"{file_id}_chunk_{chunk_index}",
-                }
-            )
+    iterator = iter(items)
+    while window := await asyncio.to_thread(lambda: list(itertools.islice(iterator, size))):
+        yield window
 
+
+def split_text_into_chunks(text: str | Iterable[str], file_id: str, filename: str, params: dict = {}) -> list[dict]:
+    """
+    将文本分割成块，使用 LangChain 的 MarkdownTextSplitter 进行智能分割（流式分块见 iter_text_chunks）
+    """
+    chunks = list(iter_text_chunks(text, file_id, filename, params))
     logger.debug(f"Successfully split text into {len(chunks)} chunks using MarkdownTextSplitter")
     return chunks
 
@@ -196,6 +300,60 @@ def split_text_into_qa_chunks(
     return chunks
 
 
+@dataclass
+class ChunkDiff:
+    """文件更新前后的分块按内容哈希比对的结果"""
+
+    chunks: list[dict]  # 新内容的全部分块，内容未变的分块沿用已入库的 id
+    added: list[dict]  # 新增的分块，需要向量化并写入
+    moved: list[dict]  # 内容未变但序号或来源变化的分块，只需更新元数据
+    removed_ids: list[str]  # 已不存在的分块 id，需要删除
+
+    @property
+    def unchanged_count(self) -> int:
+        return len(self.chunks) - len(self.added)
+
+
+def chunk_content_hash(content: str) -> str:
+    return hashlib.sha1(content.encode("utf-8")).hexdigest()
+
+
+def diff_chunks(stored: list[dict], chunks: list[dict], revision: int) -> ChunkDiff:
+    """
+    按分块内容哈希比对已入库的分块与新内容的分块
+
+    内容相同的分块（按出现顺序一一对应）沿用原 id；新增分块的 id 带上版本号，避免与沿用的 id 冲突。
+
+    Args:
+        stored: 已入库的分块，需包含 id、content，可选 chunk_index、source
+        chunks: 新内容的分块（split_text_into_chunks 的输出），会被原地修改 id
+        revision: 文件更新后的版本号
+    """
+    stored_by_hash: dict[str, list[dict]] = defaultdict(list)
+    for item in sorted(stored, key=lambda c: c.get("chunk_index") or 0):
+        stored_by_hash[chunk_content_hash(item["content"])].append(item)
+
+    added, moved = [], []
+    for chunk in chunks:
+        candidates = stored_by_hash.get(chunk_content_hash(chunk["content"]))
+        if candidates:
+            old = candidates.pop(0)
+            chunk["id"] = chunk["chunk_id"] = old["id"]
+            if old.get("chunk_index") != chunk["chunk_index"] or old.get("source") != chunk["source"]:
+                moved.append(chunk)
+        else:
+            file_id = chunk["file_id"]
+            chunk["id"] = chunk["chunk_id"] = chunk["id"].replace(file_id, f"{file_id}_r{revision}", 1)
+            added.append(chunk)
+
+    removed_ids = [item["id"] for items in stored_by_hash.values() for item in items]
+    return ChunkDiff(chunks=chunks, added=added, moved=moved, removed_ids=removed_ids)
+
+
+# 嵌入模型配置中可选的请求参数，透传给 BaseEmbeddingModel
+EMBED_OPTIONAL_PARAMS = ("batch_size", "max_batch_tokens", "max_concurrency", "max_retries", "timeout", "http2")
+
+
 def get_embedding_config(embed_info: dict) -> dict:
     """
     获取嵌入模型配置
@@ -214,6 +372,19 @@ def get_embedding_config(embed_info: dict) -> dict:
             config_dict["api_key"] = os.getenv(embed_info["api_key"], embed_info["api_key"])
             config_dict["base_url"] = embed_info["base_url"]
             config_dict["dimension"] = embed_info.get("dimension", 1024)
+            # 批次限制等可选参数：优先使用知识库记录，其次使用当前模型配置中同名模型的设置
+            model_info = next(
+                (
+                    info
+                    for info in config.embed_model_names.values()
+                    if info.get("name") == embed_info["name"] and info.get("base_url") == embed_info["base_url"]
+                ),
+                {},
+            )
+            for key in EMBED_OPTIONAL_PARAMS:
+                value = embed_info.get(key, model_info.get(key))
+                if value is not None:
+                    config_dict[key] = value
         else:
             from src.models import select_embedding_model
 
@@ -222,6 +393,10 @@ def get_embedding_config(embed_info: dict) -> dict:
             config_dict["api_key"] = default_model.api_key
             config_dict["base_url"] = default_model.base_url
             config_dict["dimension"] = getattr(default_model, "dimension", 1024)
+            for key in EMBED_OPTIONAL_PARAMS:
+                value = config.embed_model_names[config.embed_model].get(key)
+                if value is not None:
+                    config_dict[key] = value
 
     except Exception as e:
         logger.error(f"Error in get_embedding_config: {e}, {embed_info}")
@@ -0,0 +1,389 @@
+"""基于 SQLite FTS5 的关键词倒排索引
+
+与向量集合同步维护，用于混合检索中的 BM25 关键词召回，弥补向量检索对产品型号、零件编号、
+报错原文等精确字符串不敏感的问题。早期版本创建的知识库没有关键词索引，由后台任务从向量库分批回填，
+每批写入后记录回填游标，中断后从游标处继续；回填完成（或新建知识库）后标记为已同步。
+
+检索开销有上限：存在低频词时丢弃高频词；全部为高频词时先按 AND 检索；匹配数超过 MAX_SCORED_ROWS 时
+只对最新写入的 MAX_SCORED_ROWS 个匹配分块计算 BM25（高频词查询的结果偏向较新的分块）；按文件过滤时
+只遍历这些文件的 rowid 范围，且最多检查 MAX_VISITED_ROWS 个匹配分块。
+
+分词规则（不依赖额外的分词库）：
+- 中文（CJK）连续字符切分为二元组（bigram），单个汉字保留为单字；
+- 英文与数字按词切分，`AB-1234`、`v2.5.1` 这类型号整体保留，同时保留拆分后的各部分；
+- 统一做 NFKC 规范化并转为小写，全角字符与半角字符等价。
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+
+from src.utils import logger
+
+_CJK_RANGES = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_TOKEN_RE = re.compile(rf"[{_CJK_RANGES}]+|[0-9a-z]+(?:[-_./][0-9a-z]+)*")
+_CJK_RE = re.compile(rf"[{_CJK_RANGES}]")
+_CODE_SEPARATOR_RE = re.compile(r"[-_./]")
+# 索引词已由 tokenize 切分好，FTS5 只按空白分隔，型号中的分隔符视为词的一部分
+FTS_TOKENIZER = "\"unicode61 tokenchars '-_./'\""
+
+
+def tokenize(text: str, split_codes: bool = True) -> list[str]:
+    """
+    将文本切分为索引词
+
+    Args:
+        text: 文本
+        split_codes: 是否额外输出型号类词的各组成部分（建索引时开启，查询时只用完整型号以保证精确）
+    """
+    tokens = []
+    for match in _TOKEN_RE.finditer(unicodedata.normalize("NFKC", text).lower()):
+        part = match.group()
+        if _CJK_RE.match(part):
+            if len(part) == 1:
+                tokens.append(part)
+            else:
+                tokens.extend(part[i : i + 2] for i in range(len(part) - 1))
+        else:
+            tokens.append(part)
+            if split_codes and _CODE_SEPARATOR_RE.search(part):
+                tokens.extend(p for p in _CODE_SEPARATOR_RE.split(part) if p)
+    return tokens
+
+
+def build_match_query(tokens: list[str], operator: str = "OR") -> str | None:
+    """构建 FTS5 查询表达式（各词之间为 OR 或 AND，由 BM25 排序）"""
+    if not tokens:
+        return None
+    return f" {operator} ".join(f'"{token}"' for token in tokens)
+
+
+class LexicalIndex:
+    """
+    单个知识库的关键词索引
+
+    Args:
+        db_path: SQLite 文件路径
+    """
+
+    # 文档频率超过该比例的查询词视为高频词
+    COMMON_TERM_RATIO = 0.1
+    # 单次查询最多使用的词数
+    MAX_QUERY_TERMS = 16
+    # 单次查询最多计算 BM25 的分块数
+    MAX_SCORED_ROWS = 2000
+    # 按文件过滤时单次查询最多检查的匹配分块数
+    MAX_VISITED_ROWS = 20000
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "id INTEGER PRIMARY KEY, chunk_id TEXT UNIQUE NOT NULL, file_id TEXT NOT NULL, "
+            "content TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_file_id ON chunks (file_id)")
+        self._conn.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(tokens, tokenize={FTS_TOKENIZER})"
+        )
+        self._conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS chunks_vocab USING fts5vocab(chunks_fts, 'row')")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        # 按文件过滤时的文件ID临时表（仅当前连接可见），避免 IN (?, ...) 超出 SQLite 的参数个数上限
+        self._conn.execute("CREATE TEMP TABLE IF NOT EXISTS filter_files (file_id TEXT PRIMARY KEY)")
+        self._conn.commit()
+        self._synced = self._get_meta("synced") is not None
+        self._total = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def _get_meta(self, key: str) -> str | None:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key: str, value: str | None) -> None:
+        """写入或删除 meta 条目（调用方需持有锁并提交）"""
+        if value is None:
+            self._conn.execute("DELETE FROM meta WHERE key = ?", (key,))
+        else:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def synced(self) -> bool:
+        """索引是否包含向量库中的全部分块（新建的知识库，或已从向量库回填）"""
+        return self._synced
+
+    def mark_synced(self) -> None:
+        with self._lock:
+            self._set_meta("synced", "1")
+            self._set_meta("backfill_cursor", None)
+            self._conn.commit()
+            self._synced = True
+
+    @property
+    def backfill_cursor(self) -> str | None:
+        """回填进度：向量库中已回填到的位置，由知识库实现解释（如 Milvus 主键、Chroma 偏移量）"""
+        with self._lock:
+            return self._get_meta("backfill_cursor")
+
+    def save_backfill_cursor(self, cursor: str) -> None:
+        with self._lock:
+            self._set_meta("backfill_cursor", cursor)
+            self._conn.commit()
+
+    def add_chunks(self, chunks: list[dict]) -> int:
+        """
+        写入分块，chunk_id 已存在时覆盖
+
+        Args:
+            chunks: 分块列表，需包含 chunk_id、file_id、content，可选 source、chunk_index
+
+        Returns:
+            写入的分块数
+        """
+        if not chunks:
+            return 0
+
+        with self._lock:
+            try:
+                replaced = self._delete_where("chunk_id", [chunk["chunk_id"] for chunk in chunks])
+                for chunk in chunks:
+                    metadata = {
+                        "source": chunk.get("source"),
+                        "chunk_id": chunk["chunk_id"],
+                        "file_id": chunk["file_id"],
+                        "chunk_index": chunk.get("chunk_index"),
+                    }
+                    cursor = self._conn.execute(
+                        "INSERT INTO chunks (chunk_id, file_id, content, metadata) VALUES (?, ?, ?, ?)",
+                        (
+                            chunk["chunk_id"],
+                            chunk["file_id"],
+                            chunk["content"],
+                            json.dumps(metadata, ensure_ascii=False),
+                        ),
+                    )
+                    self._conn.execute(
+                        "INSERT INTO chunks_fts (rowid, tokens) VALUES (?, ?)",
+                        (cursor.lastrowid, " ".join(tokenize(chunk["content"]))),
+                    )
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            self._total += len(chunks) - replaced
+        return len(chunks)
+
+    def delete_file(self, file_id: str) -> int:
+        """删除文件的全部分块"""
+        return self.delete_files([file_id])
+
+    def delete_files(self, file_ids: list[str]) -> int:
+        """在一个事务中删除多个文件的全部分块"""
+        with self._lock:
+            try:
+                deleted = self._delete_where("file_id", list(file_ids))
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+            self._total -= deleted
+        return deleted
+
+    def _delete_where(self, column: str, values: list[str]) -> int:
+        """按 chunk_id 或 file_id 删除（调用方需持有锁）"""
+        deleted = 0
+        for i in range(0, len(values), 500):
+            group = values[i : i + 500]
+            placeholders = ",".join("?" * len(group))
+            ids = [
+                row[0] for row in self._conn.execute(f"SELECT id FROM chunks WHERE {column} IN ({placeholders})", group)
+            ]
+            if not ids:
+                continue
+            id_placeholders = ",".join("?" * len(ids))
+            self._conn.execute(f"DELETE FROM chunks_fts WHERE rowid IN ({id_placeholders})", ids)
+            self._conn.execute(f"DELETE FROM chunks WHERE id IN ({id_placeholders})", ids)
+            deleted += len(ids)
+        return deleted
+
+    def search(self, query_text: str, top_k: int = 10, file_ids: list[str] | None = None) -> list[dict]:
+        """
+        BM25 关键词检索
+
+        Args:
+            file_ids: 只检索这些文件的分块，为 None 时不限制
+
+        Returns:
+            与向量检索一致的结果格式 [{"content", "metadata", "score"}]，score 为 BM25 得分（越大越相关）
+        """
+        tokens = list(dict.fromkeys(tokenize(query_text, split_codes=False)))
+        if not tokens or file_ids is not None and not file_ids:
+            return []
+
+        with self._lock:
+            try:
+                rowid_range = None
+                if file_ids is not None:
+                    rowid_range = self._filter_rowid_range(file_ids)
+                    if rowid_range is None:
+                        return []
+
+                terms, all_common = self._select_query_terms(tokens)
+                # 全部为高频词时，先检索同时包含所有词的分块，不足 top_k 再按 OR 补充
+                operators = ["AND", "OR"] if all_common and len(terms) > 1 else ["OR"]
+
+                results: dict[int, tuple] = {}
+                for operator in operators:
+                    for row in self._ranked_rows(build_match_query(terms, operator), top_k, rowid_range):
+                        results.setdefault(row[0], row)
+                    if len(results) >= top_k:
+                        break
+            except sqlite3.OperationalError as e:
+                logger.warning(f"Lexical search failed for query {query_text!r}: {e}")
+                return []
+            finally:
+                if file_ids is not None:
+                    self._conn.rollback()
+
+        return [
+            {"content": content, "metadata": json.loads(metadata), "score": -rank}
+            for _, content, metadata, rank in list(results.values())[:top_k]
+        ]
+
+    def _filter_rowid_range(self, file_ids: list[str]) -> tuple[int, int] | None:
+        """
+        将过滤的文件ID写入临时表，返回这些文件的分块所在的 rowid 范围（调用方需持有锁并在结束后回滚）
+
+        同一文件的分块基本连续写入，范围通常很小；文件没有任何分块时返回 None。
+        """
+        self._conn.execute("DELETE FROM temp.filter_files")
+        self._conn.executemany("INSERT OR IGNORE INTO temp.filter_files (file_id) VALUES (?)", ((f,) for f in file_ids))
+        low, high = self._conn.execute(
+            "SELECT MIN((SELECT MIN(id) FROM chunks WHERE file_id = f.file_id)), "
+            "MAX((SELECT MAX(id) FROM chunks WHERE file_id = f.file_id)) FROM temp.filter_files f"
+        ).fetchone()
+        return None if low is None else (low, high)
+
+    def _ranked_rows(self, match_query: str, top_k: int, rowid_range: tuple[int, int] | None) -> list[tuple]:
+        """
+        按 BM25 排序取 top_k 个匹配分块（调用方需持有锁）
+
+        按 rowid 倒序（FTS5 原生顺序，不计算得分）遍历匹配分块，只对最新的 MAX_SCORED_ROWS 个计算 BM25；
+        按文件过滤时只遍历这些文件的 rowid 范围，且最多检查最新的 MAX_VISITED_ROWS 个匹配，
+        使单次查询的开销不随知识库规模增长。
+        """
+        where = "chunks_fts MATCH ?"
+        params: list = [match_query]
+        if rowid_range is not None:
+            low, high = rowid_range
+            row = self._conn.execute(
+                "SELECT rowid FROM chunks_fts WHERE chunks_fts MATCH ? AND rowid BETWEEN ? AND ? "
+                "ORDER BY rowid DESC LIMIT 1 OFFSET ?",
+                (match_query, low, high, self.MAX_VISITED_ROWS - 1),
+            ).fetchone()
+            where += (
+                " AND rowid BETWEEN ? AND ?"
+                " AND (SELECT file_id FROM chunks WHERE id = chunks_fts.rowid)"
+                " IN (SELECT file_id FROM temp.filter_files)"
+            )
+            params += [row[0] if row else low, high]
+
+        return self._conn.execute(
+            "SELECT c.id, c.content, c.metadata, ranked.rank FROM ("
+            "SELECT rowid, rank FROM ("
+            f"SELECT rowid, bm25(chunks_fts) AS rank FROM chunks_fts WHERE {where} ORDER BY rowid DESC LIMIT ?"
+            ") ORDER BY rank LIMIT ?"
+            ") AS ranked JOIN chunks c ON c.id = ranked.rowid ORDER BY ranked.rank",
+            (*params, self.MAX_SCORED_ROWS, top_k),
+        ).fetchall()
+
+    def _select_query_terms(self, tokens: list[str]) -> tuple[list[str], bool]:
+        """
+        按文档频率筛选查询词（调用方需持有锁）
+
+        几乎出现在所有分块中的词对 BM25 排序贡献很小，却要对整个倒排表打分，
+        存在低频词时丢弃高频词，并只保留最稀有的 MAX_QUERY_TERMS 个词。
+
+        Returns:
+            (查询词, 是否全部为高频词)
+        """
+        placeholders = ",".join("?" * len(tokens))
+        doc_freq = dict(
+            self._conn.execute(f"SELECT term, doc FROM chunks_vocab WHERE term IN ({placeholders})", tokens).fetchall()
+        )
+        present = sorted((t for t in tokens if t in doc_freq), key=lambda t: doc_freq[t])
+        if not present:
+            return tokens, False
+
+        rare = [t for t in present if doc_freq[t] <= self._total * self.COMMON_TERM_RATIO]
+        terms = (rare or present)[: self.MAX_QUERY_TERMS]
+        return terms, not rare
+
+    def count(self) -> int:
+        with self._lock:
+            return self._total
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def _result_key(result: dict) -> str:
+    metadata = result.get("metadata") or {}
+    return metadata.get("chunk_id") or result.get("content", "")
+
+
+def reciprocal_rank_fusion(
+    result_lists: list[list[dict]], weights: list[float] | None = None, k: int = 60
+) -> list[dict]:
+    """
+    倒数排名融合（RRF）：score = Σ weight / (k + rank)
+
+    Args:
+        result_lists: 各路召回结果（已按相关度降序）
+        weights: 各路权重，默认均为 1
+        k: 平滑常数
+
+    Returns:
+        融合后按得分降序排列的结果，score 替换为融合得分
+    """
+    weights = weights or [1.0] * len(result_lists)
+    fused: dict[str, dict] = {}
+    for results, weight in zip(result_lists, weights):
+        for rank, result in enumerate(results, start=1):
+            key = _result_key(result)
+            if key not in fused:
+                fused[key] = {**result, "score": 0.0}
+            fused[key]["score"] += weight / (k + rank)
+
+    return sorted(fused.values(), key=lambda r: r["score"], reverse=True)
+
+
+def weighted_score_fusion(result_lists: list[list[dict]], weights: list[float]) -> list[dict]:
+    """
+    加权分数融合：各路得分先做 min-max 归一化，再按权重求和
+
+    Returns:
+        融合后按得分降序排列的结果，score 替换为融合得分
+    """
+    fused: dict[str, dict] = {}
+    for results, weight in zip(result_lists, weights):
+        if not results:
+            continue
+        scores = [result["score"] for result in results]
+        low, high = min(scores), max(scores)
+        for result in results:
+            normalized = (result["score"] - low) / (high - low) if high > low else 1.0
+            key = _result_key(result)
+            if key not in fused:
+                fused[key] = {**result, "score": 0.0}
+            fused[key]["score"] += weight * normalized
+
+    return sorted(fused.values(), key=lambda r: r["score"], reverse=True)
@@ -0,0 +1,171 @@
+"""检索时的结构化元数据过滤
+
+过滤条件为一个字典，各条件之间为 AND 关系：
+
+- file_ids: 只检索这些文件
+- file_types: 文件类型（扩展名，如 pdf、md，URL 为 url）
+- created_after / created_before: 文件入库时间范围 [created_after, created_before)，
+  接受 ISO 8601 字符串（如 2025-01-01，无时区时按 Asia/Shanghai）或 unix 时间戳
+- tags: 入库时为文件设置的标签，命中任意一个即可
+
+入库时 file_type、created_at（unix 秒）与 tags 作为标量字段随每个分块写入向量库，
+查询时过滤条件转换为 Milvus 布尔表达式或 Chroma where 子句，在向量库内完成过滤。
+"""
+
+import json
+from collections.abc import Iterable
+
+from src.utils.datetime_utils import coerce_any_to_utc_datetime
+
+FILTER_KEYS = ("file_ids", "file_types", "created_after", "created_before", "tags")
+
+# Milvus 中 tags 以分隔符包围存储（如 |财务|2025|），按 like 匹配单个标签
+TAG_SEPARATOR = "|"
+MAX_TAGS = 32
+MAX_TAG_LENGTH = 64
+
+# Chroma 元数据不支持列表，每个标签存为一个布尔键
+CHROMA_TAG_PREFIX = "tag:"
+
+
+def normalize_tags(tags: str | Iterable[str] | None) -> list[str]:
+    """规范化标签：支持逗号分隔的字符串，去除首尾空白、分隔符与重复项"""
+    if not tags:
+        return []
+    if isinstance(tags, str):
+        tags = tags.split(",")
+
+    normalized = []
+    for tag in tags:
+        tag = str(tag).replace(TAG_SEPARATOR, "").replace("%", "").strip()[:MAX_TAG_LENGTH]
+        if tag and tag not in normalized:
+            normalized.append(tag)
+    if len(normalized) > MAX_TAGS:
+        raise ValueError(f"At most {MAX_TAGS} tags are supported, got {len(normalized)}")
+    return normalized
+
+
+def _to_timestamp(value) -> int:
+    return int(coerce_any_to_utc_datetime(value).timestamp())
+
+
+def _to_str_list(key: str, value) -> list[str]:
+    if isinstance(value, str):
+        value = [value]
+    if not isinstance(value, list | tuple | set):
+        raise ValueError(f"Filter {key} must be a list of strings")
+    return [str(item) for item in value]
+
+
+def parse_filter(query_filter: dict | None) -> dict | None:
+    """
+    校验并规范化过滤条件
+
+    Returns:
+        规范化后的过滤条件（时间转换为 unix 秒），没有任何条件时返回 None
+    """
+    if not query_filter:
+        return None
+    if not isinstance(query_filter, dict):
+        raise ValueError("Filter must be an object")
+
+    unknown = set(query_filter) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Unsupported filter keys: {sorted(unknown)}, only support {list(FILTER_KEYS)}")
+
+    parsed = {}
+    if query_filter.get("file_ids"):
+        parsed["file_ids"] = _to_str_list("file_ids", query_filter["file_ids"])
+    if query_filter.get("file_types"):
+        file_types = _to_str_list("file_types", query_filter["file_types"])
+        parsed["file_types"] = [file_type.lower().lstrip(".") for file_type in file_types]
+    for key in ("created_after", "created_before"):
+        if query_filter.get(key) not in (None, ""):
+            parsed[key] = _to_timestamp(query_filter[key])
+    if query_filter.get("tags"):
+        parsed["tags"] = normalize_tags(query_filter["tags"])
+
+    return parsed or None
+
+
+def chunk_attributes(record: dict) -> dict:
+    """从文件记录中提取随分块写入向量库的过滤字段"""
+    created_at = coerce_any_to_utc_datetime(record.get("created_at"))
+    return {
+        "file_type": record.get("file_type") or "",
+        "created_at": int(created_at.timestamp()) if created_at else 0,
+        "tags": normalize_tags(record.get("tags")),
+    }
+
+
+def encode_milvus_tags(tags: list[str]) -> str:
+    return f"{TAG_SEPARATOR}{TAG_SEPARATOR.join(tags)}{TAG_SEPARATOR}" if tags else ""
+
+
+def decode_milvus_tags(value: str | None) -> list[str]:
+    return [tag for tag in (value or "").split(TAG_SEPARATOR) if tag]
+
+
+def to_milvus_expr(query_filter: dict | None) -> str | None:
+    """将规范化后的过滤条件转换为 Milvus 布尔表达式"""
+    if not query_filter:
+        return None
+
+    clauses = []
+    if "file_ids" in query_filter:
+        clauses.append(f"file_id in {json.dumps(query_filter['file_ids'], ensure_ascii=False)}")
+    if "file_types" in query_filter:
+        clauses.append(f"file_type in {json.dumps(query_filter['file_types'], ensure_ascii=False)}")
+    if "created_after" in query_filter:
+        clauses.append(f"created_at >= {query_filter['created_after']}")
+    if "created_before" in query_filter:
+        clauses.append(f"created_at < {query_filter['created_before']}")
+    if query_filter.get("tags"):
+        tag_clauses = [
+            f"tags like {json.dumps(f'%{TAG_SEPARATOR}{tag}{TAG_SEPARATOR}%', ensure_ascii=False)}"
+            for tag in query_filter["tags"]
+        ]
+        clauses.append(f"({' or '.join(tag_clauses)})")
+    return " and ".join(clauses) or None
+
+
+def to_chroma_where(query_filter: dict | None) -> dict | None:
+    """将规范化后的过滤条件转换为 Chroma where 子句"""
+    if not query_filter:
+        return None
+
+    clauses = []
+    if "file_ids" in query_filter:
+        clauses.append({"full_doc_id": {"$in": query_filter["file_ids"]}})
+    if "file_types" in query_filter:
+        clauses.append({"file_type": {"$in": query_filter["file_types"]}})
+    if "created_after" in query_filter:
+        clauses.append({"created_at": {"$gte": query_filter["created_after"]}})
+    if "created_before" in query_filter:
+        clauses.append({"created_at": {"$lt": query_filter["created_before"]}})
+    if query_filter.get("tags"):
+        tag_clauses = [{f"{CHROMA_TAG_PREFIX}{tag}": True} for tag in query_filter["tags"]]
+        clauses.append(tag_clauses[0] if len(tag_clauses) == 1 else {"$or": tag_clauses})
+
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def match_record(record: dict, query_filter: dict | None) -> bool:
+    """判断文件记录是否满足过滤条件（用于关键词检索与旧版集合）"""
+    if not query_filter:
+        return True
+
+    attributes = chunk_attributes(record)
+    if "file_ids" in query_filter and record.get("file_id") not in query_filter["file_ids"]:
+        return False
+    if "file_types" in query_filter and attributes["file_type"] not in query_filter["file_types"]:
+        return False
+    if "created_after" in query_filter and attributes["created_at"] < query_filter["created_after"]:
+        return False
+    if "created_before" in query_filter and attributes["created_at"] >= query_filter["created_before"]:
+        return False
+    if query_filter.get("tags") and not set(query_filter["tags"]) & set(attributes["tags"]):
+        return False
+    return True
@@ -0,0 +1,315 @@
+"""基于 SQLite 的知识库元数据存储
+
+知识库元数据原先整体序列化为 JSON 文件，每次状态变更都要重写全部记录。
+这里把每条数据库/文件记录存为 SQLite 中的一行：
+
+- MetadataTable 对外表现为 dict，记录本身也是 dict 的子类，
+  `files_meta[file_id]["status"] = "done"` 这类现有写法无需修改；
+- 新增、删除记录以及修改记录的顶层字段都会被标记为变更，commit 时只写入变更的行，
+  且在同一个事务中完成，进程崩溃不会留下被截断的元数据文件；
+- 各表在首次访问时才从磁盘加载。
+
+注意：直接修改记录中嵌套的 dict（如 `record["metadata"]["k"] = v`）不会被追踪，
+需要重新给顶层字段赋值，或调用 MetadataTable.mark_dirty。
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import Callable, Iterator, MutableMapping
+from typing import Any
+
+from src.utils import logger
+from src.utils.datetime_utils import utc_isoformat
+
+_SCALAR_TYPES = (str, int, float, bool, type(None))
+
+
+class MetadataRecord(dict):
+    """单条元数据记录，顶层字段变更时通知所属的表"""
+
+    __slots__ = ("_table", "_key")
+
+    def __init__(self, table: "MetadataTable | None", key: str, data: dict | None = None):
+        super().__init__(data or {})
+        self._table = table
+        self._key = key
+
+    def _touch(self) -> None:
+        if self._table is not None:
+            self._table.mark_dirty(self._key)
+
+    def __setitem__(self, key, value) -> None:
+        # 标量值未变化时不标记，避免重复写入
+        if isinstance(value, _SCALAR_TYPES) and key in self and dict.__getitem__(self, key) == value:
+            return
+        super().__setitem__(key, value)
+        self._touch()
+
+    def __delitem__(self, key) -> None:
+        super().__delitem__(key)
+        self._touch()
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def update(self, *args, **kwargs) -> None:
+        super().update(*args, **kwargs)
+        self._touch()
+
+    def pop(self, key, *default):
+        value = super().pop(key, *default)
+        self._touch()
+        return value
+
+    def popitem(self):
+        item = super().popitem()
+        self._touch()
+        return item
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def clear(self) -> None:
+        super().clear()
+        self._touch()
+
+    def copy(self) -> dict:
+        return dict(self)
+
+
+class MetadataTable(MutableMapping):
+    """一类元数据（如 databases、files）的 dict 视图，首次访问时懒加载"""
+
+    def __init__(self, store: "MetadataStore", kind: str, normalizer: Callable[[dict], None] | None = None):
+        self._store = store
+        self._kind = kind
+        self._normalizer = normalizer
+        self._data: dict[str, MetadataRecord] | None = None
+        self._dirty: set[str] = set()
+
+    def _ensure_loaded(self) -> dict[str, MetadataRecord]:
+        if self._data is None:
+            data = {}
+            for key, value in self._store._load_rows(self._kind):
+                try:
+                    record = json.loads(value)
+                except json.JSONDecodeError as e:
+                    logger.error(f"Skip corrupted {self._kind} metadata record {key}: {e}")
+                    continue
+                if self._normalizer:
+                    self._normalizer(record)
+                data[key] = MetadataRecord(self, key, record)
+            self._data = data
+        return self._data
+
+    def mark_dirty(self, key: str) -> None:
+        """标记记录已变更，下次 commit 时写入"""
+        self._dirty.add(key)
+
+    def load_from(self, mapping: dict[str, dict]) -> None:
+        """用给定的数据整体替换当前表内容（用于迁移）"""
+        data = self._ensure_loaded()
+        self._dirty.update(data.keys())
+        data.clear()
+        for key, value in mapping.items():
+            self[key] = value
+
+    def _take_changes(self) -> tuple[list[tuple[str, str]], list[str]]:
+        """取出待写入的变更并清空变更集合，返回 (upserts, deletes)"""
+        if not self._dirty or self._data is None:
+            self._dirty.clear()
+            return [], []
+
+        upserts, deletes = [], []
+        for key in self._dirty:
+            record = self._data.get(key)
+            if record is None:
+                deletes.append(key)
+                continue
+            value = dict(record)
+            if self._normalizer:
+                self._normalizer(value)
+                dict.update(record, value)
+            upserts.append((key, json.dumps(value, ensure_ascii=False)))
+        self._dirty.clear()
+        return upserts, deletes
+
+    def __getitem__(self, key: str) -> MetadataRecord:
+        return self._ensure_loaded()[key]
+
+    def __setitem__(self, key: str, value: dict) -> None:
+        data = self._ensure_loaded()
+        if key in data:
+            data[key]._table = None
+        data[key] = MetadataRecord(self, key, value)
+        self._dirty.add(key)
+
+    def __delitem__(self, key: str) -> None:
+        record = self._ensure_loaded().pop(key)
+        record._table = None
+        self._dirty.add(key)
+
+    def __contains__(self, key) -> bool:
+        return key in self._ensure_loaded()
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._ensure_loaded())
+
+    def __len__(self) -> int:
+        return len(self._ensure_loaded())
+
+    def keys(self):
+        return self._ensure_loaded().keys()
+
+    def items(self):
+        return self._ensure_loaded().items()
+
+    def values(self):
+        return self._ensure_loaded().values()
+
+    def __repr__(self) -> str:
+        return f"MetadataTable(kind={self._kind!r}, records={len(self)})"
+
+
+class MetadataStore:
+    """
+    SQLite 元数据存储
+
+    Args:
+        db_path: SQLite 数据库文件路径
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, PRIMARY KEY (kind, key))"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS store_meta (key TEXT PRIMARY KEY, value TEXT)")
+
+        self._tables: dict[str, MetadataTable] = {}
+
+    def table(self, kind: str, normalizer: Callable[[dict], None] | None = None) -> MetadataTable:
+        """获取（或创建）指定类别的元数据表"""
+        with self._lock:
+            if kind not in self._tables:
+                self._tables[kind] = MetadataTable(self, kind, normalizer=normalizer)
+            elif normalizer is not None:
+                self._tables[kind]._normalizer = normalizer
+            return self._tables[kind]
+
+    def _load_rows(self, kind: str) -> list[tuple[str, str]]:
+        with self._lock:
+            return self._conn.execute("SELECT key, value FROM records WHERE kind = ?", (kind,)).fetchall()
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM records LIMIT 1").fetchone() is None
+
+    def get_meta(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM store_meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO store_meta (key, value) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                (key, str(value)),
+            )
+
+    def commit(self) -> int:
+        """
+        在一个事务中写入所有表的变更
+
+        Returns:
+            写入（更新或删除）的记录数
+        """
+        with self._lock:
+            changes = [(kind, *table._take_changes()) for kind, table in self._tables.items()]
+            changed = sum(len(upserts) + len(deletes) for _, upserts, deletes in changes)
+            if not changed:
+                return 0
+
+            try:
+                self._conn.execute("BEGIN IMMEDIATE")
+                for kind, upserts, deletes in changes:
+                    if upserts:
+                        self._conn.executemany(
+                            "INSERT INTO records (kind, key, value) VALUES (?, ?, ?) "
+                            "ON CONFLICT(kind, key) DO UPDATE SET value = excluded.value",
+                            [(kind, key, value) for key, value in upserts],
+                        )
+                    if deletes:
+                        self._conn.executemany(
+                            "DELETE FROM records WHERE kind = ? AND key = ?", [(kind, key) for key in deletes]
+                        )
+                self._conn.execute(
+                    "INSERT INTO store_meta (key, value) VALUES ('updated_at', ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    (utc_isoformat(),),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                # 写入失败时保留变更标记，下次 commit 重试
+                for kind, upserts, deletes in changes:
+                    table = self._tables[kind]
+                    for key, _ in upserts:
+                        table.mark_dirty(key)
+                    for key in deletes:
+                        table.mark_dirty(key)
+                raise
+
+            return changed
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def migrate_json_metadata(json_path: str, store: MetadataStore, kinds: dict[str, str]) -> bool:
+    """
+    将旧版 JSON 元数据文件一次性导入 SQLite 存储
+
+    仅当存储为空且 JSON 文件存在时执行；导入成功后 JSON 文件被重命名为 `*.json.migrated` 作为备份。
+
+    Args:
+        json_path: 旧版 JSON 元数据文件路径
+        store: 目标存储
+        kinds: JSON 顶层键到存储表类别的映射，如 {"databases": "databases", "files": "files"}
+
+    Returns:
+        是否执行了迁移
+    """
+    if not os.path.exists(json_path) or not store.is_empty():
+        return False
+
+    try:
+        with open(json_path, encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as e:
+        logger.error(f"Failed to read legacy metadata {json_path}, skip migration: {e}")
+        return False
+
+    for json_key, kind in kinds.items():
+        store.table(kind).load_from(data.get(json_key) or {})
+    if data.get("version"):
+        store.set_meta("version", data["version"])
+    migrated = store.commit()
+
+    os.replace(json_path, f"{json_path}.migrated")
+    logger.info(f"Migrated {migrated} metadata records from {json_path} to {store.db_path}")
+    return True
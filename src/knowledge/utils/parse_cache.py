@@ -0,0 +1,156 @@
+"""文档解析结果缓存
+
+以 (文件内容哈希, 解析器, 解析参数) 为键缓存解析得到的 markdown。同一文档上传到多个知识库、
+调整分块参数后重新入库等场景下，跳过 MinerU / PaddleX / RapidOCR 等耗时的解析过程。
+缓存存放在 SQLite 中，总大小超过上限时按最近访问时间淘汰。
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from src import config
+from src.utils import logger
+
+# 解析逻辑发生不兼容变化时递增，使旧缓存全部失效
+PARSE_CACHE_VERSION = 1
+
+# 影响解析结果的入库参数
+PARSE_PARAM_KEYS = ("enable_ocr", "is_ocr", "enable_formula")
+
+
+def make_parse_key(content_hash: str, file_ext: str, params: dict | None) -> str:
+    """根据内容哈希、解析器（由文件类型与 OCR 方式决定）和解析参数生成缓存键"""
+    params = params or {}
+    payload = {
+        "version": PARSE_CACHE_VERSION,
+        "content_hash": content_hash,
+        "file_ext": file_ext.lower(),
+        "params": {key: params[key] for key in PARSE_PARAM_KEYS if key in params},
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ParseResultCache:
+    """
+    基于 SQLite 的解析结果缓存
+
+    Args:
+        db_path: SQLite 文件路径
+        max_bytes: 缓存内容的最大总字节数，超出后按 LRU 淘汰
+    """
+
+    def __init__(self, db_path: str, max_bytes: int = 2 * 1024**3):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS parse_results ("
+            "cache_key TEXT PRIMARY KEY, filename TEXT NOT NULL, markdown TEXT NOT NULL, "
+            "parse_info TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_parse_results_last_access ON parse_results (last_access)")
+        self._conn.commit()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, cache_key: str) -> tuple[str, str, dict] | None:
+        """查询缓存，返回 (markdown, 解析时的文件名, 解析信息)，未命中返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT filename, markdown, parse_info FROM parse_results WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute("UPDATE parse_results SET last_access = ? WHERE cache_key = ?", (time.time(), cache_key))
+            self._conn.commit()
+            self.hits += 1
+
+        filename, markdown, parse_info = row
+        return markdown, filename, json.loads(parse_info)
+
+    def put(self, cache_key: str, markdown: str, filename: str, parse_info: dict | None = None) -> None:
+        """写入缓存"""
+        size = len(markdown.encode("utf-8"))
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO parse_results (cache_key, filename, markdown, parse_info, size, last_access) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (cache_key, filename, markdown, json.dumps(parse_info or {}, ensure_ascii=False), size, time.time()),
+            )
+            self._conn.commit()
+            self._evict()
+
+    def _evict(self) -> None:
+        """超出容量时删除最久未访问的记录（调用方需持有锁）"""
+        if not self.max_bytes or self.max_bytes <= 0:
+            return
+
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM parse_results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        evicted = 0
+        rows = self._conn.execute("SELECT cache_key, size FROM parse_results ORDER BY last_access").fetchall()
+        for cache_key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM parse_results WHERE cache_key = ?", (cache_key,))
+            total -= size
+            evicted += 1
+        self._conn.commit()
+        logger.info(f"Evicted {evicted} entries from parse result cache")
+
+    def stats(self) -> dict:
+        """返回缓存统计信息"""
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM parse_results").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "size_bytes": total,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM parse_results")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+
+_parse_cache: ParseResultCache | None = None
+_parse_cache_lock = threading.Lock()
+
+
+def get_parse_cache() -> ParseResultCache | None:
+    """获取全局解析结果缓存，未启用时返回 None"""
+    global _parse_cache
+
+    if not config.enable_parse_cache:
+        return None
+
+    if _parse_cache is None:
+        with _parse_cache_lock:
+            if _parse_cache is None:
+                db_path = os.path.join(config.save_dir, "cache", "parse_results.db")
+                _parse_cache = ParseResultCache(db_path, max_bytes=config.parse_cache_max_size_mb * 1024**2)
+                logger.info(f"Parse result cache initialized at {db_path}")
+
+    _parse_cache.max_bytes = config.parse_cache_max_size_mb * 1024**2
+    return _parse_cache
@@ -0,0 +1,151 @@
+"""知识库检索结果缓存
+
+智能体在不同对话中会反复以相同的关键词检索同一个知识库。这里在进程内缓存检索结果：
+
+- 键为 (db_id, 规范化后的查询文本, 查询参数)；
+- 条目在 TTL 到期后失效，总条数超过上限时按 LRU 淘汰；
+- 知识库内容发生变化（添加内容、删除文件、删除知识库）时，该知识库的全部条目失效；
+- 每个知识库有一个失效代数，检索前读取，写入缓存时代数已变化（检索期间发生了失效）则不写入，
+  避免把失效前的旧结果写回缓存。
+"""
+
+import copy
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_query(query_text: str) -> str:
+    """规范化查询文本：Unicode NFKC、合并空白并去除首尾空白"""
+    return _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", query_text)).strip()
+
+
+class QueryResultCache:
+    """
+    带 TTL 的 LRU 检索结果缓存
+
+    Args:
+        max_entries: 最大缓存条数
+        ttl: 条目有效期（秒）
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        # {key: (expires_at, result)}
+        self._entries: OrderedDict[tuple, tuple[float, Any]] = OrderedDict()
+        # {db_id: {key, ...}}，用于按知识库失效
+        self._db_keys: dict[str, set[tuple]] = {}
+        # {db_id: 失效代数}，每次 invalidate 加一
+        self._generations: dict[str, int] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._hit_latency_total = 0.0
+        self._miss_latency_total = 0.0
+
+    @staticmethod
+    def make_key(db_id: str, query_text: str, kwargs: dict) -> tuple:
+        params = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)
+        return (db_id, normalize_query(query_text), params)
+
+    def get(self, key: tuple) -> tuple[bool, Any]:
+        """查询缓存，返回 (是否命中, 结果副本)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+
+            expires_at, result = entry
+            if expires_at < time.monotonic():
+                self._remove(key)
+                return False, None
+
+            self._entries.move_to_end(key)
+
+        return True, copy.deepcopy(result)
+
+    def generation(self, db_id: str) -> int:
+        """知识库当前的失效代数，检索前读取并传给 put"""
+        with self._lock:
+            return self._generations.get(db_id, 0)
+
+    def put(self, key: tuple, result: Any, generation: int | None = None) -> bool:
+        """
+        写入缓存，返回是否写入
+
+        generation 为检索前读取的失效代数，与当前代数不一致时说明检索期间知识库已变化，不写入。
+        """
+        db_id = key[0]
+        value = copy.deepcopy(result)
+        with self._lock:
+            if generation is not None and generation != self._generations.get(db_id, 0):
+                return False
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            self._db_keys.setdefault(db_id, set()).add(key)
+
+            while len(self._entries) > max(self.max_entries, 0):
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+            return True
+
+    def _remove(self, key: tuple) -> None:
+        """删除条目（调用方需持有锁）"""
+        self._entries.pop(key, None)
+        db_keys = self._db_keys.get(key[0])
+        if db_keys is not None:
+            db_keys.discard(key)
+            if not db_keys:
+                del self._db_keys[key[0]]
+
+    def invalidate(self, db_id: str) -> int:
+        """使指定知识库的全部缓存失效，返回删除的条目数"""
+        with self._lock:
+            keys = self._db_keys.pop(db_id, set())
+            self._generations[db_id] = self._generations.get(db_id, 0) + 1
+            for key in keys:
+                self._entries.pop(key, None)
+            self.invalidations += 1
+            return len(keys)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._db_keys.clear()
+            for db_id in self._generations:
+                self._generations[db_id] += 1
+
+    def record(self, hit: bool, latency: float) -> None:
+        """记录一次查询的命中情况与耗时（秒）"""
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self._hit_latency_total += latency
+            else:
+                self.misses += 1
+                self._miss_latency_total += latency
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "invalidations": self.invalidations,
+                "avg_hit_latency_ms": round(self._hit_latency_total / self.hits * 1000, 2) if self.hits else 0.0,
+                "avg_miss_latency_ms": round(self._miss_latency_total / self.misses * 1000, 2) if self.misses else 0.0,
+            }
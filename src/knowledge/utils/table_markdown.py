@@ -0,0 +1,157 @@
+"""表格文件（CSV / Excel）转 markdown
+
+每一行数据与表头组成一个独立的小表格（行块），便于检索时每个分块都带有列名。
+
+- 按列批量格式化单元格，逐行块以生成器输出，不构造逐行的 DataFrame，也不做字符串累加；
+- CSV 按批读取，xlsx 使用 openpyxl 的 read_only 模式流式读取；
+- pack_markdown_blocks 可直接按行块边界组装分块，分块器无需再处理整篇文本。
+"""
+
+import os
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+import pandas as pd
+
+TABLE_FILE_EXTENSIONS = (".csv", ".xls", ".xlsx")
+
+# 每批读取 / 格式化的行数
+TABLE_BATCH_ROWS = 5000
+
+
+def _format_column(values: pd.Series) -> pd.Series:
+    """将一列格式化为单元格文本：空值为空串，整数值浮点数去掉小数部分，转义竖线并合并换行"""
+    if pd.api.types.is_float_dtype(values):
+        non_null = values.dropna()
+        if len(non_null) and (non_null % 1 == 0).all():
+            values = values.astype("Int64")
+
+    text = values.astype(object).where(values.notna(), "").astype(str)
+    if pd.api.types.is_object_dtype(values) or pd.api.types.is_string_dtype(values):
+        text = text.str.replace("|", "\\|", regex=False).str.replace(r"\s*[\r\n]+\s*", " ", regex=True)
+    return text
+
+
+def _table_header(columns: Iterable) -> str:
+    names = [str(column).replace("|", "\\|").replace("\n", " ") for column in columns]
+    return "| " + " | ".join(names) + " |\n|" + "---|" * len(names)
+
+
+def iter_dataframe_row_blocks(df: pd.DataFrame, header: str | None = None) -> Iterator[str]:
+    """将 DataFrame 的每一行与表头组成 markdown 行块"""
+    if df.empty or len(df.columns) == 0:
+        return
+
+    header = header or _table_header(df.columns)
+    formatted = [_format_column(df.iloc[:, i]) for i in range(len(df.columns))]
+    rows = formatted[0].str.cat(formatted[1:], sep=" | ") if len(formatted) > 1 else formatted[0]
+    for row in rows:
+        yield f"{header}\n| {row} |"
+
+
+def _iter_csv_blocks(file_path: Path) -> Iterator[str]:
+    header = None
+    # 按文本读取，保留单元格原始写法
+    for df in pd.read_csv(file_path, dtype=str, keep_default_na=False, chunksize=TABLE_BATCH_ROWS):
+        header = header or _table_header(df.columns)
+        yield from iter_dataframe_row_blocks(df, header)
+
+
+def _iter_xlsx_blocks(file_path: Path) -> Iterator[str]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        for worksheet in workbook.worksheets:
+            yield f"## {worksheet.title}"
+
+            rows = worksheet.iter_rows(values_only=True)
+            columns = next(rows, None)
+            if columns is None:
+                continue
+            columns = [f"Unnamed: {i}" if name is None else name for i, name in enumerate(columns)]
+            header = _table_header(columns)
+
+            batch = []
+            for row in rows:
+                if all(value is None for value in row):
+                    continue
+                batch.append(row[: len(columns)])
+                if len(batch) >= TABLE_BATCH_ROWS:
+                    yield from iter_dataframe_row_blocks(pd.DataFrame(batch, columns=range(len(columns))), header)
+                    batch = []
+            if batch:
+                yield from iter_dataframe_row_blocks(pd.DataFrame(batch, columns=range(len(columns))), header)
+    finally:
+        workbook.close()
+
+
+def _iter_xls_blocks(file_path: Path) -> Iterator[str]:
+    # 旧版 .xls 不支持流式读取，按工作表整体读取
+    for sheet_name, df in pd.read_excel(file_path, sheet_name=None).items():
+        yield f"## {sheet_name}"
+        yield from iter_dataframe_row_blocks(df)
+
+
+def iter_table_markdown_blocks(file_path: str | os.PathLike) -> Iterator[str]:
+    """
+    逐块输出表格文件的 markdown：文件标题、工作表标题（Excel）以及各行的行块
+
+    Args:
+        file_path: .csv / .xls / .xlsx 文件路径
+    """
+    file_path = Path(file_path)
+    file_ext = file_path.suffix.lower()
+
+    yield f"# {file_path.name}"
+    if file_ext == ".csv":
+        yield from _iter_csv_blocks(file_path)
+    elif file_ext == ".xlsx":
+        yield from _iter_xlsx_blocks(file_path)
+    elif file_ext == ".xls":
+        yield from _iter_xls_blocks(file_path)
+    else:
+        raise ValueError(f"Unsupported table file type: {file_ext}")
+
+
+def table_file_to_markdown(file_path: str | os.PathLike) -> str:
+    """将表格文件转换为 markdown，各块之间以空行分隔"""
+    return "\n\n".join(iter_table_markdown_blocks(file_path))
+
+
+def pack_markdown_blocks(blocks: Iterable[str], chunk_size: int) -> Iterator[str]:
+    """
+    按块边界将 markdown 块组装为不超过 chunk_size 的分块
+
+    以 # 开头的块视为标题：标题会作为后续分块的前缀，使跨分块的行块仍保留所在工作表的上下文。
+    单个块超过 chunk_size 时单独成块。
+    """
+    headings: list[str] = []
+    current: list[str] = []
+    current_size = 0
+
+    for block in blocks:
+        if not block.strip():
+            continue
+
+        if block.startswith("#"):
+            level = len(block) - len(block.lstrip("#"))
+            headings = headings[: level - 1] + [block]
+            if current:
+                yield "\n\n".join(current)
+                current, current_size = [], 0
+            continue
+
+        if current and current_size + len(block) + 2 > chunk_size:
+            yield "\n\n".join(current)
+            current, current_size = [], 0
+
+        if not current:
+            current = list(headings)
+            current_size = sum(len(heading) + 2 for heading in headings)
+
+        current.append(block)
+        current_size += len(block) + 2
+
+    if current:
+        yield "\n\n".join(current)
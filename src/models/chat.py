@@ -1,7 +1,7 @@
 import os
 import traceback
 
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 from tenacity import before_sleep_log, retry, retry_if_exception_type, stop_after_attempt, wait_exponential
 
 from src import config
@@ -28,9 +28,16 @@ class OpenAIBase:
         self.api_key = api_key
         self.base_url = base_url
         self.client = OpenAI(api_key=api_key, base_url=base_url)
+        self._async_client: AsyncOpenAI | None = None
         self.model_name = model_name
         self.info = kwargs
 
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+        return self._async_client
+
     @retry(
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=1, max=10),
@@ -60,6 +67,34 @@ class OpenAIBase:
 
         return response
 
+    @retry(
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=1, max=10),
+        retry=retry_if_exception_type((Exception,)),
+        before_sleep=before_sleep_log(logger, log_level="WARNING"),
+        reraise=True,
+    )
+    async def acall(self, message, **kwargs):
+        """call 的异步版本（非流式），不阻塞事件循环；kwargs 透传给 chat.completions.create"""
+        messages = [{"role": "user", "content": message}] if isinstance(message, str) else message
+
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model_name,
+                messages=messages,
+                stream=False,
+                **kwargs,
+            )
+        except Exception as e:
+            err = (
+                f"Error getting response: {e}, URL: {self.base_url}, "
+                f"API Key: {self.api_key[:5]}***, Model: {self.model_name}"
+            )
+            logger.error(err)
+            raise Exception(err)
+
+        return response.choices[0].message
+
     def _stream_response(self, messages):
         response = self.client.chat.completions.create(
             model=self.model_name,
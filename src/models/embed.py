@@ -1,17 +1,89 @@
 import asyncio
+import importlib.util
 import json
 import os
 from abc import ABC, abstractmethod
 
 import httpx
 import requests
+from tenacity import (
+    AsyncRetrying,
+    before_sleep_log,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential,
+)
 
 from src import config
+from src.models.embed_cache import EmbeddingCache, get_embedding_cache
 from src.utils import get_docker_safe_url, hashstr, logger
 
+# 需要重试的 HTTP 状态码（限流与服务端错误）
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# 服务端以这些状态码拒绝过大的批次时，自动减小批次后重试
+BATCH_TOO_LARGE_STATUS_CODES = {400, 413}
+
+# httpx 的 HTTP/2 支持依赖 h2 包，未安装时回退到 HTTP/1.1
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+AsyncClientsByLoop = dict[asyncio.AbstractEventLoop, tuple[httpx.AsyncClient, asyncio.Semaphore]]
+
+
+def prune_closed_loop_clients(clients: AsyncClientsByLoop) -> None:
+    """
+    丢弃事件循环已关闭的客户端
+
+    连接只能在创建它的事件循环中 aclose，循环关闭后无法再 await，释放引用后由垃圾回收关闭底层 socket。
+    """
+    for loop in [loop for loop in clients if loop.is_closed()]:
+        client, _ = clients.pop(loop)
+        if not client.is_closed:
+            logger.debug("Discarding async HTTP client of a closed event loop")
+
+
+async def aclose_loop_clients(clients: AsyncClientsByLoop) -> None:
+    """关闭全部客户端：当前事件循环的直接关闭，其他仍在运行的事件循环的提交到所属循环关闭"""
+    current_loop = asyncio.get_running_loop()
+    entries = list(clients.items())
+    clients.clear()
+    for loop, (client, _) in entries:
+        if client.is_closed:
+            continue
+        if loop is current_loop:
+            await client.aclose()
+        elif loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+
+
+class EmbeddingBatchTooLargeError(ValueError):
+    """嵌入服务拒绝了过大的批次"""
+
+    pass
+
+
+def _is_retryable_error(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRY_STATUS_CODES
+    return isinstance(exc, httpx.TransportError)
+
 
 class BaseEmbeddingModel(ABC):
-    def __init__(self, model=None, name=None, dimension=None, url=None, base_url=None, api_key=None):
+    def __init__(
+        self,
+        model=None,
+        name=None,
+        dimension=None,
+        url=None,
+        base_url=None,
+        api_key=None,
+        max_concurrency=8,
+        max_retries=3,
+        timeout=60,
+        http2=True,
+        batch_size=None,
+        max_batch_tokens=None,
+    ):
         """
         Args:
             model: 模型名称，冗余设计，同name
@@ -20,6 +92,12 @@ class BaseEmbeddingModel(ABC):
             url: 请求URL，冗余设计，同base_url
             base_url: 基础URL，请求URL，冗余设计，同url
             api_key: 请求API密钥
+            max_concurrency: 异步请求的最大并发数，同时也是连接池大小
+            max_retries: 遇到 429/5xx 或网络错误时的最大重试次数
+            timeout: 单次请求超时时间（秒）
+            http2: 是否启用 HTTP/2（需要安装 h2，且服务端通过 TLS 协商支持）
+            batch_size: 服务端允许的单批最大条数，批量编码时作为批次大小的上限
+            max_batch_tokens: 单批文本的最大 token 数（按字符数估算）
         """
         base_url = base_url or url
         self.model = model or name
@@ -28,19 +106,134 @@ class BaseEmbeddingModel(ABC):
         self.api_key = os.getenv(api_key, api_key)
         self.embed_state = {}
 
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_retries = max(0, int(max_retries))
+        self.timeout = timeout
+        self.http2 = bool(http2) and HTTP2_AVAILABLE
+        self.batch_size = int(batch_size) if batch_size else None
+        self.max_batch_tokens = int(max_batch_tokens) if max_batch_tokens else None
+
+        # 异步客户端与信号量都绑定到事件循环，按循环分别惰性创建 {loop: (client, semaphore)}
+        self._async_clients: AsyncClientsByLoop = {}
+
+    def _get_async_client(self) -> tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        """获取当前事件循环下复用的连接池客户端和并发信号量"""
+        loop = asyncio.get_running_loop()
+        entry = self._async_clients.get(loop)
+        if entry is None or entry[0].is_closed:
+            prune_closed_loop_clients(self._async_clients)
+            limits = httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+                keepalive_expiry=60,
+            )
+            entry = (
+                httpx.AsyncClient(http2=self.http2, limits=limits, timeout=self.timeout),
+                asyncio.Semaphore(self.max_concurrency),
+            )
+            self._async_clients[loop] = entry
+        return entry
+
+    async def _apost(self, payload: dict, headers: dict | None = None) -> dict:
+        """
+        通过共享连接池发送请求，限制并发并在 429/5xx 时指数退避重试
+
+        Returns:
+            dict: 响应 JSON
+        """
+        client, semaphore = self._get_async_client()
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(self.max_retries + 1),
+            wait=wait_exponential(multiplier=0.5, min=0.5, max=10),
+            retry=retry_if_exception(_is_retryable_error),
+            before_sleep=before_sleep_log(logger, log_level="WARNING"),
+            reraise=True,
+        ):
+            with attempt:
+                async with semaphore:
+                    response = await client.post(self.base_url, json=payload, headers=headers)
+                try:
+                    response.raise_for_status()
+                except httpx.HTTPStatusError as e:
+                    inputs = payload.get("input")
+                    if (
+                        e.response.status_code in BATCH_TOO_LARGE_STATUS_CODES
+                        and isinstance(inputs, list)
+                        and len(inputs) > 1
+                    ):
+                        raise EmbeddingBatchTooLargeError(
+                            f"Embedding batch of {len(inputs)} rejected with {e.response.status_code}"
+                        ) from e
+                    raise
+                return response.json()
+
+    async def aclose(self) -> None:
+        """关闭异步连接池"""
+        await aclose_loop_clients(self._async_clients)
+
     @abstractmethod
-    def encode(self, message: list[str] | str) -> list[list[float]]:
-        """同步编码"""
+    def _encode(self, message: list[str]) -> list[list[float]]:
+        """同步请求嵌入服务（不经过缓存）"""
         raise NotImplementedError("Subclasses must implement this method")
 
+    @abstractmethod
+    async def _aencode(self, message: list[str]) -> list[list[float]]:
+        """异步请求嵌入服务（不经过缓存）"""
+        raise NotImplementedError("Subclasses must implement this method")
+
+    def _cache_lookup(self, texts: list[str]) -> tuple[EmbeddingCache | None, list[list[float] | None]]:
+        """查询嵌入缓存，缓存不可用时视为全部未命中"""
+        cache = get_embedding_cache()
+        if cache is None or not texts:
+            return None, [None] * len(texts)
+        try:
+            return cache, cache.get_many(self.model, self.dimension, texts)
+        except Exception as e:
+            logger.warning(f"Embedding cache lookup failed: {e}")
+            return None, [None] * len(texts)
+
+    def _cache_merge(
+        self,
+        cache: EmbeddingCache | None,
+        texts: list[str],
+        cached: list[list[float] | None],
+        miss_texts: list[str],
+        miss_vectors: list[list[float]],
+    ) -> list[list[float]]:
+        """写入新计算的向量，并按原始顺序合并缓存命中结果"""
+        if cache is not None and miss_texts:
+            try:
+                cache.put_many(self.model, self.dimension, miss_texts, miss_vectors)
+            except Exception as e:
+                logger.warning(f"Embedding cache write failed: {e}")
+
+        computed = dict(zip(miss_texts, miss_vectors))
+        return [vector if vector is not None else computed[text] for text, vector in zip(texts, cached)]
+
+    @staticmethod
+    def _collect_misses(texts: list[str], cached: list[list[float] | None]) -> list[str]:
+        """未命中的文本（去重且保持顺序）"""
+        return list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+
+    def encode(self, message: list[str] | str) -> list[list[float]]:
+        """同步编码，仅缓存未命中的文本会请求嵌入服务"""
+        texts = [message] if isinstance(message, str) else list(message)
+        cache, cached = self._cache_lookup(texts)
+        miss_texts = self._collect_misses(texts, cached)
+        miss_vectors = self._encode(miss_texts) if miss_texts else []
+        return self._cache_merge(cache, texts, cached, miss_texts, miss_vectors)
+
     def encode_queries(self, queries: list[str] | str) -> list[list[float]]:
         """等同于encode"""
         return self.encode(queries)
 
-    @abstractmethod
     async def aencode(self, message: list[str] | str) -> list[list[float]]:
-        """异步编码"""
-        raise NotImplementedError("Subclasses must implement this method")
+        """异步编码，仅缓存未命中的文本会请求嵌入服务"""
+        texts = [message] if isinstance(message, str) else list(message)
+        cache, cached = await asyncio.to_thread(self._cache_lookup, texts)
+        miss_texts = self._collect_misses(texts, cached)
+        miss_vectors = await self._aencode(miss_texts) if miss_texts else []
+        return await asyncio.to_thread(self._cache_merge, cache, texts, cached, miss_texts, miss_vectors)
 
     async def aencode_queries(self, queries: list[str] | str) -> list[list[float]]:
         """等同于aencode"""
@@ -48,40 +241,88 @@ class BaseEmbeddingModel(ABC):
 
     def batch_encode(self, messages: list[str], batch_size: int = 40) -> list[list[float]]:
         # logger.info(f"Batch encoding {len(messages)} messages")
-        data = []
         task_id = None
         if len(messages) > batch_size:
             task_id = hashstr(messages)
             self.embed_state[task_id] = {"status": "in-progress", "total": len(messages), "progress": 0}
 
-        for i in range(0, len(messages), batch_size):
-            group_msg = messages[i : i + batch_size]
-            logger.info(f"Encoding [{i}/{len(messages)}] messages (bsz={batch_size})")
-            response = self.encode(group_msg)
-            data.extend(response)
+        cache, cached = self._cache_lookup(messages)
+        miss_texts = self._collect_misses(messages, cached)
+        hit_count = len(messages) - sum(1 for vector in cached if vector is None)
+        if hit_count:
+            logger.info(f"Embedding cache hit {hit_count}/{len(messages)} messages")
+
+        miss_vectors = []
+        for group_msg in self._plan_batches(miss_texts, batch_size):
+            logger.info(f"Encoding [{len(miss_vectors)}/{len(miss_texts)}] messages (bsz={len(group_msg)})")
+            response = self._encode(group_msg)
+            miss_vectors.extend(response)
             if task_id:
-                self.embed_state[task_id]["progress"] = i + len(group_msg)
+                self.embed_state[task_id]["progress"] = hit_count + len(miss_vectors)
+
+        data = self._cache_merge(cache, messages, cached, miss_texts, miss_vectors)
 
         if task_id:
+            self.embed_state[task_id]["progress"] = len(messages)
             self.embed_state[task_id]["status"] = "completed"
 
         return data
 
+    def _plan_batches(self, texts: list[str], batch_size: int) -> list[list[str]]:
+        """按条数上限和 token 上限（按字符数估算）切分批次"""
+        if self.batch_size:
+            batch_size = min(batch_size, self.batch_size)
+        batch_size = max(1, batch_size)
+
+        batches, current, current_tokens = [], [], 0
+        for text in texts:
+            tokens = len(text)
+            over_tokens = self.max_batch_tokens and current_tokens + tokens > self.max_batch_tokens
+            if current and (len(current) >= batch_size or over_tokens):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(text)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def _aencode_adaptive(self, texts: list[str]) -> list[list[float]]:
+        """请求嵌入服务，批次被拒绝时对半拆分重试，并记住更小的批次上限"""
+        try:
+            return await self._aencode(texts)
+        except EmbeddingBatchTooLargeError:
+            half = len(texts) // 2
+            left, right = await asyncio.gather(
+                self._aencode_adaptive(texts[:half]), self._aencode_adaptive(texts[half:])
+            )
+            # 拆分后请求成功，说明确实是批次过大（而非个别文本非法），此时才收紧上限
+            if not self.batch_size or half < self.batch_size:
+                logger.warning(f"Embedding batch of {len(texts)} too large for {self.model}, shrinking to {half}")
+                self.batch_size = half
+            return left + right
+
     async def abatch_encode(self, messages: list[str], batch_size: int = 40) -> list[list[float]]:
-        data = []
         task_id = None
         if len(messages) > batch_size:
             task_id = hashstr(messages)
             self.embed_state[task_id] = {"status": "in-progress", "total": len(messages), "progress": 0}
 
-        tasks = []
-        for i in range(0, len(messages), batch_size):
-            group_msg = messages[i : i + batch_size]
-            tasks.append(self.aencode(group_msg))
+        cache, cached = await asyncio.to_thread(self._cache_lookup, messages)
+        miss_texts = self._collect_misses(messages, cached)
+        hit_count = len(messages) - sum(1 for vector in cached if vector is None)
+        if hit_count:
+            logger.info(f"Embedding cache hit {hit_count}/{len(messages)} messages")
 
+        # 各批次并发提交，实际在途请求数由 max_concurrency 限制
+        tasks = [self._aencode_adaptive(group_msg) for group_msg in self._plan_batches(miss_texts, batch_size)]
+
+        miss_vectors = []
         results = await asyncio.gather(*tasks)
         for res in results:
-            data.extend(res)
+            miss_vectors.extend(res)
+
+        data = await asyncio.to_thread(self._cache_merge, cache, messages, cached, miss_texts, miss_vectors)
 
         if task_id:
             self.embed_state[task_id]["progress"] = len(messages)
@@ -99,10 +340,7 @@ class OllamaEmbedding(BaseEmbeddingModel):
         super().__init__(**kwargs)
         self.base_url = self.base_url or get_docker_safe_url("http://localhost:11434/api/embed")
 
-    def encode(self, message: list[str] | str) -> list[list[float]]:
-        if isinstance(message, str):
-            message = [message]
-
+    def _encode(self, message: list[str]) -> list[list[float]]:
         payload = {"model": self.model, "input": message}
         try:
             response = requests.post(self.base_url, json=payload, timeout=60)
@@ -115,22 +353,16 @@ class OllamaEmbedding(BaseEmbeddingModel):
             logger.error(f"Ollama Embedding request failed: {e}, {payload}")
             raise ValueError(f"Ollama Embedding request failed: {e}")
 
-    async def aencode(self, message: list[str] | str) -> list[list[float]]:
-        if isinstance(message, str):
-            message = [message]
-
+    async def _aencode(self, message: list[str]) -> list[list[float]]:
         payload = {"model": self.model, "input": message}
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(self.base_url, json=payload, timeout=60)
-                response.raise_for_status()
-                result = response.json()
-                if "embeddings" not in result:
-                    raise ValueError(f"Ollama Embedding failed: Invalid response format {result}")
-                return result["embeddings"]
-            except (httpx.RequestError, json.JSONDecodeError) as e:
-                logger.error(f"Ollama Embedding async request failed: {e}, {payload}")
-                raise ValueError(f"Ollama Embedding async request failed: {e}")
+        try:
+            result = await self._apost(payload)
+            if "embeddings" not in result:
+                raise ValueError(f"Ollama Embedding failed: Invalid response format {result}")
+            return result["embeddings"]
+        except (httpx.HTTPError, json.JSONDecodeError) as e:
+            logger.error(f"Ollama Embedding async request failed: {e}, {payload}")
+            raise ValueError(f"Ollama Embedding async request failed: {e}")
 
 
 class OtherEmbedding(BaseEmbeddingModel):
@@ -141,7 +373,7 @@ class OtherEmbedding(BaseEmbeddingModel):
     def build_payload(self, message: list[str] | str) -> dict:
         return {"model": self.model, "input": message}
 
-    def encode(self, message: list[str] | str) -> list[list[float]]:
+    def _encode(self, message: list[str]) -> list[list[float]]:
         payload = self.build_payload(message)
         try:
             response = requests.post(self.base_url, json=payload, headers=self.headers, timeout=60)
@@ -154,19 +386,16 @@ class OtherEmbedding(BaseEmbeddingModel):
             logger.error(f"Other Embedding request failed: {e}, {payload}")
             raise ValueError(f"Other Embedding request failed: {e}")
 
-    async def aencode(self, message: list[str] | str) -> list[list[float]]:
+    async def _aencode(self, message: list[str]) -> list[list[float]]:
         payload = self.build_payload(message)
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(self.base_url, json=payload, headers=self.headers, timeout=60)
-                response.raise_for_status()
-                result = response.json()
-                if not isinstance(result, dict) or "data" not in result:
-                    raise ValueError(f"Other Embedding failed: Invalid response format {result}")
-                return [item["embedding"] for item in result["data"]]
-            except (httpx.RequestError, json.JSONDecodeError) as e:
-                logger.error(f"Other Embedding async request failed: {e}, {payload}")
-                raise ValueError(f"Other Embedding async request failed: {e}")
+        try:
+            result = await self._apost(payload, headers=self.headers)
+            if not isinstance(result, dict) or "data" not in result:
+                raise ValueError(f"Other Embedding failed: Invalid response format {result}")
+            return [item["embedding"] for item in result["data"]]
+        except (httpx.HTTPError, json.JSONDecodeError) as e:
+            logger.error(f"Other Embedding async request failed: {e}, {payload}")
+            raise ValueError(f"Other Embedding async request failed: {e}")
 
     async def test_connection(self) -> tuple[bool, str]:
         """
@@ -176,9 +405,9 @@ class OtherEmbedding(BaseEmbeddingModel):
             tuple: (success: bool, message: str)
         """
         try:
-            # 使用简单的测试文本
+            # 使用简单的测试文本，绕过缓存直接请求服务
             test_text = ["Hello world"]
-            await self.aencode(test_text)
+            await self._aencode(test_text)
             return True, "连接正常"
         except Exception as e:
             error_msg = str(e)
@@ -195,6 +424,7 @@ async def test_embedding_model_status(model_id: str) -> dict:
     Returns:
         dict: 包含状态信息的字典
     """
+    model = None
     try:
         support_embed_models = config.embed_model_names.keys()
         if model_id not in support_embed_models:
@@ -217,6 +447,11 @@ async def test_embedding_model_status(model_id: str) -> dict:
         logger.warning(f"测试embedding模型状态失败 {model_id}: {e}")
         return {"model_id": model_id, "status": "error", "message": str(e)}
 
+    finally:
+        # 每次测试都会创建新的模型实例，关闭其连接池
+        if model is not None:
+            await model.aclose()
+
 
 async def test_all_embedding_models_status() -> dict:
     """
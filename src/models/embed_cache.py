@@ -0,0 +1,183 @@
+"""嵌入向量缓存
+
+以 (模型, 维度, 规范化文本的哈希) 为键，将向量以 float32 二进制存入 SQLite。
+重复入库、调整分块后重建索引、图谱实体向量化等场景下，只有未命中的文本才会请求嵌入服务。
+超过容量上限时按最近访问时间淘汰。
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+
+from src import config
+from src.utils import logger
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本（Unicode NFC + 去除首尾空白），保证等价文本命中同一条缓存"""
+    return unicodedata.normalize("NFC", text).strip()
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    基于 SQLite 的嵌入向量缓存
+
+    Args:
+        db_path: SQLite 文件路径
+        max_entries: 最大缓存条数，超出后按 LRU 淘汰
+    """
+
+    # 每写入多少条检查一次容量，避免每次写入都统计总数
+    EVICT_CHECK_INTERVAL = 1000
+
+    def __init__(self, db_path: str, max_entries: int = 500_000):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, dimension INTEGER NOT NULL, text_hash TEXT NOT NULL, "
+            "vector BLOB NOT NULL, last_access REAL NOT NULL, "
+            "PRIMARY KEY (model, dimension, text_hash))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_access ON embeddings (last_access)")
+        self._conn.commit()
+
+        self.hits = 0
+        self.misses = 0
+        self._writes_since_check = 0
+
+    def get_many(self, model: str, dimension: int | None, texts: list[str]) -> list[list[float] | None]:
+        """批量查询缓存，未命中的位置返回 None"""
+        if not texts:
+            return []
+
+        dimension = dimension or 0
+        hashes = [text_hash(text) for text in texts]
+        unique_hashes = list(dict.fromkeys(hashes))
+        found: dict[str, list[float]] = {}
+
+        with self._lock:
+            # SQLite 默认最多 999 个绑定参数
+            for i in range(0, len(unique_hashes), 500):
+                group = unique_hashes[i : i + 500]
+                placeholders = ",".join("?" * len(group))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND dimension = ? AND text_hash IN ({placeholders})",
+                    (model, dimension, *group),
+                ).fetchall()
+                for hash_value, blob in rows:
+                    found[hash_value] = array("f", blob).tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND dimension = ? AND text_hash = ?",
+                    [(now, model, dimension, h) for h in found],
+                )
+                self._conn.commit()
+
+            results = [found.get(h) for h in hashes]
+            hit_count = sum(1 for r in results if r is not None)
+            self.hits += hit_count
+            self.misses += len(results) - hit_count
+
+        return results
+
+    def put_many(self, model: str, dimension: int | None, texts: list[str], vectors: list[list[float]]) -> None:
+        """批量写入缓存"""
+        if not texts:
+            return
+
+        dimension = dimension or 0
+        now = time.time()
+        rows = [
+            (model, dimension, text_hash(text), array("f", vector).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, dimension, text_hash, vector, last_access) "
+                "VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+            self._writes_since_check += len(rows)
+            if self._writes_since_check >= self.EVICT_CHECK_INTERVAL:
+                self._writes_since_check = 0
+                self._evict()
+
+    def _evict(self) -> None:
+        """超出容量时删除最久未访问的记录（调用方需持有锁）"""
+        if not self.max_entries or self.max_entries <= 0:
+            return
+
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow <= 0:
+            return
+
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?)",
+            (overflow,),
+        )
+        self._conn.commit()
+        logger.info(f"Evicted {overflow} entries from embedding cache")
+
+    def stats(self) -> dict:
+        """返回缓存统计信息"""
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+
+_embedding_cache: EmbeddingCache | None = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache | None:
+    """获取全局嵌入缓存，未启用时返回 None"""
+    global _embedding_cache
+
+    if not config.enable_embedding_cache:
+        return None
+
+    if _embedding_cache is None:
+        with _embedding_cache_lock:
+            if _embedding_cache is None:
+                db_path = os.path.join(config.save_dir, "cache", "embeddings.db")
+                _embedding_cache = EmbeddingCache(db_path, max_entries=config.embedding_cache_max_entries)
+                logger.info(f"Embedding cache initialized at {db_path}")
+
+    _embedding_cache.max_entries = config.embedding_cache_max_entries
+    return _embedding_cache
@@ -1,40 +1,226 @@
-import json
+import asyncio
+import hashlib
 import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
 
+import httpx
 import numpy as np
 import requests
+from tenacity import (
+    AsyncRetrying,
+    before_sleep_log,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_exponential,
+)
 
 from src import config
-from src.utils import get_docker_safe_url
+from src.models.embed import (
+    RETRY_STATUS_CODES,
+    AsyncClientsByLoop,
+    aclose_loop_clients,
+    prune_closed_loop_clients,
+)
+from src.utils import get_docker_safe_url, logger
+
+_WHITESPACE_RE = re.compile(r"\s+")
 
 
 def sigmoid(x):
     return 1 / (1 + np.exp(-x))
 
 
+def _is_retryable_error(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in RETRY_STATUS_CODES
+    return isinstance(exc, httpx.TransportError)
+
+
+class RerankScoreCache:
+    """
+    进程内的重排序得分缓存，键为 (模型, 规范化查询, 文档哈希)，按 LRU 淘汰
+
+    缓存的是未经 sigmoid 的原始得分，normalize 与否不影响命中。
+    """
+
+    def __init__(self, max_entries: int = 100_000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, float] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, query: str, document: str) -> tuple:
+        query = _WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", query)).strip()
+        return (model, query, hashlib.sha1(document.encode("utf-8")).hexdigest())
+
+    def get_many(self, keys: list[tuple]) -> list[float | None]:
+        with self._lock:
+            scores = []
+            for key in keys:
+                score = self._entries.get(key)
+                if score is not None:
+                    self._entries.move_to_end(key)
+                scores.append(score)
+            hit_count = sum(1 for score in scores if score is not None)
+            self.hits += hit_count
+            self.misses += len(scores) - hit_count
+            return scores
+
+    def put_many(self, keys: list[tuple], scores: list[float]) -> None:
+        with self._lock:
+            for key, score in zip(keys, scores):
+                self._entries[key] = score
+                self._entries.move_to_end(key)
+            while len(self._entries) > max(self.max_entries, 0):
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+            }
+
+
+_score_cache = RerankScoreCache()
+
+
 class OnlineReranker:
-    def __init__(self, model_name, api_key, base_url, **kwargs):
+    def __init__(self, model_name, api_key, base_url, max_concurrency=4, max_retries=3, timeout=30, **kwargs):
+        """
+        Args:
+            model_name: 模型名称
+            api_key: 请求API密钥
+            base_url: 请求URL
+            max_concurrency: 异步请求的最大并发数，同时也是连接池大小
+            max_retries: 遇到 429/5xx 或网络错误时的最大重试次数
+            timeout: 单次请求超时时间（秒）
+        """
         self.url = get_docker_safe_url(base_url)
         self.model = model_name
         self.api_key = api_key
         self.headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
 
-    def compute_score(self, sentence_pairs, batch_size=256, max_length=512, normalize=False):
-        # TODO 还没实现 batch_size
-        query, sentences = sentence_pairs[0], sentence_pairs[1]
-        payload = self.build_payload(query, sentences, max_length)
-        response = requests.request("POST", self.url, json=payload, headers=self.headers)
-        response = json.loads(response.text)
-        # logger.debug(f"SiliconFlow Reranker response: {response}")
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_retries = max(0, int(max_retries))
+        self.timeout = timeout
+        self.score_cache = _score_cache
 
+        # 异步客户端与信号量都绑定到事件循环，按循环分别惰性创建 {loop: (client, semaphore)}
+        self._async_clients: AsyncClientsByLoop = {}
+
+    def _get_async_client(self) -> tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        """获取当前事件循环下复用的连接池客户端和并发信号量"""
+        loop = asyncio.get_running_loop()
+        entry = self._async_clients.get(loop)
+        if entry is None or entry[0].is_closed:
+            prune_closed_loop_clients(self._async_clients)
+            limits = httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+                keepalive_expiry=60,
+            )
+            entry = (httpx.AsyncClient(limits=limits, timeout=self.timeout), asyncio.Semaphore(self.max_concurrency))
+            self._async_clients[loop] = entry
+        return entry
+
+    async def aclose(self) -> None:
+        """关闭异步连接池"""
+        await aclose_loop_clients(self._async_clients)
+
+    @staticmethod
+    def _parse_scores(response: dict) -> list[float]:
         results = sorted(response["results"], key=lambda x: x["index"])
-        all_scores = [result["relevance_score"] for result in results]
+        return [result["relevance_score"] for result in results]
 
-        if normalize:
-            all_scores = [sigmoid(score) for score in all_scores]
+    def _rerank_batch(self, query: str, sentences: list[str], max_length: int) -> list[float]:
+        payload = self.build_payload(query, sentences, max_length)
+        response = requests.post(self.url, json=payload, headers=self.headers, timeout=self.timeout)
+        response.raise_for_status()
+        return self._parse_scores(response.json())
 
+    async def _arerank_batch(self, query: str, sentences: list[str], max_length: int) -> list[float]:
+        """通过共享连接池请求一批文档的得分，限制并发并在 429/5xx 时指数退避重试"""
+        client, semaphore = self._get_async_client()
+        payload = self.build_payload(query, sentences, max_length)
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(self.max_retries + 1),
+            wait=wait_exponential(multiplier=0.5, min=0.5, max=10),
+            retry=retry_if_exception(_is_retryable_error),
+            before_sleep=before_sleep_log(logger, log_level="WARNING"),
+            reraise=True,
+        ):
+            with attempt:
+                async with semaphore:
+                    response = await client.post(self.url, json=payload, headers=self.headers)
+                response.raise_for_status()
+                return self._parse_scores(response.json())
+
+    def _lookup(self, query: str, sentences: list[str]) -> tuple[list[float | None], list[str]]:
+        """查询得分缓存，返回 (已缓存得分, 未命中的文档（去重）)"""
+        cached = self.score_cache.get_many([self.score_cache.make_key(self.model, query, s) for s in sentences])
+        misses = list(dict.fromkeys(s for s, score in zip(sentences, cached) if score is None))
+        return cached, misses
+
+    def _merge(self, query, sentences, cached, misses, miss_scores, normalize) -> list[float]:
+        """写入新计算的得分，并按原始顺序合并缓存命中结果"""
+        computed = dict(zip(misses, miss_scores))
+        if misses:
+            self.score_cache.put_many([self.score_cache.make_key(self.model, query, s) for s in misses], miss_scores)
+
+        all_scores = [score if score is not None else computed[s] for s, score in zip(sentences, cached)]
+        if normalize:
+            all_scores = [float(sigmoid(score)) for score in all_scores]
         return all_scores
 
+    def compute_score(self, sentence_pairs, batch_size=256, max_length=512, normalize=False):
+        """
+        同步计算得分
+
+        Args:
+            sentence_pairs: (query, sentences)
+            batch_size: 单次请求的最大文档数
+        """
+        query, sentences = sentence_pairs[0], sentence_pairs[1]
+        cached, misses = self._lookup(query, sentences)
+
+        miss_scores = []
+        for i in range(0, len(misses), max(1, batch_size)):
+            miss_scores.extend(self._rerank_batch(query, misses[i : i + batch_size], max_length))
+
+        return self._merge(query, sentences, cached, misses, miss_scores, normalize)
+
+    async def acompute_score(self, sentence_pairs, batch_size=32, max_length=512, normalize=False):
+        """
+        异步计算得分，未命中缓存的文档按 batch_size 分批并发请求，在途请求数由 max_concurrency 限制
+
+        Args:
+            sentence_pairs: (query, sentences)
+            batch_size: 单次请求的最大文档数
+        """
+        query, sentences = sentence_pairs[0], sentence_pairs[1]
+        cached, misses = self._lookup(query, sentences)
+
+        batch_size = max(1, batch_size)
+        results = await asyncio.gather(
+            *[
+                self._arerank_batch(query, misses[i : i + batch_size], max_length)
+                for i in range(0, len(misses), batch_size)
+            ]
+        )
+        miss_scores = [score for batch in results for score in batch]
+
+        return self._merge(query, sentences, cached, misses, miss_scores, normalize)
+
     def build_payload(self, query, sentences, max_length=512):
         return {
             "model": self.model,
@@ -44,12 +230,26 @@ class OnlineReranker:
         }
 
 
+_rerankers: dict[str, OnlineReranker] = {}
+
+
 def get_reranker(model_id, **kwargs):
+    """获取（并复用）重排序模型，复用其连接池"""
     support_rerankers = config.reranker_names.keys()
     assert model_id in support_rerankers, f"Unsupported Reranker: {model_id}, only support {support_rerankers}"
 
-    model_info = config.reranker_names[model_id]
-    base_url = model_info["base_url"]
-    api_key = os.getenv(model_info["api_key"], model_info["api_key"])
-    assert api_key, f"{model_info['name']} api_key is required"
-    return OnlineReranker(model_name=model_info["name"], api_key=api_key, base_url=base_url, **kwargs)
+    if model_id not in _rerankers:
+        model_info = config.reranker_names[model_id]
+        base_url = model_info["base_url"]
+        api_key = os.getenv(model_info["api_key"], model_info["api_key"])
+        assert api_key, f"{model_info['name']} api_key is required"
+        _rerankers[model_id] = OnlineReranker(
+            model_name=model_info["name"], api_key=api_key, base_url=base_url, **kwargs
+        )
+    return _rerankers[model_id]
+
+
+async def aclose_rerankers() -> None:
+    """关闭复用的重排序模型的连接池（服务关闭时调用）"""
+    for reranker in list(_rerankers.values()):
+        await reranker.aclose()
@@ -1,17 +1,28 @@
+import importlib
+import multiprocessing
 import os
+import sys
+import threading
 import time
-import uuid
+import unicodedata
 from argparse import ArgumentParser
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 
 import fitz  # fitz就是pip install PyMuPDF
 import numpy as np  # Added import for numpy
 from PIL import Image
 from rapidocr_onnxruntime import RapidOCR
-from tqdm import tqdm
 
 from src.utils import logger
 
+# 并行 OCR 工作进程的入口以顶层模块导入，spawn 出的工作进程继承 sys.path 后无需导入 src
+_OCR_WORKER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ocr_worker")
+if _OCR_WORKER_DIR not in sys.path:
+    sys.path.append(_OCR_WORKER_DIR)
+ocr_worker = importlib.import_module("yuxi_ocr_worker")
+
 GOLBAL_STATE = {}
 
 # OCR服务监控统计
@@ -50,6 +61,59 @@ def get_ocr_stats():
     return stats
 
 
+# PDF 渲染为图像的缩放倍数
+PDF_RENDER_ZOOM = 2
+
+# 并行 OCR 的默认进程数
+DEFAULT_OCR_WORKERS = int(os.getenv("OCR_WORKERS", min(os.cpu_count() or 1, 4)))
+
+
+def render_pdf_page(doc, page_index: int, zoom: float = PDF_RENDER_ZOOM) -> np.ndarray:
+    """将 PDF 单页渲染为 BGR 格式的 numpy 数组（RapidOCR 的原生输入格式）"""
+    return ocr_worker.render_pdf_page(doc, page_index, zoom)
+
+
+# 文本层判定阈值：去除空白后少于该字符数视为无文本层
+MIN_PAGE_TEXT_CHARS = 10
+# 可识别字符（文字、数字、标点）占比低于该值视为乱码（如缺少 ToUnicode 映射的字体）
+MIN_VALID_CHAR_RATIO = 0.7
+# 图像覆盖页面比例超过该值且文字稀少时，视为扫描页
+SCANNED_IMAGE_COVERAGE = 0.5
+SCANNED_MAX_TEXT_CHARS = 200
+
+
+def _is_valid_char(char: str) -> bool:
+    if char.isalnum():
+        return True
+    category = unicodedata.category(char)
+    return category[0] in "PS" and char != "\ufffd"
+
+
+def page_needs_ocr(text: str, page=None) -> bool:
+    """
+    根据文本层的字符密度判断该页是否需要OCR
+
+    - 文本层为空或几乎为空；
+    - 文本中可识别字符占比过低（私有区字符、替换字符等乱码）；
+    - 页面主要由图像构成且文字稀少（扫描件上叠加了少量页眉、页码等文字）。
+    """
+    chars = "".join(text.split())
+    if len(chars) < MIN_PAGE_TEXT_CHARS:
+        return True
+
+    valid_chars = sum(1 for char in chars if _is_valid_char(char))
+    if valid_chars / len(chars) < MIN_VALID_CHAR_RATIO:
+        return True
+
+    if page is not None and len(chars) < SCANNED_MAX_TEXT_CHARS:
+        page_area = abs(page.rect) or 1
+        image_area = sum(abs(fitz.Rect(info["bbox"]) & page.rect) for info in page.get_image_info())
+        if image_area / page_area >= SCANNED_IMAGE_COVERAGE:
+            return True
+
+    return False
+
+
 class OCRServiceException(Exception):
     """OCR服务异常"""
 
@@ -69,6 +133,11 @@ class OCRPlugin:
             os.getenv("MODEL_DIR") if not os.getenv("RUNNING_IN_DOCKER") else os.getenv("MODEL_DIR_IN_DOCKER")
         )
 
+        # PDF 并行 OCR 的进程池，跨文件复用，避免每个文件都重新加载模型
+        self._pdf_pool: ProcessPoolExecutor | None = None
+        self._pdf_pool_workers = 0
+        self._pdf_pool_lock = threading.Lock()
+
     def _check_rapid_ocr_availability(self):
         """检查RapidOCR模型是否可用"""
         try:
@@ -96,6 +165,15 @@ class OCRPlugin:
             else:
                 raise OCRServiceException(f"RapidOCR模型检查失败: {str(e)}", "rapid_ocr", "check_failed")
 
+    def _model_kwargs(self, intra_op_num_threads: int = -1) -> dict:
+        model_dir = os.path.join(self.model_dir_root, "SWHL/RapidOCR")
+        return {
+            "det_box_thresh": 0.3,
+            "det_model_path": os.path.join(model_dir, "PP-OCRv4/ch_PP-OCRv4_det_infer.onnx"),
+            "rec_model_path": os.path.join(model_dir, "PP-OCRv4/ch_PP-OCRv4_rec_infer.onnx"),
+            "intra_op_num_threads": intra_op_num_threads,
+        }
+
     def load_model(self):
         """加载 OCR 模型"""
         logger.info("加载 OCR 模型，仅在第一次调用时加载")
@@ -103,12 +181,8 @@ class OCRPlugin:
         # 先检查模型可用性
         self._check_rapid_ocr_availability()
 
-        model_dir = os.path.join(self.model_dir_root, "SWHL/RapidOCR")
-        det_model_dir = os.path.join(model_dir, "PP-OCRv4/ch_PP-OCRv4_det_infer.onnx")
-        rec_model_dir = os.path.join(model_dir, "PP-OCRv4/ch_PP-OCRv4_rec_infer.onnx")
-
         try:
-            self.ocr = RapidOCR(det_box_thresh=0.3, det_model_path=det_model_dir, rec_model_path=rec_model_dir)
+            self.ocr = RapidOCR(**self._model_kwargs())
             logger.info(f"OCR Plugin for det_box_thresh = {self.det_box_thresh} loaded.")
         except Exception as e:
             raise OCRServiceException(f"RapidOCR模型加载失败: {str(e)}", "rapid_ocr", "load_failed")
@@ -130,76 +204,70 @@ class OCRPlugin:
         if self.ocr is None:
             self.load_model()
 
-        # 处理不同类型的输入图像
-        try:
-            if isinstance(image, str):
-                # 图像路径直接传递给OCR处理
-                image_path = image
-                is_temp_file = False
-            else:
-                # 创建临时文件
-                is_temp_file = True
-                image_path = self._create_temp_image_file(image)
+        # RapidOCR 可直接读取文件路径与 PIL 图像；numpy 数组按 RGB 约定传入，这里转为 RapidOCR 需要的 BGR
+        image_name = image if isinstance(image, str) else "<memory>"
+        if isinstance(image, np.ndarray):
+            if image.ndim == 3 and image.shape[2] == 3:
+                image = np.ascontiguousarray(image[:, :, ::-1])
+        elif not isinstance(image, (str, Image.Image)):
+            raise ValueError("不支持的图像类型，必须是文件路径、PIL.Image或numpy数组")
 
+        try:
             # 执行 OCR
             start_time = time.time()
-            result, _ = self.ocr(image_path)
+            result, _ = self.ocr(image)
             processing_time = time.time() - start_time
 
-            # 清理临时文件
-            if is_temp_file and os.path.exists(image_path):
-                os.remove(image_path)
-
             # 提取文本
             if result:
-                text = "\n".join([line[1] for line in result])
-                log_ocr_request("rapid_ocr", image_path, True, processing_time)
-                return text
+                log_ocr_request("rapid_ocr", image_name, True, processing_time)
+                return ocr_worker.ocr_result_to_text(result)
             else:
-                log_ocr_request("rapid_ocr", image_path, False, processing_time, "OCR未能识别出文本内容")
+                log_ocr_request("rapid_ocr", image_name, False, processing_time, "OCR未能识别出文本内容")
                 return ""
 
         except Exception as e:
             error_msg = f"OCR处理失败: {str(e)}"
-            log_ocr_request("rapid_ocr", image_path, False, 0, error_msg)
+            log_ocr_request("rapid_ocr", image_name, False, 0, error_msg)
             logger.error(error_msg)
             raise OCRServiceException(error_msg, "rapid_ocr", "processing_failed")
 
-    def _create_temp_image_file(self, image):
-        """
-        将图像数据保存为临时文件
-
-        Args:
-            image: PIL.Image或numpy.ndarray格式的图像数据
-
-        Returns:
-            str: 临时文件路径
+    def _get_pdf_pool(self, workers: int) -> ProcessPoolExecutor:
+        """获取（并复用）OCR 进程池，每个工作进程加载一份模型"""
+        with self._pdf_pool_lock:
+            if self._pdf_pool is None or self._pdf_pool_workers != workers:
+                self.shutdown_pdf_pool()
+                # 使用 spawn：服务进程是多线程的，fork 出的子进程可能继承被其他线程持有的锁而死锁；
+                # 工作进程只导入独立的 ocr_worker 模块，不导入 src
+                intra_threads = max(1, (os.cpu_count() or 1) // workers)
+                self._pdf_pool = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=ocr_worker.init_ocr_worker,
+                    initargs=(self._model_kwargs(intra_threads),),
+                )
+                self._pdf_pool_workers = workers
+                logger.info(f"OCR process pool started with {workers} workers")
+            return self._pdf_pool
+
+    def shutdown_pdf_pool(self) -> None:
+        """关闭 OCR 进程池"""
+        if self._pdf_pool is not None:
+            self._pdf_pool.shutdown(wait=False, cancel_futures=True)
+            self._pdf_pool = None
+            self._pdf_pool_workers = 0
+
+    def process_pdf(self, pdf_path, params=None, progress_callback=None, parse_info=None):
         """
-        # 为临时文件创建目录（如果不存在）
-        tmp_dir = os.path.join(os.getcwd(), "tmp")
-        os.makedirs(tmp_dir, exist_ok=True)
-
-        # 生成临时文件路径
-        temp_filename = f"ocr_temp_{uuid.uuid4().hex[:8]}.png"
-        image_path = os.path.join(tmp_dir, temp_filename)
-
-        # 根据图像类型保存文件
-        if isinstance(image, Image.Image):
-            # 保存PIL图像对象到临时文件
-            image.save(image_path)
-        elif isinstance(image, np.ndarray):
-            # 将numpy数组转换为PIL图像并保存
-            Image.fromarray(image).save(image_path)
-        else:
-            raise ValueError("不支持的图像类型，必须是PIL.Image或numpy数组")
+        处理PDF文件并提取文本
 
-        return image_path
+        各页在识别时才渲染，图像以 numpy 数组直接交给 RapidOCR，不落盘。
+        页数大于 1 且 ocr_workers > 1 时，各页分发到进程池并行识别，结果按页码顺序合并。
 
-    def process_pdf(self, pdf_path, params=None):
-        """
-        处理PDF文件并提取文本
         :param pdf_path: PDF文件路径
-        :param params: 参数
+        :param params: 参数，ocr_workers 指定并行进程数（默认取环境变量 OCR_WORKERS）
+        :param progress_callback: 每完成一页调用一次 progress_callback(已完成页数, 总页数)
+        :param parse_info: 可选的字典，有页面识别失败时写入 ocr_failed_pages（从 1 开始）
         :return: 提取的文本
         """
 
@@ -207,31 +275,172 @@ class OCRPlugin:
             raise FileNotFoundError(f"PDF file not found: {pdf_path}")
 
         try:
-            images = []
-
-            pdfDoc = fitz.open(pdf_path)
-            totalPage = pdfDoc.page_count
-            for pg in tqdm(range(totalPage), desc="to images", ncols=100):
-                page = pdfDoc[pg]
-                rotate, zoom_x, zoom_y = 0, 2, 2
-                mat = fitz.Matrix(zoom_x, zoom_y).prerotate(rotate)
-                pix = page.get_pixmap(matrix=mat, alpha=False)
-                img_pil = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-                images.append(img_pil)
-
-            # 处理每个图像并合并文本
-            all_text = []
-            for img_path in tqdm(images, desc="to txt", ncols=100):
-                text = self.process_image(img_path)
-                all_text.append(text)
-
-            logger.debug(f"PDF OCR result: {all_text[:50]}(...) total {len(all_text)} pages.")
-            return "\n\n".join(all_text)
+            with fitz.open(pdf_path) as pdf_doc:
+                total_pages = pdf_doc.page_count
+
+            failed_pages = []
+            page_texts = self.ocr_pdf_pages(
+                pdf_path, list(range(total_pages)), params, progress_callback, failed_pages=failed_pages
+            )
+            if failed_pages and parse_info is not None:
+                parse_info["ocr_failed_pages"] = failed_pages
+            logger.debug(f"PDF OCR result: {page_texts[:50]}(...) total {len(page_texts)} pages.")
+            return "\n\n".join(page_texts)
 
         except Exception as e:
             logger.error(f"PDF processing error: {str(e)}")
             return ""
 
+    def process_pdf_auto(self, pdf_path, params=None, parse_info=None, progress_callback=None):
+        """
+        文本层优先解析PDF：逐页提取内嵌文本，仅对文本层为空或乱码的页执行OCR
+
+        :param pdf_path: PDF文件路径
+        :param params: 参数，同 process_pdf
+        :param parse_info: 可选的字典，写入 total_pages 与 ocr_pages（执行了OCR的页码，从 1 开始），
+            有页面识别失败时写入 ocr_failed_pages
+        :param progress_callback: 同 process_pdf，仅统计需要OCR的页
+        :return: 提取的文本
+        """
+        if not os.path.exists(pdf_path):
+            raise FileNotFoundError(f"PDF file not found: {pdf_path}")
+
+        with fitz.open(pdf_path) as pdf_doc:
+            total_pages = pdf_doc.page_count
+            page_texts = []
+            ocr_indices = []
+            for page_index in range(total_pages):
+                page = pdf_doc[page_index]
+                text = page.get_text("text")
+                page_texts.append(text.strip())
+                if page_needs_ocr(text, page):
+                    ocr_indices.append(page_index)
+
+        if ocr_indices:
+            logger.info(
+                f"{os.path.basename(pdf_path)}: {len(ocr_indices)}/{total_pages} pages have no usable text layer, "
+                f"running OCR on them"
+            )
+            failed_pages = []
+            ocr_texts = self.ocr_pdf_pages(pdf_path, ocr_indices, params, progress_callback, failed_pages=failed_pages)
+            for page_index, text in zip(ocr_indices, ocr_texts):
+                page_texts[page_index] = text
+            if failed_pages and parse_info is not None:
+                parse_info["ocr_failed_pages"] = failed_pages
+
+        if parse_info is not None:
+            parse_info["total_pages"] = total_pages
+            parse_info["ocr_pages"] = [page_index + 1 for page_index in ocr_indices]
+
+        return "\n\n".join(text for text in page_texts if text)
+
+    def ocr_pdf_pages(
+        self, pdf_path, page_indices, params=None, progress_callback=None, failed_pages=None
+    ) -> list[str]:
+        """
+        对PDF的指定页执行OCR，返回与 page_indices 顺序一致的文本列表
+
+        页数大于 1 且 ocr_workers > 1 时使用进程池并行识别，否则在当前进程中逐页识别。
+        识别失败的页文本为空，页码（从 1 开始）追加到 failed_pages 中。
+        """
+        params = params or {}
+        workers = max(1, int(params.get("ocr_workers") or DEFAULT_OCR_WORKERS))
+        if failed_pages is None:
+            failed_pages = []
+
+        if workers > 1 and len(page_indices) > 1:
+            self._check_rapid_ocr_availability()
+            page_texts = self._process_pdf_pages_parallel(
+                pdf_path, page_indices, workers, progress_callback, failed_pages
+            )
+        else:
+            with fitz.open(pdf_path) as pdf_doc:
+                page_texts = self._process_pdf_pages_inline(pdf_doc, page_indices, progress_callback, failed_pages)
+
+        if failed_pages:
+            failed_pages.sort()
+            logger.warning(f"OCR failed on pages {failed_pages} of {os.path.basename(pdf_path)}")
+        return page_texts
+
+    def _ocr_page_inline(self, pdf_doc, page_index) -> str:
+        """在当前进程中渲染并识别单页"""
+        if self.ocr is None:
+            self.load_model()
+
+        page_label = f"{os.path.basename(pdf_doc.name)}#page{page_index + 1}"
+        start_time = time.time()
+        try:
+            result, _ = self.ocr(render_pdf_page(pdf_doc, page_index))
+        except Exception as e:
+            log_ocr_request("rapid_ocr", page_label, False, time.time() - start_time, str(e))
+            raise
+        log_ocr_request("rapid_ocr", page_label, True, time.time() - start_time)
+        return ocr_worker.ocr_result_to_text(result)
+
+    def _process_pdf_pages_inline(self, pdf_doc, page_indices, progress_callback=None, failed_pages=None) -> list[str]:
+        """在当前进程中逐页渲染并识别"""
+        page_texts = []
+        for done, page_index in enumerate(page_indices, start=1):
+            try:
+                page_texts.append(self._ocr_page_inline(pdf_doc, page_index))
+            except OCRServiceException:
+                raise
+            except Exception:
+                page_texts.append("")
+                if failed_pages is not None:
+                    failed_pages.append(page_index + 1)
+            if progress_callback:
+                progress_callback(done, len(page_indices))
+        return page_texts
+
+    def _process_pdf_pages_parallel(
+        self, pdf_path, page_indices, workers, progress_callback=None, failed_pages=None
+    ) -> list[str]:
+        """
+        将各页分发到进程池识别（工作进程各自渲染），按 page_indices 的顺序返回文本
+
+        工作进程中识别失败的页在当前进程中重试一次。
+        """
+        pool = self._get_pdf_pool(workers)
+        futures = {
+            pool.submit(ocr_worker.ocr_pdf_page, pdf_path, page_index, PDF_RENDER_ZOOM): position
+            for position, page_index in enumerate(page_indices)
+        }
+
+        page_texts = [""] * len(page_indices)
+        retry_positions = []
+        page_name = os.path.basename(pdf_path)
+        for done, future in enumerate(as_completed(futures), start=1):
+            position = futures[future]
+            page_label = f"{page_name}#page{page_indices[position] + 1}"
+            try:
+                page_texts[position], processing_time = future.result()
+                log_ocr_request("rapid_ocr", page_label, True, processing_time)
+            except BrokenProcessPool:
+                # 工作进程异常退出后进程池不可再用，丢弃以便下次重建
+                with self._pdf_pool_lock:
+                    self.shutdown_pdf_pool()
+                raise
+            except Exception as e:
+                log_ocr_request("rapid_ocr", page_label, False, 0, str(e))
+                retry_positions.append(position)
+
+            if progress_callback:
+                progress_callback(done, len(page_indices))
+            logger.debug(f"OCR progress for {page_name}: {done}/{len(page_indices)} pages")
+
+        if retry_positions:
+            logger.warning(f"Retrying OCR of {len(retry_positions)} failed pages of {page_name} inline")
+            with fitz.open(pdf_path) as pdf_doc:
+                for position in sorted(retry_positions):
+                    try:
+                        page_texts[position] = self._ocr_page_inline(pdf_doc, page_indices[position])
+                    except Exception:
+                        if failed_pages is not None:
+                            failed_pages.append(page_indices[position] + 1)
+
+        return page_texts
+
     def process_file_mineru(self, file_path, params=None):
         """
         使用Mineru OCR处理文件
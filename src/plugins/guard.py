@@ -1,4 +1,8 @@
+import asyncio
+import hashlib
 import os
+import time
+from collections import OrderedDict, deque
 
 from src.config.app import config
 from src.models import select_model
@@ -29,39 +33,201 @@ PROMPT_TEMPLATE = """
 输出内容："""
 # endregion guard_prompt
 
+# LLM moderation: concurrent calls, verdict cache size / TTL (seconds) and per-call timeout (seconds)
+LLM_MODERATION_CONCURRENCY = 4
+LLM_MODERATION_CACHE_SIZE = 2048
+LLM_MODERATION_CACHE_TTL = 3600
+LLM_MODERATION_TIMEOUT = 30
+
 
 def load_keywords(file_path: str) -> list[str]:
     """Loads keywords from a file, one per line."""
     if not os.path.exists(file_path):
-        keywords = []
+        return []
     with open(file_path, encoding="utf-8") as f:
         keywords = [line.strip() for line in f if line.strip() and not line.startswith("#")]
 
     return keywords
 
 
+def _content_text(content) -> str:
+    """Extracts the text of a message content (str or list of content blocks)."""
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "".join(
+            block if isinstance(block, str) else str(block.get("text", ""))
+            for block in content
+            if isinstance(block, str | dict)
+        )
+    return str(content or "")
+
+
+class KeywordMatcher:
+    """
+    Aho-Corasick automaton over lowercased keywords.
+
+    The whole keyword list is matched in a single pass over the text, and the automaton state
+    can be carried across calls so that keywords split across streamed chunks are still found.
+    """
+
+    def __init__(self, keywords: list[str]):
+        self.keywords = list(dict.fromkeys(keyword.lower() for keyword in keywords if keyword))
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._output: list[str | None] = [None]
+
+        for keyword in self.keywords:
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(None)
+                state = next_state
+            self._output[state] = self._output[state] or keyword
+
+        # BFS to build failure links; a state also reports the keyword of its failure state
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] or self._output[self._fail[next_state]]
+
+    def search(self, text: str, state: int = 0) -> tuple[str | None, int]:
+        """
+        Feeds text into the automaton starting from state.
+
+        Returns:
+            (the first matched keyword or None, the state after the consumed text)
+        """
+        goto, fail, output = self._goto, self._fail, self._output
+        for char in text.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                return output[state], state
+        return None, state
+
+
+class KeywordStreamScanner:
+    """Resumable keyword scan over the chunks of one streamed response."""
+
+    def __init__(self, matcher: KeywordMatcher):
+        # Keep the matcher the scan started with, a reload must not invalidate the state
+        self.matcher = matcher
+        self.state = 0
+        self.matched: str | None = None
+
+    def feed(self, content) -> bool:
+        """Scans the next chunk, returns True once a keyword has been found in the stream."""
+        if self.matched is None:
+            self.matched, self.state = self.matcher.search(_content_text(content), self.state)
+            if self.matched:
+                logger.debug(f"Keyword match found in stream: {self.matched}")
+        return self.matched is not None
+
+
+class ModerationCache:
+    """In-memory LRU cache of LLM moderation verdicts with a TTL."""
+
+    def __init__(self, max_entries: int = LLM_MODERATION_CACHE_SIZE, ttl: float = LLM_MODERATION_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[bool, float]] = OrderedDict()
+
+    def get(self, key: str) -> bool | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        verdict, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return verdict
+
+    def put(self, key: str, verdict: bool) -> None:
+        self._entries[key] = (verdict, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
 class ContentGuard:
     def __init__(self, keywords_file: str = "src/config/static/bad_keywords.txt"):
-        self.keywords = load_keywords(keywords_file)
-        if not self.keywords:
-            self.keywords = ["贩毒"]
-
-        # 从配置读取LLM模型设置
-        self.enable_llm = config.enable_content_guard_llm
-        if self.enable_llm and config.content_guard_llm_model:
-            provider, model_name = config.content_guard_llm_model.split("/", maxsplit=1)
-            self.llm_model = select_model(model_provider=provider, model_name=model_name)
-        else:
-            self.llm_model = None
-
-    async def check(self, text: str) -> bool:
+        self.keywords_file = keywords_file
+        self._keywords_signature = None
+        self._matcher: KeywordMatcher | None = None
+        self._reload_keywords()
+
+        # LLM 模型按配置懒加载，修改配置后无需重启
+        self._llm_model = None
+        self._llm_model_spec: str | None = None
+        self._moderation_cache = ModerationCache()
+        self._moderation_inflight: dict[str, asyncio.Task] = {}
+        self._moderation_semaphore = asyncio.Semaphore(LLM_MODERATION_CONCURRENCY)
+
+    @property
+    def llm_model(self):
+        """The moderation model of the current config, None when LLM moderation is disabled."""
+        if not config.enable_content_guard_llm or not config.content_guard_llm_model:
+            return None
+        if self._llm_model is None or self._llm_model_spec != config.content_guard_llm_model:
+            self._llm_model = select_model(model_spec=config.content_guard_llm_model)
+            self._llm_model_spec = config.content_guard_llm_model
+        return self._llm_model
+
+    @property
+    def fast_path(self) -> bool:
+        """Whether LLM moderation of the input runs in parallel with the answer stream."""
+        return bool(config.content_guard_llm_fast_path and self.llm_model)
+
+    @property
+    def keywords(self) -> list[str]:
+        return self._reload_keywords().keywords
+
+    def _reload_keywords(self) -> KeywordMatcher:
+        """Rebuilds the automaton when the keywords file has changed (mtime / size)."""
+        try:
+            stat = os.stat(self.keywords_file)
+            signature = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            signature = None
+
+        if self._matcher is None or signature != self._keywords_signature:
+            keywords = load_keywords(self.keywords_file) or ["贩毒"]
+            self._matcher = KeywordMatcher(keywords)
+            self._keywords_signature = signature
+            logger.info(f"Content guard loaded {len(self._matcher.keywords)} keywords")
+        return self._matcher
+
+    def stream_scanner(self) -> KeywordStreamScanner:
+        """Creates a keyword scanner for one streamed response."""
+        return KeywordStreamScanner(self._reload_keywords())
+
+    async def check(self, text: str, keywords: bool = True) -> bool:
         """
         Checks if the text contains any sensitive keywords.
         Returns True if sensitive content is found, False otherwise.
         True: 不合规
         False: 合规
+
+        Pass keywords=False when the text has already been scanned by a stream scanner.
         """
-        if keywords_result := await self.check_with_keywords(text):
+        if keywords and (keywords_result := await self.check_with_keywords(text)):
             return keywords_result
 
         if self.llm_model:
@@ -78,11 +244,10 @@ class ContentGuard:
         """
         if not text:
             return False
-        text_lower = text.lower()
-        for keyword in self.keywords:
-            if keyword in text_lower:
-                logger.debug(f"Keyword match found: {keyword}")
-                return True
+        keyword, _ = self._reload_keywords().search(_content_text(text))
+        if keyword:
+            logger.debug(f"Keyword match found: {keyword}")
+            return True
         return False
 
     async def check_with_llm(self, text: str) -> bool:
@@ -91,20 +256,47 @@ class ContentGuard:
         Returns True if sensitive content is found, False otherwise.
         True: 不合规
         False: 合规
+
+        Uses the async client, verdicts are cached by text hash, identical texts in flight share one
+        call and at most LLM_MODERATION_CONCURRENCY calls run at once. Failures and timeouts are
+        treated as non-compliant (fail closed) and are not cached.
         """
         if not text:
             return False
 
-        if not self.enable_llm or self.llm_model is None:
+        llm_model = self.llm_model
+        if llm_model is None:
             logger.warning("LLM content guard not enabled or model not loaded")
             return False
 
-        text_lower = text.lower()
+        text_lower = _content_text(text).lower()
+        key = hashlib.sha256(f"{self._llm_model_spec}\n{text_lower}".encode()).hexdigest()
+        if (verdict := self._moderation_cache.get(key)) is not None:
+            return verdict
+
+        task = self._moderation_inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._moderate_with_llm(llm_model, text_lower, key))
+            self._moderation_inflight[key] = task
+            task.add_done_callback(lambda _: self._moderation_inflight.pop(key, None))
 
+        # 调用方被取消（如快速模式中断）时不取消共享的审查请求，结果仍会写入缓存
+        return await asyncio.shield(task)
+
+    async def _moderate_with_llm(self, llm_model, text_lower: str, key: str) -> bool:
         prompt = PROMPT_TEMPLATE.format(content=text_lower)
-        response = self.llm_model.call(prompt)
+        try:
+            async with self._moderation_semaphore:
+                response = await asyncio.wait_for(llm_model.acall(prompt), timeout=LLM_MODERATION_TIMEOUT)
+        except Exception as e:
+            # 审查服务不可用时拒绝（不缓存），避免故障或超时期间放行所有内容
+            logger.error(f"LLM content guard failed, treating content as non-compliant: {e}")
+            return True
+
         logger.debug(f"LLM response: {response.content}")
-        return True if "不合规" in response.content else False
+        verdict = "不合规" in (response.content or "")
+        self._moderation_cache.put(key, verdict)
+        return verdict
 
 
 # Global instance
@@ -0,0 +1,45 @@
+"""PDF 并行 OCR 的工作进程入口
+
+工作进程以 spawn 方式启动，本模块以顶层模块导入（所在目录由 src.plugins._ocr 加入 sys.path），
+不导入 src：导入 src 会在每个工作进程中初始化全部知识库。
+"""
+
+import time
+
+import fitz
+import numpy as np
+from rapidocr_onnxruntime import RapidOCR
+
+
+def render_pdf_page(doc, page_index: int, zoom: float) -> np.ndarray:
+    """将 PDF 单页渲染为 BGR 格式的 numpy 数组（RapidOCR 的原生输入格式）"""
+    pix = doc[page_index].get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+    image = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+    return np.ascontiguousarray(image[:, :, ::-1])
+
+
+def ocr_result_to_text(result) -> str:
+    return "\n".join([line[1] for line in result]) if result else ""
+
+
+# 以下为工作进程内的状态，每个进程只加载一次模型
+_worker_ocr = None
+_worker_doc = None
+
+
+def init_ocr_worker(model_kwargs: dict) -> None:
+    global _worker_ocr
+    _worker_ocr = RapidOCR(**model_kwargs)
+
+
+def ocr_pdf_page(pdf_path: str, page_index: int, zoom: float) -> tuple[str, float]:
+    """在工作进程中渲染并识别单页，返回 (文本, 耗时)"""
+    global _worker_doc
+    if _worker_doc is None or _worker_doc.name != pdf_path:
+        if _worker_doc is not None:
+            _worker_doc.close()
+        _worker_doc = fitz.open(pdf_path)
+
+    start_time = time.time()
+    result, _ = _worker_ocr(render_pdf_page(_worker_doc, page_index, zoom))
+    return ocr_result_to_text(result), time.time() - start_time
@@ -6,6 +6,7 @@ Manages conversation data storage including messages, tool calls, and statistics
 
 import uuid
 
+from sqlalchemy import func
 from sqlalchemy.orm import Session, joinedload
 
 from src.storage.db.models import Conversation, ConversationStats, Message, ToolCall
@@ -98,12 +99,14 @@ class ConversationManager:
         Returns:
             Created Message object
         """
+        extra_metadata = extra_metadata or {}
         message = Message(
             conversation_id=conversation_id,
             role=role,
             content=content,
             message_type=message_type,
-            extra_metadata=extra_metadata or {},
+            extra_metadata=extra_metadata,
+            langgraph_message_id=extra_metadata.get("id"),
         )
 
         self.db.add(message)
@@ -112,12 +115,12 @@ class ConversationManager:
         if conversation:
             conversation.updated_at = utc_now()
 
+        # Update conversation stats in the same transaction
+        self._increment_message_count(conversation_id, 1)
+
         self.db.commit()
         self.db.refresh(message)
 
-        # Update conversation stats
-        self._update_message_count(conversation_id)
-
         logger.debug(f"Added {role} message to conversation {conversation_id}")
         return message
 
@@ -155,6 +158,143 @@ class ConversationManager:
             extra_metadata=extra_metadata,
         )
 
+    def save_messages_bulk(
+        self,
+        thread_id: str,
+        messages: list[dict],
+        tool_outputs: list[dict] | None = None,
+    ) -> list[Message]:
+        """
+        Persist the messages and tool calls of a chat turn in a single transaction
+
+        Messages whose LangGraph message id is already stored for the conversation are skipped
+        (indexed lookup on ``langgraph_message_id``), so the call is idempotent.
+
+        Args:
+            thread_id: Thread ID
+            messages: Messages to add, each with ``role``, ``content``, optional ``message_type``,
+                ``extra_metadata`` (its ``id`` is used as the LangGraph message id) and ``tool_calls``
+                (list of ``{"tool_name", "tool_input", "langgraph_tool_call_id"}``)
+            tool_outputs: Tool results to record, each with ``langgraph_tool_call_id``, ``tool_output``
+                and optional ``status`` / ``error_message``; matched against tool calls created in this
+                batch first, then against stored tool calls
+
+        Returns:
+            Newly created Message objects
+        """
+        conversation = self.get_conversation_by_thread_id(thread_id)
+        if not conversation:
+            logger.warning(f"Conversation not found for thread_id: {thread_id}")
+            return []
+
+        langgraph_ids = [msg["extra_metadata"]["id"] for msg in messages if (msg.get("extra_metadata") or {}).get("id")]
+        existing_ids = self._existing_langgraph_message_ids(conversation.id, langgraph_ids)
+
+        created: list[Message] = []
+        pending_tool_calls: dict[str, ToolCall] = {}
+        try:
+            for msg in messages:
+                extra_metadata = msg.get("extra_metadata") or {}
+                langgraph_id = extra_metadata.get("id")
+                if langgraph_id and langgraph_id in existing_ids:
+                    continue
+                if langgraph_id:
+                    existing_ids.add(langgraph_id)
+
+                message = Message(
+                    conversation_id=conversation.id,
+                    role=msg["role"],
+                    content=msg.get("content", ""),
+                    message_type=msg.get("message_type", "text"),
+                    extra_metadata=extra_metadata,
+                    langgraph_message_id=langgraph_id,
+                )
+                for tc in msg.get("tool_calls") or []:
+                    tool_call = ToolCall(
+                        tool_name=tc.get("tool_name", "unknown"),
+                        tool_input=tc.get("tool_input") or {},
+                        status="pending",
+                        langgraph_tool_call_id=tc.get("langgraph_tool_call_id"),
+                    )
+                    message.tool_calls.append(tool_call)
+                    if tool_call.langgraph_tool_call_id:
+                        pending_tool_calls[tool_call.langgraph_tool_call_id] = tool_call
+
+                self.db.add(message)
+                created.append(message)
+
+            self._apply_tool_outputs(conversation.id, tool_outputs or [], pending_tool_calls)
+
+            if created:
+                conversation.updated_at = utc_now()
+                self._increment_message_count(conversation.id, len(created))
+
+            self.db.commit()
+        except Exception:
+            self.db.rollback()
+            raise
+
+        logger.debug(f"Saved {len(created)} messages to conversation {conversation.id} in one transaction")
+        return created
+
+    def _existing_langgraph_message_ids(self, conversation_id: int, langgraph_ids: list[str]) -> set[str]:
+        """Return the LangGraph message ids already stored for the conversation"""
+        existing = set()
+        for i in range(0, len(langgraph_ids), 500):
+            rows = (
+                self.db.query(Message.langgraph_message_id)
+                .filter(
+                    Message.conversation_id == conversation_id,
+                    Message.langgraph_message_id.in_(langgraph_ids[i : i + 500]),
+                )
+                .all()
+            )
+            existing.update(row[0] for row in rows)
+        return existing
+
+    def _apply_tool_outputs(
+        self, conversation_id: int, tool_outputs: list[dict], pending_tool_calls: dict[str, ToolCall]
+    ) -> None:
+        """
+        Record tool results on tool calls of the current batch or stored pending ones of the same
+        conversation (caller commits)
+
+        Results for tool calls that are already completed are ignored, so callers may pass the results
+        of the whole thread.
+        """
+        missing = [
+            item["langgraph_tool_call_id"]
+            for item in tool_outputs
+            if item["langgraph_tool_call_id"] not in pending_tool_calls
+        ]
+        for i in range(0, len(missing), 500):
+            for tool_call in (
+                self.db.query(ToolCall)
+                .join(Message, ToolCall.message_id == Message.id)
+                .filter(
+                    Message.conversation_id == conversation_id,
+                    ToolCall.langgraph_tool_call_id.in_(missing[i : i + 500]),
+                    ToolCall.status == "pending",
+                )
+                .all()
+            ):
+                pending_tool_calls[tool_call.langgraph_tool_call_id] = tool_call
+
+        updated = 0
+        for item in tool_outputs:
+            tool_call = pending_tool_calls.get(item["langgraph_tool_call_id"])
+            if not tool_call:
+                continue
+
+            tool_call.tool_output = item.get("tool_output")
+            tool_call.status = item.get("status", "success")
+            if item.get("error_message"):
+                tool_call.error_message = item["error_message"]
+            updated += 1
+
+        if updated < len(tool_outputs):
+            logger.debug(f"{len(tool_outputs) - updated} tool results matched no pending tool call")
+
     def add_tool_call(
         self,
         message_id: int,
@@ -429,7 +569,7 @@ class ConversationManager:
 
     def _update_message_count(self, conversation_id: int) -> None:
         """
-        Update message count in conversation stats
+        Recount messages in conversation stats (full COUNT, use to repair the counter)
 
         Args:
             conversation_id: Conversation ID
@@ -439,3 +579,16 @@ class ConversationManager:
             message_count = self.db.query(Message).filter(Message.conversation_id == conversation_id).count()
             stats.message_count = message_count
             self.db.commit()
+
+    def _increment_message_count(self, conversation_id: int, count: int) -> None:
+        """
+        Incrementally update message count in conversation stats (caller commits)
+
+        Args:
+            conversation_id: Conversation ID
+            count: Number of added messages
+        """
+        self.db.query(ConversationStats).filter(ConversationStats.conversation_id == conversation_id).update(
+            {ConversationStats.message_count: func.coalesce(ConversationStats.message_count, 0) + count},
+            synchronize_session=False,
+        )
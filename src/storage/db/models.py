@@ -69,6 +69,9 @@ class Message(Base):
     created_at = Column(DateTime, default=utc_now, comment="Creation time")
     token_count = Column(Integer, nullable=True, comment="Token count (optional)")
     extra_metadata = Column(JSON, nullable=True, comment="Additional metadata (complete message dump)")
+    langgraph_message_id = Column(
+        String(128), nullable=True, index=True, comment="LangGraph message id for deduplication"
+    )
 
     # Relationships
     conversation = relationship("Conversation", back_populates="messages")
@@ -4,6 +4,9 @@ Integration tests for chat router endpoints.
 
 from __future__ import annotations
 
+import json
+import uuid
+
 import pytest
 
 pytestmark = [pytest.mark.asyncio, pytest.mark.integration]
@@ -57,3 +60,100 @@ async def test_setting_default_agent_requires_admin(test_client, admin_headers,
     )
     assert update_response.status_code == 200, update_response.text
     assert update_response.json()["default_agent_id"] == candidate_agent_id
+
+
+async def first_agent_id(test_client, headers) -> str:
+    response = await test_client.get("/api/chat/agent", headers=headers)
+    assert response.status_code == 200, response.text
+    agents = response.json().get("agents", [])
+    if not agents or not agents[0].get("id"):
+        pytest.skip("No agents are registered in the system.")
+    return agents[0]["id"]
+
+
+async def stream_chat(test_client, headers, agent_id: str, stream_format: str) -> tuple[str, str]:
+    """Send one chat turn and return the response content type and raw body."""
+    async with test_client.stream(
+        "POST",
+        f"/api/chat/agent/{agent_id}",
+        json={
+            "query": "请用一句话介绍你自己",
+            "config": {"thread_id": str(uuid.uuid4())},
+            "stream_format": stream_format,
+        },
+        headers=headers,
+        timeout=120,
+    ) as response:
+        assert response.status_code == 200, await response.aread()
+        body = (await response.aread()).decode("utf-8")
+    return response.headers["content-type"], body
+
+
+async def test_chat_rejects_unknown_stream_format(test_client, admin_headers):
+    response = await test_client.post(
+        "/api/chat/agent/any_agent",
+        json={"query": "hello", "stream_format": "xml"},
+        headers=admin_headers,
+    )
+    assert response.status_code == 422, response.text
+
+
+@pytest.mark.slow
+async def test_chat_json_stream_sends_full_message_per_token(test_client, admin_headers):
+    agent_id = await first_agent_id(test_client, admin_headers)
+    content_type, body = await stream_chat(test_client, admin_headers, agent_id, "json")
+
+    assert content_type.startswith("application/json")
+    events = [json.loads(line) for line in body.splitlines() if line]
+    assert events[0]["status"] == "init"
+    assert events[-1]["status"] == "finished", events[-1]
+
+    tokens = [event for event in events if event.get("status") == "loading"]
+    assert tokens
+    assert all("msg" in event and "metadata" in event for event in tokens)
+    assert not any(event.get("status") in {"message", "delta"} for event in events)
+
+
+@pytest.mark.slow
+async def test_chat_compact_stream_sends_header_once_then_deltas(test_client, admin_headers):
+    agent_id = await first_agent_id(test_client, admin_headers)
+    content_type, body = await stream_chat(test_client, admin_headers, agent_id, "compact")
+
+    assert content_type.startswith("application/json")
+    events = [json.loads(line) for line in body.splitlines() if line]
+    statuses = [event.get("status") for event in events]
+    assert statuses[0] == "init"
+    assert statuses[-1] == "finished", events[-1]
+    assert "loading" not in statuses
+
+    header_ids = [event["id"] for event in events if event.get("status") == "message"]
+    assert header_ids
+    assert len(header_ids) == len(set(header_ids))
+    assert all("content" not in event["msg"] for event in events if event.get("status") == "message")
+
+    deltas = [event for event in events if event.get("status") == "delta"]
+    assert deltas
+    assert all(event["id"] in header_ids for event in deltas)
+    assert "request_id" not in deltas[0]
+
+
+@pytest.mark.slow
+async def test_chat_sse_stream_uses_event_stream_framing(test_client, admin_headers):
+    agent_id = await first_agent_id(test_client, admin_headers)
+    content_type, body = await stream_chat(test_client, admin_headers, agent_id, "sse")
+
+    assert content_type.startswith("text/event-stream")
+    blocks = [block for block in body.split("\n\n") if block]
+    assert blocks
+
+    statuses = []
+    for block in blocks:
+        event_line, data_line = block.split("\n", 1)
+        assert event_line.startswith("event: ")
+        assert data_line.startswith("data: ")
+        payload = json.loads(data_line.removeprefix("data: "))
+        assert event_line == f"event: {payload.get('status') or 'message'}"
+        statuses.append(payload.get("status"))
+
+    assert statuses[-1] == "finished"
+    assert "delta" in statuses
@@ -4,10 +4,60 @@ Integration tests for knowledge router endpoints.
 
 from __future__ import annotations
 
+import asyncio
+
 import pytest
 
 pytestmark = [pytest.mark.asyncio, pytest.mark.integration]
 
+TASK_TERMINAL_STATUSES = {"success", "failed", "cancelled"}
+
+
+async def wait_for_task(test_client, headers, task_id: str, timeout: float = 120.0) -> dict:
+    """Poll the task center until the task reaches a terminal status."""
+    for _ in range(int(timeout / 0.5)):
+        response = await test_client.get(f"/api/tasks/{task_id}", headers=headers)
+        assert response.status_code == 200, response.text
+        task = response.json().get("task", {})
+        if task.get("status") in TASK_TERMINAL_STATUSES:
+            return task
+        await asyncio.sleep(0.5)
+    pytest.fail(f"Task {task_id} did not reach a terminal status within {timeout}s")
+
+
+async def upload_text(test_client, headers, db_id: str, filename: str, text: str) -> str:
+    """Upload a markdown file into the database upload directory and return its server-side path."""
+    response = await test_client.post(
+        "/api/knowledge/files/upload",
+        params={"db_id": db_id},
+        files={"file": (filename, text.encode("utf-8"), "text/markdown")},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+    return response.json()["file_path"]
+
+
+async def ingest_text(test_client, headers, db_id: str, filename: str, text: str, params: dict | None = None) -> dict:
+    """Upload and ingest a markdown file, returning the processed file record."""
+    file_path = await upload_text(test_client, headers, db_id, filename, text)
+    response = await test_client.post(
+        f"/api/knowledge/databases/{db_id}/documents",
+        json={"items": [file_path], "params": {"content_type": "file", **(params or {})}},
+        headers=headers,
+    )
+    assert response.status_code == 200, response.text
+
+    task = await wait_for_task(test_client, headers, response.json()["task_id"])
+    assert task["status"] == "success", task
+    record = task["result"]["items"][0]
+    assert record["status"] == "done", record
+    return record
+
+
+def make_paragraphs(count: int, label: str = "段落") -> list[str]:
+    """Distinct paragraphs that each fit in one 200 character chunk."""
+    return [f"第 {i} 段：" + f"{label}内容 {i} " * 20 for i in range(count)]
+
 
 async def test_admin_can_manage_knowledge_databases(test_client, admin_headers, knowledge_database):
     db_id = knowledge_database["db_id"]
@@ -49,3 +99,206 @@ async def test_knowledge_routes_enforce_permissions(test_client, standard_user,
 
     forbidden_get = await test_client.get(f"/api/knowledge/databases/{db_id}", headers=standard_user["headers"])
     assert forbidden_get.status_code == 403
+
+
+async def test_update_document_reembeds_only_changed_chunks(test_client, admin_headers, vector_knowledge_database):
+    db_id = vector_knowledge_database["db_id"]
+    params = {"chunk_size": 200, "chunk_overlap": 0}
+
+    paragraphs = make_paragraphs(4)
+    record = await ingest_text(test_client, admin_headers, db_id, "update_me.md", "\n\n".join(paragraphs), params)
+
+    paragraphs[2] = f"第 2 段：{'更新后的内容 ' * 20}"
+    new_path = await upload_text(test_client, admin_headers, db_id, "update_me_v2.md", "\n\n".join(paragraphs))
+
+    update_response = await test_client.put(
+        f"/api/knowledge/databases/{db_id}/documents/{record['file_id']}",
+        json={"item": new_path, "params": {"content_type": "file", **params}},
+        headers=admin_headers,
+    )
+    assert update_response.status_code == 200, update_response.text
+    assert update_response.json()["status"] == "queued"
+
+    task = await wait_for_task(test_client, admin_headers, update_response.json()["task_id"])
+    assert task["status"] == "success", task
+    updated = task["result"]
+    assert updated["status"] == "done", updated
+    assert updated["revision"] == 1
+
+    stats = updated["update_stats"]
+    assert stats["added"] >= 1
+    assert stats["removed"] >= 1
+    assert stats["unchanged"] >= 3
+
+    info_response = await test_client.get(
+        f"/api/knowledge/databases/{db_id}/documents/{record['file_id']}", headers=admin_headers
+    )
+    assert info_response.status_code == 200, info_response.text
+    assert "更新后的内容" in info_response.text
+
+
+async def test_update_document_rejects_unsafe_path_and_non_admin(
+    test_client, admin_headers, standard_user, knowledge_database
+):
+    db_id = knowledge_database["db_id"]
+    url = f"/api/knowledge/databases/{db_id}/documents/missing_doc"
+
+    forbidden = await test_client.put(
+        url, json={"item": "/tmp/anything.md", "params": {}}, headers=standard_user["headers"]
+    )
+    assert forbidden.status_code == 403
+
+    unsafe = await test_client.put(url, json={"item": "/etc/passwd", "params": {}}, headers=admin_headers)
+    assert unsafe.status_code == 403, unsafe.text
+
+
+async def test_batch_delete_documents_removes_all_requested_files(
+    test_client, admin_headers, vector_knowledge_database
+):
+    db_id = vector_knowledge_database["db_id"]
+
+    file_ids = []
+    for index in range(2):
+        text = "\n\n".join(make_paragraphs(2, label=f"批量删除{index}"))
+        record = await ingest_text(test_client, admin_headers, db_id, f"batch_delete_{index}.md", text)
+        file_ids.append(record["file_id"])
+
+    delete_response = await test_client.post(
+        f"/api/knowledge/databases/{db_id}/documents/batch-delete",
+        json={"file_ids": file_ids + file_ids[:1]},
+        headers=admin_headers,
+    )
+    assert delete_response.status_code == 200, delete_response.text
+    payload = delete_response.json()
+    assert payload["deleted"] == 2
+    assert payload["failed"] == {}
+
+    db_response = await test_client.get(f"/api/knowledge/databases/{db_id}", headers=admin_headers)
+    assert db_response.status_code == 200, db_response.text
+    assert not set(file_ids) & set(db_response.json()["files"])
+
+
+async def test_batch_delete_documents_requires_admin(test_client, standard_user, knowledge_database):
+    response = await test_client.post(
+        f"/api/knowledge/databases/{knowledge_database['db_id']}/documents/batch-delete",
+        json={"file_ids": ["missing_doc"]},
+        headers=standard_user["headers"],
+    )
+    assert response.status_code == 403
+
+
+async def test_index_profiles_are_listed(test_client, admin_headers):
+    response = await test_client.get("/api/knowledge/index-profiles", headers=admin_headers)
+    assert response.status_code == 200, response.text
+    payload = response.json()
+    names = {profile["name"] for profile in payload["profiles"]}
+    assert payload["default"] in names
+    assert {"hnsw", "hnsw_fp16"} <= names
+
+
+async def test_reindex_and_benchmark_vector_database(test_client, admin_headers, vector_knowledge_database):
+    db_id = vector_knowledge_database["db_id"]
+    text = "\n\n".join(make_paragraphs(6, label="索引"))
+    await ingest_text(test_client, admin_headers, db_id, "reindex.md", text, {"chunk_size": 200, "chunk_overlap": 0})
+
+    # Same vector type rebuilds the index in place; float16 migrates the data to a new collection.
+    for profile, migrates in (("hnsw", False), ("hnsw_fp16", True)):
+        reindex_response = await test_client.post(
+            f"/api/knowledge/databases/{db_id}/reindex",
+            json={"index_profile": profile, "index_params": {"ef": 32}},
+            headers=admin_headers,
+        )
+        assert reindex_response.status_code == 200, reindex_response.text
+        task = await wait_for_task(test_client, admin_headers, reindex_response.json()["task_id"])
+        assert task["status"] == "success", task
+        result = task["result"]
+        assert result["index_profile"]["name"] == profile
+        assert (result["migrated"] > 0) is migrates
+
+        query_response = await test_client.post(
+            f"/api/knowledge/databases/{db_id}/query",
+            json={"query": "第 3 段 索引内容", "meta": {"top_k": 3}},
+            headers=admin_headers,
+        )
+        assert query_response.status_code == 200, query_response.text
+        assert query_response.json()["status"] == "success"
+        assert query_response.json()["result"]
+
+    benchmark_response = await test_client.post(
+        f"/api/knowledge/databases/{db_id}/index-benchmark",
+        json={"profiles": ["ivf_flat", "hnsw"], "queries": ["第 1 段", "索引内容 4"], "top_k": 3},
+        headers=admin_headers,
+    )
+    assert benchmark_response.status_code == 200, benchmark_response.text
+    task = await wait_for_task(test_client, admin_headers, benchmark_response.json()["task_id"])
+    assert task["status"] == "success", task
+    benchmark = task["result"]
+    assert benchmark["current_profile"] == "hnsw_fp16"
+    assert [result["profile"] for result in benchmark["results"]] == ["ivf_flat", "hnsw"]
+    for result in benchmark["results"]:
+        assert 0.0 <= result["recall"] <= 1.0
+        assert result["latency_p50_ms"] >= 0
+
+
+async def test_reindex_is_rejected_for_non_vector_database(test_client, admin_headers, knowledge_database):
+    response = await test_client.post(
+        f"/api/knowledge/databases/{knowledge_database['db_id']}/reindex",
+        json={"index_profile": "hnsw"},
+        headers=admin_headers,
+    )
+    assert response.status_code == 200, response.text
+    task = await wait_for_task(test_client, admin_headers, response.json()["task_id"])
+    assert task["status"] == "failed"
+
+
+async def test_index_routes_require_admin(test_client, standard_user, knowledge_database):
+    db_id = knowledge_database["db_id"]
+    headers = standard_user["headers"]
+
+    assert (await test_client.get("/api/knowledge/index-profiles", headers=headers)).status_code == 403
+    reindex = await test_client.post(
+        f"/api/knowledge/databases/{db_id}/reindex", json={"index_profile": "hnsw"}, headers=headers
+    )
+    assert reindex.status_code == 403
+    benchmark = await test_client.post(f"/api/knowledge/databases/{db_id}/index-benchmark", json={}, headers=headers)
+    assert benchmark.status_code == 403
+
+
+async def test_query_filter_limits_results(test_client, admin_headers, vector_knowledge_database):
+    db_id = vector_knowledge_database["db_id"]
+    finance_text = "\n\n".join(make_paragraphs(2, label="季度报表"))
+    other_text = "\n\n".join(make_paragraphs(2, label="季度总结"))
+    finance = await ingest_text(test_client, admin_headers, db_id, "finance.md", finance_text, {"tags": ["财务"]})
+    other = await ingest_text(test_client, admin_headers, db_id, "other.md", other_text, {"tags": ["运营"]})
+
+    async def query_file_ids(query_filter: dict) -> set[str]:
+        response = await test_client.post(
+            f"/api/knowledge/databases/{db_id}/query",
+            json={"query": "季度", "meta": {"top_k": 10, "similarity_threshold": 0}, "filter": query_filter},
+            headers=admin_headers,
+        )
+        assert response.status_code == 200, response.text
+        payload = response.json()
+        assert payload["status"] == "success", payload
+        return {chunk["metadata"]["file_id"] for chunk in payload["result"]}
+
+    assert await query_file_ids({}) == {finance["file_id"], other["file_id"]}
+    assert await query_file_ids({"tags": ["财务"]}) == {finance["file_id"]}
+    assert await query_file_ids({"file_ids": [other["file_id"]]}) == {other["file_id"]}
+    assert await query_file_ids({"file_types": ["md"], "created_after": "2000-01-01"}) == {
+        finance["file_id"],
+        other["file_id"],
+    }
+    assert await query_file_ids({"file_types": ["pdf"]}) == set()
+
+
+async def test_query_rejects_unknown_filter_keys(test_client, admin_headers, vector_knowledge_database):
+    response = await test_client.post(
+        f"/api/knowledge/databases/{vector_knowledge_database['db_id']}/query",
+        json={"query": "季度", "meta": {}, "filter": {"file_name": "finance.md"}},
+        headers=admin_headers,
+    )
+    assert response.status_code == 200, response.text
+    payload = response.json()
+    assert payload["status"] == "failed"
+    assert "Unsupported filter keys" in payload["message"]
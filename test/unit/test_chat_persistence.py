@@ -0,0 +1,151 @@
+"""
+Unit tests for the background chat persistence queue with a stubbed ConversationManager.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from server.services import chat_persistence as persistence
+from server.services.chat_persistence import ChatPersistenceQueue, PersistJob
+
+
+class FakeConversationStore:
+    """Records save_messages_bulk calls; contents listed in failures raise the given number of times."""
+
+    def __init__(self):
+        self.saved: list[tuple[str, str]] = []
+        self.failures: dict[str, int] = {}
+        self.blockers: dict[str, threading.Event] = {}
+
+    def save_messages_bulk(self, thread_id, messages, tool_outputs):
+        content = messages[0]["content"]
+        if content in self.blockers:
+            self.blockers[content].wait(timeout=5)
+        if self.failures.get(content, 0) > 0:
+            self.failures[content] -= 1
+            raise RuntimeError(f"write failed: {content}")
+        self.saved.append((thread_id, content))
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = FakeConversationStore()
+    session = SimpleNamespace(close=lambda: None)
+    monkeypatch.setattr(persistence, "db_manager", SimpleNamespace(get_session=lambda: session))
+    monkeypatch.setattr(persistence, "ConversationManager", lambda db: store)
+    return store
+
+
+def _job(thread_id: str, content: str, **kwargs) -> PersistJob:
+    return PersistJob(thread_id=thread_id, messages=[{"content": content}], **kwargs)
+
+
+async def test_jobs_are_written_in_submission_order(store):
+    queue = ChatPersistenceQueue(batch_size=4)
+    await queue.start()
+    for i in range(10):
+        await queue.enqueue(_job("t1", f"m{i}"))
+    await queue.shutdown()
+
+    assert store.saved == [("t1", f"m{i}") for i in range(10)]
+    assert queue.stats["saved"] == 10
+
+
+async def test_failed_job_is_retried_in_background_and_keeps_thread_order(store):
+    store.failures["a1"] = 2
+    queue = ChatPersistenceQueue(retry_backoff=0.01)
+    await queue.start()
+    for job in [_job("a", "a1"), _job("a", "a2"), _job("b", "b1")]:
+        queue.enqueue_nowait(job)
+    await asyncio.sleep(0)
+    await queue.enqueue(_job("a", "a3"))
+    await queue.shutdown()
+
+    # 其他对话不等待重试；同一对话中失败任务之后的任务排在其后写入
+    assert store.saved == [("b", "b1"), ("a", "a1"), ("a", "a2"), ("a", "a3")]
+    assert queue.stats["retried"] == 2
+    assert queue.stats["failed"] == 0
+
+
+async def test_writer_is_not_blocked_by_retry_backoff(store):
+    store.failures["a1"] = 1
+    queue = ChatPersistenceQueue(retry_backoff=5)
+    await queue.start()
+    await queue.enqueue(_job("a", "a1"))
+    await queue.enqueue(_job("b", "b1"))
+
+    for _ in range(100):
+        if store.saved:
+            break
+        await asyncio.sleep(0.01)
+    assert store.saved == [("b", "b1")]
+
+    queue.drain_timeout = 0.05
+    await queue.shutdown()
+    assert store.saved == [("b", "b1")]
+
+
+async def test_job_is_dropped_after_max_retries_and_thread_continues(store):
+    store.failures["a1"] = 100
+    queue = ChatPersistenceQueue(max_retries=2, retry_backoff=0.01)
+    await queue.start()
+    await queue.enqueue(_job("a", "a1"))
+    await queue.enqueue(_job("a", "a2"))
+    await queue.shutdown()
+
+    assert store.saved == [("a", "a2")]
+    assert queue.stats["retried"] == 2
+    assert queue.stats["failed"] == 1
+
+
+async def test_loader_failure_holds_later_jobs_of_the_thread(store):
+    calls = 0
+
+    async def loader():
+        nonlocal calls
+        calls += 1
+        if calls == 1:
+            raise RuntimeError("state not ready")
+        return [{"content": "state"}], []
+
+    queue = ChatPersistenceQueue(retry_backoff=0.01)
+    await queue.start()
+    queue.enqueue_nowait(PersistJob(thread_id="a", loader=loader))
+    queue.enqueue_nowait(_job("a", "a2"))
+    await queue.shutdown()
+
+    assert store.saved == [("a", "state"), ("a", "a2")]
+
+
+async def test_full_queue_waits_then_writes_inline(store):
+    release = threading.Event()
+    store.blockers["m1"] = release
+    queue = ChatPersistenceQueue(maxsize=1, put_timeout=0.05)
+    await queue.start()
+
+    await queue.enqueue(_job("t1", "m1"))
+    await asyncio.sleep(0.05)  # 写入任务取出 m1 后阻塞在写入中
+    await queue.enqueue(_job("t2", "m2"))
+    await queue.enqueue(_job("t3", "m3"))
+
+    assert store.saved == [("t3", "m3")]
+    assert queue.stats["inline"] == 1
+
+    release.set()
+    await queue.shutdown()
+    assert store.saved == [("t3", "m3"), ("t1", "m1"), ("t2", "m2")]
+
+
+async def test_enqueue_after_shutdown_writes_inline(store):
+    queue = ChatPersistenceQueue()
+    await queue.start()
+    await queue.shutdown()
+
+    await queue.enqueue(_job("t1", "m1"))
+    assert store.saved == [("t1", "m1")]
+    assert queue.stats["inline"] == 1
@@ -0,0 +1,218 @@
+"""
+Unit tests for the content guard keyword matching and LLM moderation.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from src.plugins import guard as guard_module
+from src.plugins.guard import ContentGuard, KeywordMatcher, KeywordStreamScanner, ModerationCache
+
+
+def test_keyword_matcher_finds_any_keyword_case_insensitively():
+    matcher = KeywordMatcher(["贩毒", "Gamble", "", "gamble"])
+
+    assert matcher.keywords == ["贩毒", "gamble"]
+    assert matcher.search("let's GAMBLE tonight")[0] == "gamble"
+    assert matcher.search("涉及贩毒内容")[0] == "贩毒"
+    assert matcher.search("nothing to see here")[0] is None
+
+
+def test_keyword_matcher_follows_failure_links():
+    matcher = KeywordMatcher(["hers", "she", "his"])
+
+    # "ushers" contains both "she" and "hers"; the keyword that ends first wins
+    assert matcher.search("ushers")[0] == "she"
+    assert matcher.search("hhis")[0] == "his"
+    assert KeywordMatcher(["abcd", "bc"]).search("abce")[0] == "bc"
+
+
+def test_keyword_matcher_carries_state_across_chunks():
+    matcher = KeywordMatcher(["敏感词"])
+
+    keyword, state = matcher.search("这是一个敏")
+    assert keyword is None
+    keyword, state = matcher.search("感", state)
+    assert keyword is None
+    assert matcher.search("词", state)[0] == "敏感词"
+    assert matcher.search("词")[0] is None
+
+
+def test_keyword_matcher_agrees_with_substring_search():
+    rng = random.Random(0)
+    alphabet = "abc"
+    for _ in range(200):
+        keywords = ["".join(rng.choices(alphabet, k=rng.randint(1, 4))) for _ in range(rng.randint(1, 5))]
+        text = "".join(rng.choices(alphabet, k=rng.randint(0, 12)))
+        matched, _ = KeywordMatcher(keywords).search(text)
+
+        assert (matched is not None) == any(keyword in text for keyword in keywords), (keywords, text)
+        if matched is not None:
+            assert matched in text
+
+
+def test_stream_scanner_handles_content_blocks_and_stays_matched():
+    scanner = KeywordStreamScanner(KeywordMatcher(["forbidden"]))
+
+    assert not scanner.feed("this is forb")
+    assert scanner.feed([{"type": "text", "text": "idd"}, "en"])
+    assert scanner.matched == "forbidden"
+    assert scanner.feed("anything")
+
+
+@pytest.mark.asyncio
+async def test_content_guard_reloads_keywords_when_file_changes(tmp_path):
+    keywords_file = tmp_path / "bad_keywords.txt"
+    keywords_file.write_text("# comment\nfoo\n", encoding="utf-8")
+    guard = ContentGuard(keywords_file=str(keywords_file))
+
+    assert await guard.check_with_keywords("some foo text")
+    assert not await guard.check_with_keywords("some barbaz text")
+
+    keywords_file.write_text("foo\nbarbaz\n", encoding="utf-8")
+    assert await guard.check_with_keywords("some barbaz text")
+    assert guard.keywords == ["foo", "barbaz"]
+
+
+class FakeModerationModel:
+    """Async moderation model answering 不合规 for prompts containing "bad"; counts calls and concurrency."""
+
+    def __init__(self, delay: float = 0.0, error: Exception | None = None):
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+
+    async def acall(self, prompt: str):
+        self.calls += 1
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.error:
+                raise self.error
+            return SimpleNamespace(content="不合规" if "bad" in prompt else "合规")
+        finally:
+            self.active -= 1
+
+
+@pytest.fixture
+def llm_guard(tmp_path, monkeypatch):
+    model = FakeModerationModel()
+    monkeypatch.setattr(
+        guard_module,
+        "config",
+        SimpleNamespace(
+            enable_content_guard_llm=True, content_guard_llm_model="fake/guard", content_guard_llm_fast_path=False
+        ),
+    )
+    monkeypatch.setattr(guard_module, "select_model", lambda model_spec: model)
+    guard = ContentGuard(keywords_file=str(tmp_path / "missing.txt"))
+    return guard, model
+
+
+@pytest.mark.asyncio
+async def test_llm_verdicts_are_cached_by_text(llm_guard):
+    guard, model = llm_guard
+
+    assert await guard.check_with_llm("some bad text")
+    assert not await guard.check_with_llm("fine text")
+    assert await guard.check_with_llm("Some BAD text")
+    assert not await guard.check_with_llm("fine text")
+    assert model.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_llm_cache_entries_expire_after_ttl(llm_guard, monkeypatch):
+    guard, model = llm_guard
+    now = [0.0]
+    monkeypatch.setattr(guard_module, "time", SimpleNamespace(monotonic=lambda: now[0]))
+
+    assert not await guard.check_with_llm("fine text")
+    now[0] = guard_module.LLM_MODERATION_CACHE_TTL - 1
+    assert not await guard.check_with_llm("fine text")
+    assert model.calls == 1
+
+    now[0] = guard_module.LLM_MODERATION_CACHE_TTL + 1
+    assert not await guard.check_with_llm("fine text")
+    assert model.calls == 2
+
+
+def test_moderation_cache_evicts_least_recently_used():
+    cache = ModerationCache(max_entries=2)
+    cache.put("a", True)
+    cache.put("b", False)
+    assert cache.get("a") is True
+    cache.put("c", False)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is True
+    assert cache.get("c") is False
+
+
+@pytest.mark.asyncio
+async def test_identical_texts_in_flight_share_one_call(llm_guard):
+    guard, model = llm_guard
+    model.delay = 0.05
+
+    verdicts = await asyncio.gather(*(guard.check_with_llm("bad text") for _ in range(5)))
+    assert verdicts == [True] * 5
+    assert model.calls == 1
+    assert guard._moderation_inflight == {}
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_shared_call(llm_guard):
+    guard, model = llm_guard
+    model.delay = 0.05
+
+    first = asyncio.create_task(guard.check_with_llm("bad text"))
+    await asyncio.sleep(0.01)
+    first.cancel()
+    assert await guard.check_with_llm("bad text")
+    assert model.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_llm_calls_are_limited_by_semaphore(llm_guard):
+    guard, model = llm_guard
+    model.delay = 0.02
+
+    await asyncio.gather(*(guard.check_with_llm(f"text {i}") for i in range(10)))
+    assert model.calls == 10
+    assert model.max_active == guard_module.LLM_MODERATION_CONCURRENCY
+
+
+@pytest.mark.parametrize(
+    ("delay", "error"),
+    [(0.0, RuntimeError("service unavailable")), (1.0, None)],
+    ids=["error", "timeout"],
+)
+@pytest.mark.asyncio
+async def test_llm_failure_fails_closed_without_caching(llm_guard, monkeypatch, delay, error):
+    guard, model = llm_guard
+    monkeypatch.setattr(guard_module, "LLM_MODERATION_TIMEOUT", 0.05)
+    model.delay, model.error = delay, error
+
+    assert await guard.check_with_llm("fine text")
+    assert model.calls == 1
+
+    model.delay, model.error = 0.0, None
+    assert not await guard.check_with_llm("fine text")
+    assert model.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_check_skips_llm_when_disabled(llm_guard):
+    guard, model = llm_guard
+    guard_module.config.enable_content_guard_llm = False
+
+    assert not await guard.check("some bad text")
+    assert not await guard.check_with_llm("some bad text")
+    assert model.calls == 0
@@ -0,0 +1,85 @@
+"""
+Unit tests for knowledge base chunking helpers.
+"""
+
+from __future__ import annotations
+
+from src.knowledge.utils.kb_utils import diff_chunks
+
+
+def make_chunks(contents: list[str], file_id: str = "file_1", source: str = "doc.md") -> list[dict]:
+    """Build chunk records in the shape produced by split_text_into_chunks."""
+    return [
+        {
+            "id": f"{file_id}_chunk_{index}",
+            "chunk_id": f"{file_id}_chunk_{index}",
+            "content": content,
+            "file_id": file_id,
+            "filename": source,
+            "chunk_index": index,
+            "source": source,
+        }
+        for index, content in enumerate(contents)
+    ]
+
+
+def test_diff_chunks_without_changes_reuses_all_ids():
+    stored = make_chunks(["alpha", "beta", "gamma"])
+    chunks = make_chunks(["alpha", "beta", "gamma"])
+
+    diff = diff_chunks(stored, chunks, revision=1)
+
+    assert diff.added == []
+    assert diff.moved == []
+    assert diff.removed_ids == []
+    assert diff.unchanged_count == 3
+    assert [chunk["id"] for chunk in diff.chunks] == [chunk["id"] for chunk in stored]
+
+
+def test_diff_chunks_only_adds_and_removes_changed_content():
+    stored = make_chunks(["alpha", "beta", "gamma"])
+    chunks = make_chunks(["alpha", "beta v2", "gamma"])
+
+    diff = diff_chunks(stored, chunks, revision=2)
+
+    assert [chunk["content"] for chunk in diff.added] == ["beta v2"]
+    assert diff.added[0]["id"] == diff.added[0]["chunk_id"] == "file_1_r2_chunk_1"
+    assert diff.removed_ids == ["file_1_chunk_1"]
+    assert diff.moved == []
+    assert diff.unchanged_count == 2
+    assert diff.chunks[0]["id"] == "file_1_chunk_0"
+    assert diff.chunks[2]["id"] == "file_1_chunk_2"
+
+
+def test_diff_chunks_marks_shifted_chunks_as_moved():
+    stored = make_chunks(["alpha", "beta"])
+    chunks = make_chunks(["intro", "alpha", "beta"])
+
+    diff = diff_chunks(stored, chunks, revision=1)
+
+    assert [chunk["content"] for chunk in diff.added] == ["intro"]
+    assert [(chunk["id"], chunk["chunk_index"]) for chunk in diff.moved] == [
+        ("file_1_chunk_0", 1),
+        ("file_1_chunk_1", 2),
+    ]
+    assert diff.removed_ids == []
+
+
+def test_diff_chunks_matches_duplicate_content_in_order():
+    stored = make_chunks(["same", "other", "same"])
+    chunks = make_chunks(["same"])
+
+    diff = diff_chunks(stored, chunks, revision=1)
+
+    assert diff.chunks[0]["id"] == "file_1_chunk_0"
+    assert sorted(diff.removed_ids) == ["file_1_chunk_1", "file_1_chunk_2"]
+
+
+def test_diff_chunks_treats_source_change_as_move():
+    stored = make_chunks(["alpha"], source="old.md")
+    chunks = make_chunks(["alpha"], source="new.md")
+
+    diff = diff_chunks(stored, chunks, revision=1)
+
+    assert diff.added == []
+    assert [chunk["id"] for chunk in diff.moved] == ["file_1_chunk_0"]
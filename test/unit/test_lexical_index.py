@@ -0,0 +1,182 @@
+"""
+Unit tests for the SQLite FTS5 lexical index and the hybrid fusion helpers.
+"""
+
+from __future__ import annotations
+
+import pytest
+
+from src.knowledge.utils.lexical_index import (
+    LexicalIndex,
+    build_match_query,
+    reciprocal_rank_fusion,
+    tokenize,
+    weighted_score_fusion,
+)
+
+
+def _chunk(chunk_id: str, file_id: str, content: str) -> dict:
+    return {"chunk_id": chunk_id, "file_id": file_id, "content": content, "source": f"{file_id}.txt"}
+
+
+@pytest.fixture
+def index(tmp_path):
+    lexical_index = LexicalIndex(str(tmp_path / "lexical_index.db"))
+    yield lexical_index
+    lexical_index.close()
+
+
+def test_tokenize_splits_cjk_into_bigrams_and_keeps_single_chars():
+    assert tokenize("红楼梦") == ["红楼", "楼梦"]
+    assert tokenize("梦 a") == ["梦", "a"]
+
+
+def test_tokenize_keeps_codes_whole_and_optionally_splits_them():
+    assert tokenize("型号 XK-1234-B") == ["型号", "xk-1234-b", "xk", "1234", "b"]
+    assert tokenize("型号 XK-1234-B", split_codes=False) == ["型号", "xk-1234-b"]
+
+
+def test_tokenize_normalizes_full_width_and_case():
+    assert tokenize("ＡＢ－１２") == tokenize("ab-12")
+
+
+def test_build_match_query_quotes_tokens():
+    assert build_match_query([]) is None
+    assert build_match_query(["xk-1234", "型号"]) == '"xk-1234" OR "型号"'
+    assert build_match_query(["a", "b"], "AND") == '"a" AND "b"'
+
+
+def test_search_finds_exact_code_and_returns_metadata(index):
+    index.add_chunks(
+        [
+            _chunk("c1", "f1", "零件 XK-1234-B 的安装说明"),
+            _chunk("c2", "f1", "零件 XK-1235-B 的拆卸说明"),
+            _chunk("c3", "f2", "与零件无关的内容"),
+        ]
+    )
+
+    results = index.search("XK-1234-B", top_k=5)
+    assert [r["metadata"]["chunk_id"] for r in results] == ["c1"]
+    assert results[0]["metadata"]["file_id"] == "f1"
+    assert results[0]["metadata"]["source"] == "f1.txt"
+    assert results[0]["score"] > 0
+
+
+def test_search_ranks_chunks_with_more_matching_terms_first(index):
+    index.add_chunks([_chunk("c1", "f1", "宝玉听了便笑道"), _chunk("c2", "f1", "黛玉听了")])
+    results = index.search("宝玉笑道", top_k=5)
+    assert results[0]["metadata"]["chunk_id"] == "c1"
+
+
+def test_add_chunks_overwrites_existing_chunk_id(index):
+    index.add_chunks([_chunk("c1", "f1", "旧版说明")])
+    index.add_chunks([_chunk("c1", "f1", "XK-1234")])
+
+    assert index.count() == 1
+    assert index.search("旧版说明") == []
+    assert index.search("XK-1234")[0]["content"] == "XK-1234"
+
+
+def test_delete_files_removes_chunks_from_search_and_count(index):
+    index.add_chunks(
+        [_chunk("c1", "f1", "共同词 甲"), _chunk("c2", "f2", "共同词 乙"), _chunk("c3", "f3", "共同词 丙")]
+    )
+
+    assert index.delete_files(["f1", "f2"]) == 2
+    assert index.count() == 1
+    assert [r["metadata"]["file_id"] for r in index.search("共同词")] == ["f3"]
+
+
+def test_search_filters_by_file_ids(index):
+    index.add_chunks([_chunk(f"c{i}", f"f{i % 3}", f"共同词 第{i}段") for i in range(9)])
+
+    results = index.search("共同词", top_k=10, file_ids=["f1"])
+    assert {r["metadata"]["file_id"] for r in results} == {"f1"}
+    assert len(results) == 3
+    assert index.search("共同词", file_ids=[]) == []
+    assert index.search("共同词", file_ids=["missing"]) == []
+
+
+def test_search_filter_accepts_more_file_ids_than_sqlite_variable_limit(index):
+    index.add_chunks([_chunk("c1", "target", "零件 XK-1234-B")])
+    file_ids = [f"f{i}" for i in range(40000)] + ["target"]
+
+    results = index.search("XK-1234-B", file_ids=file_ids)
+    assert [r["metadata"]["chunk_id"] for r in results] == ["c1"]
+    # 临时表在检索后回滚，不影响下一次过滤
+    assert index.search("XK-1234-B", file_ids=["f1"]) == []
+
+
+def test_common_terms_are_dropped_when_rare_terms_exist(index):
+    index.add_chunks([_chunk(f"c{i}", "f1", f"说明 第{i}段") for i in range(20)])
+    index.add_chunks([_chunk("code", "f2", "说明 XK-1234-B")])
+
+    results = index.search("说明 XK-1234-B", top_k=5)
+    assert [r["metadata"]["chunk_id"] for r in results] == ["code"]
+
+
+def test_common_terms_are_scored_only_on_newest_matches(index, monkeypatch):
+    monkeypatch.setattr(LexicalIndex, "MAX_SCORED_ROWS", 5)
+    index.add_chunks([_chunk(f"c{i}", "f1", f"说明 第{i}段") for i in range(20)])
+
+    results = index.search("说明", top_k=10)
+    assert {r["metadata"]["chunk_id"] for r in results} == {f"c{i}" for i in range(15, 20)}
+
+
+def test_filtered_search_visits_at_most_max_visited_rows(index, monkeypatch):
+    monkeypatch.setattr(LexicalIndex, "MAX_VISITED_ROWS", 4)
+    index.add_chunks([_chunk(f"c{i}", f"f{i % 2}", f"说明 第{i}段") for i in range(10)])
+
+    results = index.search("说明", top_k=10, file_ids=["f0", "f1"])
+    assert {r["metadata"]["chunk_id"] for r in results} == {"c6", "c7", "c8", "c9"}
+
+
+def test_sync_state_and_backfill_cursor_persist(tmp_path):
+    db_path = str(tmp_path / "lexical_index.db")
+    index = LexicalIndex(db_path)
+    index.add_chunks([_chunk("c1", "f1", "内容")])
+    index.save_backfill_cursor("100")
+    index.close()
+
+    index = LexicalIndex(db_path)
+    assert not index.synced
+    assert index.backfill_cursor == "100"
+    assert index.count() == 1
+    index.mark_synced()
+    index.close()
+
+    index = LexicalIndex(db_path)
+    assert index.synced
+    assert index.backfill_cursor is None
+    index.close()
+
+
+def _result(chunk_id: str, score: float) -> dict:
+    return {"content": chunk_id, "metadata": {"chunk_id": chunk_id}, "score": score}
+
+
+def test_reciprocal_rank_fusion_sums_weighted_reciprocal_ranks():
+    fused = reciprocal_rank_fusion([[_result("a", 0.9), _result("b", 0.8)], [_result("b", 12.0), _result("c", 3.0)]])
+
+    assert [r["metadata"]["chunk_id"] for r in fused] == ["b", "a", "c"]
+    assert fused[0]["score"] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused[1]["score"] == pytest.approx(1 / 61)
+
+
+def test_reciprocal_rank_fusion_respects_weights():
+    fused = reciprocal_rank_fusion([[_result("a", 1.0)], [_result("b", 1.0)]], weights=[0.2, 0.8])
+    assert [r["metadata"]["chunk_id"] for r in fused] == ["b", "a"]
+
+
+def test_weighted_score_fusion_normalizes_each_list():
+    vector = [_result("a", 0.9), _result("b", 0.5)]
+    keyword = [_result("b", 30.0), _result("c", 10.0)]
+
+    fused = weighted_score_fusion([vector, keyword], [0.5, 0.5])
+    scores = {r["metadata"]["chunk_id"]: r["score"] for r in fused}
+    assert scores == pytest.approx({"a": 0.5, "b": 0.5, "c": 0.0})
+
+
+def test_weighted_score_fusion_skips_empty_lists_and_handles_equal_scores():
+    fused = weighted_score_fusion([[], [_result("a", 2.0), _result("b", 2.0)]], [0.7, 0.3])
+    assert [r["score"] for r in fused] == pytest.approx([0.3, 0.3])
@@ -0,0 +1,141 @@
+"""
+Unit tests for structured retrieval filters.
+"""
+
+from __future__ import annotations
+
+from datetime import UTC, datetime
+
+import pytest
+
+from src.knowledge.utils.metadata_filter import (
+    decode_milvus_tags,
+    encode_milvus_tags,
+    match_record,
+    normalize_tags,
+    parse_filter,
+    to_chroma_where,
+    to_milvus_expr,
+)
+
+JAN_1_2025_SHANGHAI = int(datetime(2024, 12, 31, 16, tzinfo=UTC).timestamp())
+
+
+def test_parse_filter_normalizes_values():
+    parsed = parse_filter(
+        {
+            "file_ids": "file_1",
+            "file_types": [".PDF", "md"],
+            "created_after": "2025-01-01",
+            "created_before": 1767225600,
+            "tags": "财务, 2025,财务",
+        }
+    )
+
+    assert parsed == {
+        "file_ids": ["file_1"],
+        "file_types": ["pdf", "md"],
+        "created_after": JAN_1_2025_SHANGHAI,
+        "created_before": 1767225600,
+        "tags": ["财务", "2025"],
+    }
+
+
+def test_parse_filter_drops_empty_conditions():
+    assert parse_filter(None) is None
+    assert parse_filter({}) is None
+    assert parse_filter({"file_ids": [], "tags": "", "created_after": None}) is None
+
+
+@pytest.mark.parametrize(
+    "query_filter",
+    [
+        {"file_name": "a.pdf"},
+        {"file_ids": 123},
+        ["file_ids"],
+    ],
+)
+def test_parse_filter_rejects_invalid_input(query_filter):
+    with pytest.raises(ValueError):
+        parse_filter(query_filter)
+
+
+def test_normalize_tags_strips_separator_and_limits_count():
+    assert normalize_tags(["a|b", " 50% ", "a|b"]) == ["ab", "50"]
+    with pytest.raises(ValueError):
+        normalize_tags([f"tag{i}" for i in range(33)])
+
+
+def test_milvus_tags_round_trip():
+    encoded = encode_milvus_tags(["财务", "2025"])
+    assert encoded == "|财务|2025|"
+    assert decode_milvus_tags(encoded) == ["财务", "2025"]
+    assert encode_milvus_tags([]) == ""
+    assert decode_milvus_tags(None) == []
+
+
+def test_to_milvus_expr_combines_all_conditions():
+    expr = to_milvus_expr(
+        {
+            "file_ids": ["file_1", "file_2"],
+            "file_types": ["pdf"],
+            "created_after": 100,
+            "created_before": 200,
+            "tags": ["财务", "2025"],
+        }
+    )
+
+    assert expr == (
+        'file_id in ["file_1", "file_2"] and file_type in ["pdf"] and created_at >= 100 and created_at < 200 '
+        'and (tags like "%|财务|%" or tags like "%|2025|%")'
+    )
+
+
+def test_to_milvus_expr_without_conditions():
+    assert to_milvus_expr(None) is None
+    assert to_milvus_expr({}) is None
+    assert to_milvus_expr({"tags": []}) is None
+
+
+def test_to_milvus_expr_escapes_quotes():
+    assert to_milvus_expr({"file_ids": ['a" or id != "']}) == 'file_id in ["a\\" or id != \\""]'
+
+
+def test_to_chroma_where_single_condition_is_not_wrapped():
+    assert to_chroma_where({"file_ids": ["file_1"]}) == {"full_doc_id": {"$in": ["file_1"]}}
+    assert to_chroma_where({"tags": ["财务"]}) == {"tag:财务": True}
+    assert to_chroma_where(None) is None
+    assert to_chroma_where({"tags": []}) is None
+
+
+def test_to_chroma_where_combines_all_conditions():
+    where = to_chroma_where(
+        {
+            "file_ids": ["file_1"],
+            "file_types": ["pdf", "md"],
+            "created_after": 100,
+            "created_before": 200,
+            "tags": ["财务", "2025"],
+        }
+    )
+
+    assert where == {
+        "$and": [
+            {"full_doc_id": {"$in": ["file_1"]}},
+            {"file_type": {"$in": ["pdf", "md"]}},
+            {"created_at": {"$gte": 100}},
+            {"created_at": {"$lt": 200}},
+            {"$or": [{"tag:财务": True}, {"tag:2025": True}]},
+        ]
+    }
+
+
+def test_match_record_agrees_with_filter_semantics():
+    record = {"file_id": "file_1", "file_type": "pdf", "created_at": 150, "tags": ["财务"]}
+
+    assert match_record(record, None)
+    assert match_record(record, {"file_types": ["pdf"], "created_after": 150, "created_before": 151})
+    assert match_record(record, {"tags": ["2025", "财务"]})
+    assert not match_record(record, {"file_ids": ["file_2"]})
+    assert not match_record(record, {"created_before": 150})
+    assert not match_record(record, {"tags": ["2025"]})
@@ -0,0 +1,228 @@
+"""
+Unit tests for the SQLite metadata store and the legacy JSON metadata migration.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+
+import pytest
+
+from src.knowledge.utils.metadata_store import MetadataStore, migrate_json_metadata
+
+KINDS = {"databases": "databases", "files": "files"}
+
+LEGACY_METADATA = {
+    "databases": {"kb_1": {"name": "手册", "metadata": {"chunk_size": 1000, "tags": ["a", "b"]}}},
+    "files": {
+        "file_1": {"database_id": "kb_1", "status": "done", "processing_params": {"ocr": {"engine": "rapid"}}},
+        "file_2": {"database_id": "kb_1", "status": "failed", "error": "解析失败"},
+    },
+    "version": "2.0",
+}
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "metadata.db")
+
+
+@pytest.fixture
+def store(db_path):
+    metadata_store = MetadataStore(db_path)
+    yield metadata_store
+    metadata_store.close()
+
+
+def _write_legacy(tmp_path, data) -> str:
+    json_path = tmp_path / "metadata.json"
+    json_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    return str(json_path)
+
+
+def _stored_rows(db_path: str, kind: str) -> dict[str, dict]:
+    conn = sqlite3.connect(db_path)
+    try:
+        rows = conn.execute("SELECT key, value FROM records WHERE kind = ?", (kind,)).fetchall()
+    finally:
+        conn.close()
+    return {key: json.loads(value) for key, value in rows}
+
+
+def test_migration_imports_nested_records_and_renames_json(tmp_path, db_path, store):
+    json_path = _write_legacy(tmp_path, LEGACY_METADATA)
+
+    assert migrate_json_metadata(json_path, store, KINDS)
+    assert not (tmp_path / "metadata.json").exists()
+    assert json.loads((tmp_path / "metadata.json.migrated").read_text(encoding="utf-8")) == LEGACY_METADATA
+    assert store.get_meta("version") == "2.0"
+    store.close()
+
+    reopened = MetadataStore(db_path)
+    try:
+        assert dict(reopened.table("databases").items()) == LEGACY_METADATA["databases"]
+        assert dict(reopened.table("files").items()) == LEGACY_METADATA["files"]
+        assert reopened.table("files")["file_1"]["processing_params"]["ocr"]["engine"] == "rapid"
+    finally:
+        reopened.close()
+
+
+def test_migration_is_idempotent(tmp_path, db_path, store):
+    json_path = _write_legacy(tmp_path, LEGACY_METADATA)
+    assert migrate_json_metadata(json_path, store, KINDS)
+    store.table("files")["file_1"]["status"] = "indexed"
+    store.commit()
+
+    # 再次迁移时 JSON 已被重命名；即使旧文件重新出现，非空存储也不会被覆盖
+    assert not migrate_json_metadata(json_path, store, KINDS)
+    json_path = _write_legacy(tmp_path, LEGACY_METADATA)
+    assert not migrate_json_metadata(json_path, store, KINDS)
+
+    assert (tmp_path / "metadata.json").exists()
+    assert _stored_rows(db_path, "files")["file_1"]["status"] == "indexed"
+
+
+def test_migration_skips_missing_and_corrupted_json(tmp_path, store):
+    assert not migrate_json_metadata(str(tmp_path / "missing.json"), store, KINDS)
+
+    json_path = tmp_path / "metadata.json"
+    json_path.write_text('{"databases": {', encoding="utf-8")
+    assert not migrate_json_metadata(str(json_path), store, KINDS)
+
+    assert json_path.exists()
+    assert store.is_empty()
+
+
+def test_failed_commit_keeps_json_and_leaves_store_empty(tmp_path, db_path, store):
+    json_path = _write_legacy(tmp_path, LEGACY_METADATA)
+    store._conn.execute(
+        "CREATE TRIGGER fail_file_2 BEFORE INSERT ON records WHEN NEW.key = 'file_2' "
+        "BEGIN SELECT RAISE(ABORT, 'disk full'); END"
+    )
+
+    with pytest.raises(sqlite3.IntegrityError):
+        migrate_json_metadata(json_path, store, KINDS)
+
+    # 事务整体回滚：JSON 保留，存储中没有写入部分记录
+    assert (tmp_path / "metadata.json").exists()
+    assert not (tmp_path / "metadata.json.migrated").exists()
+    assert store.is_empty()
+
+    store._conn.execute("DROP TRIGGER fail_file_2")
+    assert store.commit() == 3
+    assert _stored_rows(db_path, "files") == LEGACY_METADATA["files"]
+
+
+def test_migration_of_empty_sections(tmp_path, store):
+    json_path = _write_legacy(tmp_path, {"databases": {"kb_1": {"name": "空库"}}, "files": None})
+
+    assert migrate_json_metadata(json_path, store, KINDS)
+    assert len(store.table("files")) == 0
+    assert store.table("databases")["kb_1"]["name"] == "空库"
+    assert store.get_meta("version") is None
+
+
+def test_record_changes_are_tracked_and_only_dirty_rows_written(db_path, store):
+    files = store.table("files")
+    files["f1"] = {"status": "waiting", "metadata": {"k": 1}}
+    files["f2"] = {"status": "waiting"}
+    assert store.commit() == 2
+    assert store.commit() == 0
+
+    files["f1"]["status"] = "waiting"  # 标量值未变化，不标记
+    assert store.commit() == 0
+
+    files["f1"]["status"] = "done"
+    assert store.commit() == 1
+    assert _stored_rows(db_path, "files")["f1"]["status"] == "done"
+
+    files["f2"].update(error="timeout")
+    files["f2"].setdefault("retries", 0)
+    del files["f1"]["metadata"]
+    assert store.commit() == 2
+    assert _stored_rows(db_path, "files") == {
+        "f1": {"status": "done"},
+        "f2": {"status": "waiting", "error": "timeout", "retries": 0},
+    }
+
+
+def test_record_pop_clear_and_delete(db_path, store):
+    files = store.table("files")
+    files["f1"] = {"status": "done", "error": "x"}
+    files["f2"] = {"status": "done"}
+    store.commit()
+
+    assert files["f1"].pop("error") == "x"
+    files["f2"].clear()
+    assert store.commit() == 2
+    assert _stored_rows(db_path, "files") == {"f1": {"status": "done"}, "f2": {}}
+
+    del files["f2"]
+    assert store.commit() == 1
+    assert "f2" not in _stored_rows(db_path, "files")
+
+
+def test_nested_mutation_needs_mark_dirty(db_path, store):
+    files = store.table("files")
+    files["f1"] = {"metadata": {"k": 1}}
+    store.commit()
+
+    files["f1"]["metadata"]["k"] = 2
+    assert store.commit() == 0
+    assert _stored_rows(db_path, "files")["f1"]["metadata"] == {"k": 1}
+
+    files.mark_dirty("f1")
+    assert store.commit() == 1
+    assert _stored_rows(db_path, "files")["f1"]["metadata"] == {"k": 2}
+
+
+def test_replaced_record_no_longer_tracks_changes(db_path, store):
+    files = store.table("files")
+    files["f1"] = {"status": "waiting"}
+    store.commit()
+
+    old_record = files["f1"]
+    files["f1"] = {"status": "done"}
+    store.commit()
+
+    old_record["status"] = "stale"
+    assert store.commit() == 0
+    assert _stored_rows(db_path, "files")["f1"]["status"] == "done"
+
+
+def test_copy_returns_untracked_plain_dict(store):
+    files = store.table("files")
+    files["f1"] = {"status": "done"}
+    store.commit()
+
+    snapshot = files["f1"].copy()
+    assert type(snapshot) is dict
+    snapshot["status"] = "changed"
+    assert store.commit() == 0
+    assert files["f1"]["status"] == "done"
+
+
+def test_normalizer_runs_on_load_and_commit(db_path):
+    def normalize(record: dict) -> None:
+        record.setdefault("status", "waiting")
+
+    store = MetadataStore(db_path)
+    store.table("files", normalizer=normalize)["f1"] = {"name": "a.txt"}
+    store.commit()
+    assert _stored_rows(db_path, "files")["f1"] == {"name": "a.txt", "status": "waiting"}
+    store.close()
+
+    conn = sqlite3.connect(db_path)
+    conn.execute("""INSERT INTO records (kind, key, value) VALUES ('files', 'f2', '{"name": "b.txt"}')""")
+    conn.execute("INSERT INTO records (kind, key, value) VALUES ('files', 'broken', '{')")
+    conn.commit()
+    conn.close()
+
+    store = MetadataStore(db_path)
+    try:
+        files = store.table("files", normalizer=normalize)
+        assert set(files) == {"f1", "f2"}
+        assert files["f2"]["status"] == "waiting"
+    finally:
+        store.close()
@@ -0,0 +1,67 @@
+"""
+Unit tests for the SQLite-backed document parse result cache.
+"""
+
+from __future__ import annotations
+
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+from src.knowledge.utils import parse_cache
+from src.knowledge.utils.parse_cache import ParseResultCache, make_parse_key
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # 递增的时钟，保证最近访问时间严格有序
+    clock = itertools.count(1)
+    monkeypatch.setattr(parse_cache, "time", SimpleNamespace(time=lambda: float(next(clock))))
+    cache = ParseResultCache(str(tmp_path / "cache" / "parse_results.db"), max_bytes=100)
+    yield cache
+    cache._conn.close()
+
+
+def test_make_parse_key_changes_with_parser_params_only():
+    base = make_parse_key("hash", ".pdf", {"enable_ocr": "onnx_rapid_ocr", "chunk_size": 500})
+
+    assert base == make_parse_key("hash", ".PDF", {"enable_ocr": "onnx_rapid_ocr", "chunk_size": 1000})
+    assert base != make_parse_key("hash", ".pdf", {"enable_ocr": "mineru_ocr"})
+    assert base != make_parse_key("hash", ".docx", {"enable_ocr": "onnx_rapid_ocr"})
+    assert base != make_parse_key("other", ".pdf", {"enable_ocr": "onnx_rapid_ocr"})
+    assert make_parse_key("hash", ".pdf", None) == make_parse_key("hash", ".pdf", {})
+
+
+def test_get_and_put_track_hits_and_misses(cache):
+    assert cache.get("k1") is None
+
+    cache.put("k1", "# a.pdf\n\n内容", "a.pdf", {"ocr_pages": [1]})
+    assert cache.get("k1") == ("# a.pdf\n\n内容", "a.pdf", {"ocr_pages": [1]})
+
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert stats["size_bytes"] == len("# a.pdf\n\n内容".encode())
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_put_evicts_least_recently_accessed_entries_over_size_limit(cache):
+    cache.put("k1", "a" * 40, "1.txt")
+    cache.put("k2", "b" * 40, "2.txt")
+    cache.get("k1")  # k2 成为最久未访问的记录
+    cache.put("k3", "c" * 40, "3.txt")
+
+    assert cache.get("k2") is None
+    assert cache.get("k1") is not None
+    assert cache.get("k3") is not None
+    assert cache.stats()["size_bytes"] == 80
+
+
+def test_clear_removes_entries_and_resets_counters(cache):
+    cache.put("k1", "a", "1.txt")
+    cache.get("k1")
+    cache.clear()
+
+    stats = cache.stats()
+    assert (stats["entries"], stats["size_bytes"]) == (0, 0)
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (0, 0, 0.0)
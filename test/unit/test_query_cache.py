@@ -0,0 +1,98 @@
+"""
+Unit tests for the knowledge base query result cache.
+"""
+
+from __future__ import annotations
+
+from src.knowledge.utils import query_cache
+from src.knowledge.utils.query_cache import QueryResultCache, normalize_query
+
+
+def test_normalize_query_collapses_whitespace_and_width():
+    assert normalize_query("  红楼梦\t 人物 \n") == "红楼梦 人物"
+    assert normalize_query("ＡＢＣ　１２３") == "ABC 123"
+
+
+def test_make_key_ignores_kwarg_order_and_query_spacing():
+    first = QueryResultCache.make_key("kb_1", "hello  world", {"top_k": 5, "mode": "mix"})
+    second = QueryResultCache.make_key("kb_1", " hello world ", {"mode": "mix", "top_k": 5})
+    assert first == second
+
+
+def test_get_returns_copy_of_cached_result():
+    cache = QueryResultCache()
+    key = cache.make_key("kb_1", "query", {})
+    cache.put(key, [{"content": "a"}])
+
+    hit, result = cache.get(key)
+    assert hit
+    result[0]["content"] = "mutated"
+    assert cache.get(key) == (True, [{"content": "a"}])
+
+
+def test_invalidate_only_drops_entries_of_that_database():
+    cache = QueryResultCache()
+    key_a = cache.make_key("kb_a", "query", {})
+    key_b = cache.make_key("kb_b", "query", {})
+    cache.put(key_a, ["a"])
+    cache.put(key_b, ["b"])
+
+    assert cache.invalidate("kb_a") == 1
+    assert cache.get(key_a) == (False, None)
+    assert cache.get(key_b) == (True, ["b"])
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_put_skips_result_computed_before_invalidation():
+    cache = QueryResultCache()
+    key = cache.make_key("kb_1", "query", {})
+
+    generation = cache.generation("kb_1")
+    cache.invalidate("kb_1")
+
+    assert cache.put(key, ["stale"], generation=generation) is False
+    assert cache.get(key) == (False, None)
+
+    assert cache.put(key, ["fresh"], generation=cache.generation("kb_1")) is True
+    assert cache.get(key) == (True, ["fresh"])
+
+
+def test_clear_bumps_generation_of_known_databases():
+    cache = QueryResultCache()
+    key = cache.make_key("kb_1", "query", {})
+    cache.put(key, ["a"])
+    cache.invalidate("kb_1")
+
+    generation = cache.generation("kb_1")
+    cache.clear()
+
+    assert cache.stats()["entries"] == 0
+    assert cache.put(key, ["stale"], generation=generation) is False
+
+
+def test_expired_entries_are_misses(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(query_cache.time, "monotonic", lambda: now[0])
+
+    cache = QueryResultCache(ttl=10)
+    key = cache.make_key("kb_1", "query", {})
+    cache.put(key, ["a"])
+
+    now[0] += 5
+    assert cache.get(key)[0]
+    now[0] += 10
+    assert cache.get(key) == (False, None)
+    assert cache.stats()["entries"] == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = QueryResultCache(max_entries=2)
+    keys = [cache.make_key("kb_1", f"query {i}", {}) for i in range(3)]
+    cache.put(keys[0], [0])
+    cache.put(keys[1], [1])
+    cache.get(keys[0])
+    cache.put(keys[2], [2])
+
+    assert cache.get(keys[0])[0]
+    assert not cache.get(keys[1])[0]
+    assert cache.get(keys[2])[0]
@@ -0,0 +1,166 @@
+"""
+Unit tests for agent stream output formats.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+
+import pytest
+from langchain_core.messages import AIMessageChunk
+
+from server.utils import stream_format
+from server.utils.stream_format import StreamWriter, iter_with_idle_ticks, resolve_stream_format
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Freeze the coalescing clock; advance it by assigning to clock[0]."""
+    now = [0.0]
+    monkeypatch.setattr(stream_format.time, "monotonic", lambda: now[0])
+    return now
+
+
+def decode(output: bytes) -> list[dict]:
+    return [json.loads(line) for line in output.decode("utf-8").splitlines() if line]
+
+
+def test_resolve_stream_format():
+    assert resolve_stream_format(None) == "json"
+    assert resolve_stream_format("SSE") == "sse"
+    with pytest.raises(ValueError):
+        resolve_stream_format("xml")
+
+
+def test_json_format_sends_every_token_with_full_message():
+    writer = StreamWriter("json", request_id="req_1")
+    events = decode(writer.token(AIMessageChunk(content="你", id="msg_1"), metadata={"node": "model"}))
+
+    assert len(events) == 1
+    assert events[0]["status"] == "loading"
+    assert events[0]["request_id"] == "req_1"
+    assert events[0]["response"] == "你"
+    assert events[0]["msg"]["content"] == "你"
+    assert events[0]["metadata"] == {"node": "model"}
+    assert writer.flush() == b""
+
+
+def test_compact_format_sends_header_once_and_coalesces_tokens(clock):
+    writer = StreamWriter("compact", request_id="req_1")
+
+    header = decode(writer.token(AIMessageChunk(content="你", id="msg_1"), metadata={"node": "model"}))
+    assert header == [
+        {
+            "status": "message",
+            "id": "msg_1",
+            "msg": header[0]["msg"],
+            "metadata": {"node": "model"},
+        }
+    ]
+    assert "content" not in header[0]["msg"]
+
+    assert writer.token(AIMessageChunk(content="好", id="msg_1")) == b""
+    assert writer.token(AIMessageChunk(content="！", id="msg_1")) == b""
+
+    assert decode(writer.flush()) == [{"status": "delta", "id": "msg_1", "content": "你好！"}]
+    assert writer.flush() == b""
+
+
+def test_compact_format_flushes_when_window_elapses(clock):
+    writer = StreamWriter("compact", window_ms=50)
+    writer.token(AIMessageChunk(content="a", id="msg_1"))
+    assert not writer.due()
+
+    clock[0] += 0.049
+    assert writer.token(AIMessageChunk(content="b", id="msg_1")) == b""
+
+    clock[0] += 0.002
+    assert writer.due()
+    assert decode(writer.token(AIMessageChunk(content="c", id="msg_1"))) == [
+        {"status": "delta", "id": "msg_1", "content": "abc"}
+    ]
+
+
+def test_compact_format_flushes_at_max_chars(clock):
+    writer = StreamWriter("compact", max_chars=4)
+    writer.token(AIMessageChunk(content="ab", id="msg_1"))
+
+    assert decode(writer.token(AIMessageChunk(content="cd", id="msg_1"))) == [
+        {"status": "delta", "id": "msg_1", "content": "abcd"}
+    ]
+
+
+def test_compact_format_flushes_before_new_message_and_events(clock):
+    writer = StreamWriter("compact", request_id="req_1")
+    writer.token(AIMessageChunk(content="first", id="msg_1"))
+
+    events = decode(writer.token(AIMessageChunk(content="second", id="msg_2")))
+    assert [(event["status"], event["id"]) for event in events] == [("delta", "msg_1"), ("message", "msg_2")]
+    assert events[0]["content"] == "first"
+
+    events = decode(writer.event(status="finished"))
+    assert events == [
+        {"status": "delta", "id": "msg_2", "content": "second"},
+        {"request_id": "req_1", "response": None, "status": "finished"},
+    ]
+
+
+def test_compact_format_merges_tool_call_chunks(clock):
+    writer = StreamWriter("compact")
+    writer.token(
+        AIMessageChunk(
+            content="", id="msg_1", tool_call_chunks=[{"name": "search", "args": '{"q": ', "id": "call_1", "index": 0}]
+        )
+    )
+    writer.token(AIMessageChunk(content="", id="msg_1", tool_call_chunks=[{"args": '"红楼梦"}', "index": 0}]))
+
+    (delta,) = decode(writer.flush())
+    assert delta["content"] == ""
+    assert len(delta["tool_call_chunks"]) == 1
+    assert delta["tool_call_chunks"][0]["name"] == "search"
+    assert delta["tool_call_chunks"][0]["args"] == '{"q": "红楼梦"}'
+
+
+def test_discard_drops_pending_tokens(clock):
+    writer = StreamWriter("compact")
+    writer.token(AIMessageChunk(content="unsafe", id="msg_1"))
+    writer.discard()
+
+    assert writer.flush() == b""
+
+
+def test_sse_format_encodes_event_name(clock):
+    writer = StreamWriter("sse")
+    assert writer.media_type == "text/event-stream"
+    assert writer.headers["Cache-Control"] == "no-cache"
+
+    writer.token(AIMessageChunk(content="hi", id="msg_1"))
+    output = writer.flush().decode("utf-8")
+
+    assert output.startswith("event: delta\ndata: ")
+    assert output.endswith("\n\n")
+    assert json.loads(output.split("data: ", 1)[1]) == {"status": "delta", "id": "msg_1", "content": "hi"}
+
+
+async def test_iter_with_idle_ticks_yields_none_while_source_is_idle():
+    async def source():
+        yield 1
+        await asyncio.sleep(0.05)
+        yield 2
+
+    items = [item async for item in iter_with_idle_ticks(source(), interval=0.01)]
+
+    assert items[0] == 1
+    assert items[-1] == 2
+    assert None in items[1:-1]
+
+
+async def test_iter_with_idle_ticks_reraises_source_errors():
+    async def source():
+        yield 1
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError, match="boom"):
+        async for _ in iter_with_idle_ticks(source(), interval=1):
+            pass
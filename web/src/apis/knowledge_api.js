@@ -95,6 +95,16 @@ export const documentApi = {
     return apiAdminDelete(`/api/knowledge/databases/${dbId}/documents/${docId}`)
   },
 
+  /**
+   * 批量删除文档
+   * @param {string} dbId - 知识库ID
+   * @param {Array<string>} fileIds - 文档ID列表
+   * @returns {Promise} - 删除结果
+   */
+  batchDeleteDocuments: async (dbId, fileIds) => {
+    return apiAdminPost(`/api/knowledge/databases/${dbId}/documents/batch-delete`, { file_ids: fileIds })
+  },
+
   /**
    * 下载文档
    * @param {string} dbId - 知识库ID
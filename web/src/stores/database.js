@@ -140,26 +140,13 @@ export const useDatabaseStore = defineStore('database', () => {
       cancelText: '取消',
       onOk: async () => {
         state.batchDeleting = true;
-        let successCount = 0;
-        let failureCount = 0;
-        let progressMessage = message.loading(`正在删除文件 0/${validFileIds.length}`, 0);
+        const hide = message.loading(`正在删除 ${validFileIds.length} 个文件`, 0);
 
         try {
-          for (let i = 0; i < validFileIds.length; i++) {
-            const fileId = validFileIds[i];
-            try {
-              await deleteFile(fileId);
-              successCount++;
-            } catch (error) {
-              console.error(`删除文件 ${fileId} 失败:`, error);
-              failureCount++;
-            }
-            progressMessage?.();
-            if (i + 1 < validFileIds.length) {
-              progressMessage = message.loading(`正在删除文件 ${i + 1}/${validFileIds.length}`, 0);
-            }
-          }
-          progressMessage?.();
+          const result = await documentApi.batchDeleteDocuments(databaseId.value, validFileIds);
+          const successCount = result.deleted || 0;
+          const failureCount = Object.keys(result.failed || {}).length;
+          hide();
           if (successCount > 0 && failureCount === 0) {
             message.success(`成功删除 ${successCount} 个文件`);
           } else if (successCount > 0 && failureCount > 0) {
@@ -170,7 +157,7 @@ export const useDatabaseStore = defineStore('database', () => {
           selectedRowKeys.value = [];
           await getDatabaseInfo();
         } catch (error) {
-          progressMessage?.();
+          hide();
           console.error('批量删除出错:', error);
           message.error('批量删除过程中发生错误');
         } finally {